@@ -1,4 +1,4 @@
-import { CreateWorkflowRequest, CreateWorkflowResponse, WorkflowDetailResponse, NodeType, Node, AddNodeRequest, FormatterConfig, GenerativeAIConfig, ExtractTextConfig, AgentConfig, Workflow } from './types';
+import { CreateWorkflowRequest, CreateWorkflowResponse, WorkflowDetailResponse, NodeType, Node, AddNodeRequest, AddNodeResponse, AddNodesResponse, FormatterConfig, GenerativeAIConfig, ExtractTextConfig, AgentConfig, Workflow, RunWorkflowResponse, UploadPdfResponse, WorkflowEstimateResponse } from './types';
 
 const API_BASE_URL = 'http://localhost:8000';
 
@@ -24,7 +24,7 @@ export async function getWorkflow(workflowId: string): Promise<WorkflowDetailRes
     return response.json();
 }
 
-export async function addNode(workflowId: string, nodeType: NodeType, config: ExtractTextConfig | GenerativeAIConfig | FormatterConfig | AgentConfig): Promise<void> {
+export async function addNode(workflowId: string, nodeType: NodeType, config: ExtractTextConfig | GenerativeAIConfig | FormatterConfig | AgentConfig): Promise<Node> {
     const requestBody: AddNodeRequest = { node_type: nodeType, config };
     const response = await fetch(`${API_BASE_URL}/workflows/${workflowId}/nodes`, {
         method: 'POST',
@@ -34,9 +34,35 @@ export async function addNode(workflowId: string, nodeType: NodeType, config: Ex
 
     if (!response.ok)
         throw new Error('ノード追加失敗');
+
+    const data: AddNodeResponse = await response.json();
+    return data.node;
 }
 
-export async function uploadPdf(workflowId: string, file: File): Promise<{ text: string }> {
+export async function addNodes(workflowId: string, nodes: AddNodeRequest[]): Promise<Node[]> {
+    const response = await fetch(`${API_BASE_URL}/workflows/${workflowId}/nodes:batch`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ nodes }),
+    });
+
+    if (!response.ok)
+        throw new Error('ノード追加失敗');
+
+    const data: AddNodesResponse = await response.json();
+    return data.nodes;
+}
+
+export async function estimateWorkflow(workflowId: string): Promise<WorkflowEstimateResponse> {
+    const response = await fetch(`${API_BASE_URL}/workflows/${workflowId}/estimate`);
+
+    if (!response.ok)
+        throw new Error('見積もり取得失敗');
+
+    return response.json();
+}
+
+export async function uploadPdf(workflowId: string, file: File): Promise<UploadPdfResponse> {
     const formData = new FormData();
     formData.append('file', file);
 
@@ -51,7 +77,7 @@ export async function uploadPdf(workflowId: string, file: File): Promise<{ text:
     return response.json();
 }
 
-export async function runWorkflow(workflowId: string): Promise<string[]> {
+export async function runWorkflow(workflowId: string): Promise<RunWorkflowResponse> {
     const response = await fetch(`${API_BASE_URL}/workflows/${workflowId}/run`, {
         method: 'POST',
     });
@@ -77,12 +103,40 @@ export const updateNodes = async (workflowId: string, nodes: Node[]) => {
     return response.json();
 };
 
+export async function cancelRun(runId: string): Promise<{ run_id: string; status: string }> {
+    const response = await fetch(`${API_BASE_URL}/runs/${runId}/cancel`, {
+        method: 'POST',
+    });
+
+    if (!response.ok)
+        throw new Error('ワークフローのキャンセル失敗');
+
+    return response.json();
+}
+
+export async function resumeRun(runId: string): Promise<{ run_id: string; status: string }> {
+    const response = await fetch(`${API_BASE_URL}/runs/${runId}/resume`, {
+        method: 'POST',
+    });
+
+    if (!response.ok)
+        throw new Error('ワークフローの再開失敗');
+
+    return response.json();
+}
+
 export const runWorkflowWithSSE = (
     workflowId: string,
-    onNodeUpdate: (nodeId: string, status: 'success' | 'error' | 'running', result: string, execution_log?: any[]) => void
+    onNodeUpdate: (nodeId: string, status: 'success' | 'error' | 'running' | 'cancelled' | 'budget_exceeded', result: string, execution_log?: any[]) => void,
+    onRunStart?: (runId: string) => void
 ) => {
     const eventSource = new EventSource(`${API_BASE_URL}/workflows/${workflowId}/run/stream`);
 
+    eventSource.addEventListener('run_start', (event) => {
+        const data = JSON.parse(event.data);
+        onRunStart?.(data.runId);
+    });
+
     eventSource.addEventListener('node_start', (event) => {
         const data = JSON.parse(event.data);
         onNodeUpdate(data.nodeId, 'running', data.result, data.execution_log);
@@ -100,7 +154,9 @@ export const runWorkflowWithSSE = (
 
     eventSource.addEventListener('node_update', (event) => {
         const data = JSON.parse(event.data);
-        onNodeUpdate(data.nodeId, data.status, data.result, data.execution_log);
+        // 連続するフォーマッターはまとめて実行され、途中のノードの結果は返されない
+        const result = data.fusedInto ? '後続のフォーマッターとまとめて実行しました' : data.result;
+        onNodeUpdate(data.nodeId, data.status, result, data.execution_log);
     });
 
     eventSource.addEventListener('workflow_error', (event) => {
@@ -108,6 +164,14 @@ export const runWorkflowWithSSE = (
         onNodeUpdate('workflow', 'error', data.result, data.execution_log);
     });
 
+    eventSource.addEventListener('run_cancelled', () => {
+        eventSource.close();
+    });
+
+    eventSource.addEventListener('run_budget_exceeded', () => {
+        eventSource.close();
+    });
+
     eventSource.onerror = (error) => {
         console.error('SSE Error:', error);
         eventSource.close();
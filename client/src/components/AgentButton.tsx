@@ -17,7 +17,7 @@ import {
 } from '@mui/material';
 import AddIcon from '@mui/icons-material/Add';
 import DeleteIcon from '@mui/icons-material/Delete';
-import { EdgeConfig, AgentConfig, NodeConfig, NodeType, Workflow } from '../types';
+import { EdgeConfig, AgentConfig, NodeConfig, NodeType, Workflow, Node } from '../types';
 import { addNode } from '../api';
 import { useSnackbar } from '../contexts/SnackbarContext';
 
@@ -25,11 +25,11 @@ interface AgentButtonProps extends ButtonProps {
     currentWorkflow: Workflow;
     nodeTemplate: NodeConfig;
     edgeTemplate: EdgeConfig | null;
-    onRefetch: () => Promise<void>;
+    onNodeAdded: (node: Node) => void;
 }
 
 export default function AgentButton(props: AgentButtonProps) {
-    const { currentWorkflow, nodeTemplate, edgeTemplate, onRefetch, disabled } = props;
+    const { currentWorkflow, nodeTemplate, edgeTemplate, onNodeAdded, disabled } = props;
     const [open, setOpen] = useState(false);
     const { showSnackbar } = useSnackbar();
     const defaultFormData = {
@@ -57,8 +57,8 @@ export default function AgentButton(props: AgentButtonProps) {
     const handleSubmit = async (e: FormEvent) => {
         e.preventDefault();
         try {
-            await addNode(currentWorkflow.id, NodeType.AGENT, formData);
-            await onRefetch();
+            const node = await addNode(currentWorkflow.id, NodeType.AGENT, formData);
+            onNodeAdded(node);
             showSnackbar('エージェントノードを追加しました', 'success');
             handleClose();
         } catch (error: any) {
@@ -16,7 +16,7 @@ export interface ExecutionLogEntry {
 export interface ExecutionLog {
     nodeId: string;
     nodeType: string;
-    status: 'running' | 'success' | 'error' | 'pending';
+    status: 'running' | 'success' | 'error' | 'pending' | 'cancelled' | 'budget_exceeded';
     timestamp: string;
     result: string;
     execution_order?: number;
@@ -42,6 +42,9 @@ export const ExecutionLogPanel = (props: ExecutionLogPanelProps) => {
                 return 'error.main';
             case 'running':
                 return 'info.main';
+            case 'cancelled':
+            case 'budget_exceeded':
+                return 'warning.main';
         }
     };
 
@@ -53,6 +56,10 @@ export const ExecutionLogPanel = (props: ExecutionLogPanelProps) => {
                 return 'エラー';
             case 'running':
                 return '実行中';
+            case 'cancelled':
+                return 'キャンセル';
+            case 'budget_exceeded':
+                return '上限超過';
         }
     };
 
@@ -11,7 +11,7 @@ import {
     Skeleton,
     ButtonProps,
 } from '@mui/material';
-import { EdgeConfig, NodeConfig, NodeType, Workflow } from '../types';
+import { EdgeConfig, NodeConfig, NodeType, Workflow, Node } from '../types';
 import { addNode, uploadPdf } from '../api';
 import { useSnackbar } from '../contexts/SnackbarContext';
 
@@ -19,11 +19,11 @@ interface ExtractTextButtonProps extends ButtonProps {
     currentWorkflow: Workflow;
     nodeTemplate: NodeConfig;
     edgeTemplate: EdgeConfig | null;
-    onRefetch: () => Promise<void>;
+    onNodeAdded: (node: Node) => void;
 }
 
 export default function ExtractTextButton(props: ExtractTextButtonProps) {
-    const { currentWorkflow, nodeTemplate, edgeTemplate, onRefetch } = props
+    const { currentWorkflow, nodeTemplate, edgeTemplate, onNodeAdded } = props
     const [open, setOpen] = useState(false);
     const [file, setFile] = useState<File | null>(null);
     const [isUploading, setIsUploading] = useState(false);
@@ -63,18 +63,20 @@ export default function ExtractTextButton(props: ExtractTextButtonProps) {
 
         setIsUploading(true);
         try {
-            const { text } = await uploadPdf(currentWorkflow.id, file);
+            const { text_blob_id, text_preview, text_size } = await uploadPdf(currentWorkflow.id, file);
 
-            await addNode(currentWorkflow.id, NodeType.EXTRACT_TEXT, {
+            const node = await addNode(currentWorkflow.id, NodeType.EXTRACT_TEXT, {
                 file_name: file.name,
                 file_size: file.size,
                 file_type: file.type,
-                extracted_text: text,
+                text_blob_id,
+                text_preview,
+                text_size,
                 node: nodeTemplate,
                 edge: edgeTemplate,
             });
 
-            await onRefetch();
+            onNodeAdded(node);
             showSnackbar('テキスト抽出ノードを追加しました', 'success');
             handleClose();
         } catch (error: any) {
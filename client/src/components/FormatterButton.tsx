@@ -14,7 +14,7 @@ import {
     Checkbox,
     ButtonProps,
 } from '@mui/material';
-import { EdgeConfig, FormatterConfig, NodeConfig, NodeType, Workflow } from '../types';
+import { EdgeConfig, FormatterConfig, NodeConfig, NodeType, Workflow, Node } from '../types';
 import { addNode } from '../api';
 import { useSnackbar } from '../contexts/SnackbarContext';
 import { FORMAT_OPERATIONS } from '../lib';
@@ -23,11 +23,11 @@ interface FormatterButtonProps extends ButtonProps {
     currentWorkflow: Workflow;
     nodeTemplate: NodeConfig;
     edgeTemplate: EdgeConfig | null;
-    onRefetch: () => Promise<void>;
+    onNodeAdded: (node: Node) => void;
 }
 
 export default function FormatterButton(props: FormatterButtonProps) {
-    const { currentWorkflow, nodeTemplate, edgeTemplate, onRefetch, disabled } = props
+    const { currentWorkflow, nodeTemplate, edgeTemplate, onNodeAdded, disabled } = props
     const [open, setOpen] = useState(false);
     const { showSnackbar } = useSnackbar();
     const defaultFormData: FormatterConfig = {
@@ -46,8 +46,8 @@ export default function FormatterButton(props: FormatterButtonProps) {
     const handleSubmit = async (e: FormEvent) => {
         e.preventDefault();
         try {
-            await addNode(currentWorkflow.id, NodeType.FORMATTER, formData);
-            await onRefetch();
+            const node = await addNode(currentWorkflow.id, NodeType.FORMATTER, formData);
+            onNodeAdded(node);
             setFormData(defaultFormData);
             showSnackbar('フォーマッターノードを追加しました', 'success');
             handleClose();
@@ -13,7 +13,7 @@ import {
     Stack,
     ButtonProps,
 } from '@mui/material';
-import { EdgeConfig, GenerativeAIConfig, NodeConfig, NodeType, Workflow } from '../types';
+import { EdgeConfig, GenerativeAIConfig, NodeConfig, NodeType, Workflow, Node } from '../types';
 import { addNode } from '../api';
 import { useSnackbar } from '../contexts/SnackbarContext';
 
@@ -21,7 +21,7 @@ interface GenerativeAiButtonProps extends ButtonProps {
     currentWorkflow: Workflow;
     nodeTemplate: NodeConfig;
     edgeTemplate: EdgeConfig | null;
-    onRefetch: () => Promise<void>;
+    onNodeAdded: (node: Node) => void;
 }
 
 const AVAILABLE_MODELS = [
@@ -31,7 +31,7 @@ const AVAILABLE_MODELS = [
 ];
 
 export default function GenerativeAiButton(props: GenerativeAiButtonProps) {
-    const { currentWorkflow, nodeTemplate, edgeTemplate, onRefetch } = props
+    const { currentWorkflow, nodeTemplate, edgeTemplate, onNodeAdded } = props
     const [open, setOpen] = useState(false);
     const { showSnackbar } = useSnackbar();
     const defaultFormData = {
@@ -50,8 +50,8 @@ export default function GenerativeAiButton(props: GenerativeAiButtonProps) {
     const handleSubmit = async (e: FormEvent) => {
         e.preventDefault();
         try {
-            await addNode(currentWorkflow.id, NodeType.GENERATIVE_AI, formData);
-            await onRefetch();
+            const node = await addNode(currentWorkflow.id, NodeType.GENERATIVE_AI, formData);
+            onNodeAdded(node);
             setFormData(defaultFormData);
             showSnackbar('AIノードを追加しました', 'success');
             handleClose();
@@ -1,4 +1,4 @@
-import { useEffect, useMemo, useState } from 'react';
+import { useEffect, useMemo, useRef, useState } from 'react';
 import {
     Box,
     Typography,
@@ -12,8 +12,8 @@ import FormatterButton from './FormatterButton';
 import ExtractTextButton from './ExtractTextButton';
 import AgentButton from './AgentButton';
 import { WorkflowFlow } from './WorkflowFlow';
-import { NodeConfig, EdgeConfig, Workflow } from '../types';
-import { getWorkflow, runWorkflowWithSSE } from '../api';
+import { NodeConfig, EdgeConfig, Workflow, Node } from '../types';
+import { cancelRun, getWorkflow, runWorkflowWithSSE } from '../api';
 import { useSnackbar } from '../contexts/SnackbarContext';
 import { ExecutionLogPanel, ExecutionLog } from './ExecutionLogPanel';
 
@@ -21,6 +21,8 @@ export default function WorkflowList() {
     const [loading, setLoading] = useState<boolean>(false);
     const [currentWorkflow, setCurrentWorkflow] = useState<Workflow | null>(null);
     const [executionLogs, setExecutionLogs] = useState<ExecutionLog[]>([]);
+    const [runId, setRunId] = useState<string | null>(null);
+    const cleanupRef = useRef<(() => void) | null>(null);
     const { showSnackbar } = useSnackbar();
 
     const handleRefetch = async () => {
@@ -36,6 +38,11 @@ export default function WorkflowList() {
         }
     }
 
+    // 追加されたノードはレスポンスに含まれるため、ワークフローを取得し直さずに反映する
+    const handleNodeAdded = (node: Node) => {
+        setCurrentWorkflow(prev => prev && { ...prev, nodes: [...prev.nodes, node] });
+    }
+
     const handleRunWorkflow = async () => {
         setLoading(true);
         setExecutionLogs([]);  // ログをクリア
@@ -85,17 +92,19 @@ export default function WorkflowList() {
                     // すべてのノードが完了したかチェック
                     const allNodesCompleted = currentWorkflow.nodes.every(node => {
                         const nodeLog = sortedLogs.find(log => log.nodeId === node.id);
-                        return nodeLog && (nodeLog.status === 'success' || nodeLog.status === 'error');
+                        return nodeLog && (nodeLog.status === 'success' || nodeLog.status === 'error' || nodeLog.status === 'budget_exceeded');
                     });
 
-                    // すべてのノードが完了したらloadingをfalseに
-                    if (allNodesCompleted) {
+                    // すべてのノードが完了したか、キャンセルされたらloadingをfalseに
+                    if (allNodesCompleted || status === 'cancelled') {
                         setLoading(false);
+                        setRunId(null);
                     }
 
                     return sortedLogs;
                 });
-            });
+            }, setRunId);
+            cleanupRef.current = cleanup;
 
             // コンポーネントのアンマウント時にSSEをクリーンアップ
             return () => {
@@ -114,6 +123,23 @@ export default function WorkflowList() {
         }
     }
 
+    const handleCancelRun = async () => {
+        if (!runId) return;
+        try {
+            await cancelRun(runId);
+            showSnackbar('ワークフローの実行をキャンセルしました', 'success');
+        } catch (error: any) {
+            showSnackbar(error.message, 'error');
+        }
+    }
+
+    // 画面を離れる場合はSSEを切断し、サーバー側の実行もキャンセルさせる
+    useEffect(() => {
+        return () => {
+            cleanupRef.current?.();
+        };
+    }, []);
+
     const { nodeTemplate, edgeTemplate } = useMemo(() => {
         const nodeCount = (currentWorkflow?.nodes || []).length + 1;
 
@@ -187,7 +213,7 @@ export default function WorkflowList() {
                                 currentWorkflow={currentWorkflow}
                                 nodeTemplate={nodeTemplate}
                                 edgeTemplate={edgeTemplate}
-                                onRefetch={handleRefetch}
+                                onNodeAdded={handleNodeAdded}
                                 sx={{ width: 160 }}
                             />
                             <FormatterButton
@@ -196,7 +222,7 @@ export default function WorkflowList() {
                                 currentWorkflow={currentWorkflow}
                                 nodeTemplate={nodeTemplate}
                                 edgeTemplate={edgeTemplate}
-                                onRefetch={handleRefetch}
+                                onNodeAdded={handleNodeAdded}
                                 sx={{ width: 160 }}
                             />
                             <ExtractTextButton
@@ -205,7 +231,7 @@ export default function WorkflowList() {
                                 currentWorkflow={currentWorkflow}
                                 nodeTemplate={nodeTemplate}
                                 edgeTemplate={edgeTemplate}
-                                onRefetch={handleRefetch}
+                                onNodeAdded={handleNodeAdded}
                                 sx={{ width: 160 }}
                             />
                             <AgentButton
@@ -214,7 +240,7 @@ export default function WorkflowList() {
                                 currentWorkflow={currentWorkflow}
                                 nodeTemplate={nodeTemplate}
                                 edgeTemplate={edgeTemplate}
-                                onRefetch={handleRefetch}
+                                onNodeAdded={handleNodeAdded}
                                 sx={{ width: 160 }}
                             />
                         </Stack>
@@ -222,7 +248,7 @@ export default function WorkflowList() {
 
                     <ExecutionLogPanel logs={executionLogs} sx={{ p: 2, mb: 2 }} />
 
-                    <Stack alignItems="center">
+                    <Stack direction="row" justifyContent="center" spacing={2}>
                         <Button
                             disabled={
                                 currentWorkflow.nodes.length === 0 || 
@@ -236,6 +262,16 @@ export default function WorkflowList() {
                         >
                             実行
                         </Button>
+                        {runId && (
+                            <Button
+                                variant="outlined"
+                                color="warning"
+                                onClick={handleCancelRun}
+                                sx={{ mt: 2, width: 120 }}
+                            >
+                                キャンセル
+                            </Button>
+                        )}
                     </Stack>
                 </>
 
@@ -24,7 +24,8 @@ export const getNodeDescription = (node: Node): string => {
     switch (node.node_type) {
         case NodeType.EXTRACT_TEXT:
             const extractConfig = node.config as ExtractTextConfig;
-            return extractConfig.extracted_text ? truncateText(extractConfig.extracted_text) : '';
+            const extractedText = extractConfig.text_preview ?? extractConfig.extracted_text;
+            return extractedText ? truncateText(extractedText) : '';
         case NodeType.GENERATIVE_AI:
             const genConfig = node.config as GenerativeAIConfig;
             return genConfig.prompt ? truncateText(genConfig.prompt) : '';
@@ -31,7 +31,10 @@ export interface ExtractTextConfig extends WorkflowConfig {
     file_name: string;
     file_size: number;
     file_type: string;
-    extracted_text: string;
+    extracted_text?: string; // 短いテキストのみ。長いテキストはサーバーに別に保存される
+    text_blob_id?: string; // 保存されたテキストのID（GET /documents/{id}/text で全体を取得）
+    text_preview?: string; // テキストの先頭
+    text_size?: number; // テキストのバイト数
 }
 
 export interface GenerativeAIConfig extends WorkflowConfig {
@@ -87,8 +90,69 @@ export interface AddNodeRequest {
     config: ExtractTextConfig | GenerativeAIConfig | FormatterConfig | AgentConfig;
 }
 
+export interface AddNodeResponse {
+    message: string;
+    node_id: string;
+    node: Node;
+}
+
+export interface AddNodesResponse {
+    nodes: Node[]; // リクエストと同じ順
+}
+
+export interface EstimateRange {
+    expected: number; // 想定される値
+    max: number; // エージェントが上限まで改善を繰り返した場合の値
+}
+
+export interface NodeEstimate {
+    node_id: string;
+    node_type: NodeType;
+    model: string | null;
+    llm_calls: EstimateRange;
+    input_tokens: EstimateRange;
+    output_tokens: EstimateRange;
+    wall_seconds: EstimateRange;
+    error: string | null;
+}
+
+export interface WorkflowEstimateResponse {
+    workflow_id: string;
+    llm_calls: EstimateRange;
+    input_tokens: EstimateRange;
+    output_tokens: EstimateRange;
+    wall_seconds: EstimateRange;
+    history_calls: number;
+    nodes: NodeEstimate[];
+}
+
 export interface WorkflowDetailResponse {
     id: string;
     name: string;
     nodes: Node[];
 }
+
+export interface NodeRunResult {
+    node_id: string;
+    node_type: NodeType;
+    status: 'success' | 'error' | 'cancelled' | 'budget_exceeded';
+    result: string;
+    elapsed_ms: number;
+    fused_into?: string | null;
+}
+
+export interface RunWorkflowResponse {
+    run_id: string;
+    status: 'success' | 'error' | 'cancelled' | 'budget_exceeded';
+    elapsed_ms: number;
+    results: NodeRunResult[];
+}
+
+export interface UploadPdfResponse {
+    text_blob_id: string;
+    text_preview: string;
+    text_size: number;
+    pages: number;
+    ocr_pages: number[]; // OCRしたページの番号（テキストレイヤーのあるページはOCRしない）
+    sha256: string; // アップロードしたファイルのSHA-256
+}
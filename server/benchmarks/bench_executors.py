@@ -0,0 +1,78 @@
+"""
+実行バックエンドごとのイベントループの応答性とスループットの計測
+
+連続するフォーマッター（--size-mb の日本語テキスト）を --concurrency 件同時に --runs 回実行しながら、
+イベントループ上で --tick-ms ごとに起きるタスクの遅延（SSEの配信やI/Oが待たされる時間に相当）を計測します。
+バックエンドは inline（変更前と同じくイベントループ上で変換）、thread、process を比較します。
+
+    cd server
+    python -m benchmarks.bench_executors --size-mb 2 --runs 16 --concurrency 4
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks.bench_formatter import SAMPLE_LINE
+from benchmarks.harness import percentile
+from services.executors import BACKENDS, Executors
+from services.formatter_service import FormatterService
+
+
+async def measure(backend: str, text: str, configs, runs: int, concurrency: int, tick_ms: float):
+    executors = Executors({"formatter_chain": backend})
+    service = FormatterService(executors)
+    lags = []
+    done = asyncio.Event()
+
+    async def ticker():
+        interval = tick_ms / 1000
+        while not done.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(interval)
+            lags.append((time.perf_counter() - started - interval) * 1000)
+
+    # プロセスの起動時間を計測に含めない
+    await service.format_chain(text[:executors.inline_max_size + 1], configs)
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            await service.format_chain(text, configs)
+
+    tick_task = asyncio.create_task(ticker())
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(runs)))
+    elapsed = time.perf_counter() - started
+    done.set()
+    await tick_task
+    executors.shutdown()
+    return elapsed, lags
+
+
+async def main_async(args):
+    configs = [{"operation": operation} for operation in args.chain]
+    text = SAMPLE_LINE * max(1, int(args.size_mb * 1024 * 1024 / len(SAMPLE_LINE.encode())))
+    print(f"size={args.size_mb}MB, runs={args.runs}, concurrency={args.concurrency}, chain={' -> '.join(args.chain)}")
+    print(f"{'backend':>8} {'elapsed(s)':>11} {'MB/s':>8} {'lag p50(ms)':>12} {'lag p99(ms)':>12} {'lag max(ms)':>12}")
+    for backend in args.backends:
+        elapsed, lags = await measure(backend, text, configs, args.runs, args.concurrency, args.tick_ms)
+        print(f"{backend:>8} {elapsed:>11.2f} {args.size_mb * args.runs / elapsed:>8.1f} "
+              f"{percentile(lags, 50):>12.1f} {percentile(lags, 99):>12.1f} {max(lags, default=0):>12.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=float, default=2)
+    parser.add_argument("--runs", type=int, default=16)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--tick-ms", type=float, default=5)
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--chain", nargs="+", default=["to_half_width", "to_lower", "to_full_width"],
+                        choices=["to_upper", "to_lower", "to_full_width", "to_half_width"])
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
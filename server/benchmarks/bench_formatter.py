@@ -0,0 +1,69 @@
+"""
+連続するフォーマッターの実行時間の計測
+
+OCR結果に相当する数MBの日本語テキストに対して、フォーマッターを1ノードずつ実行した場合と、
+まとめて（チャンクごとに1回の走査で）実行した場合の所要時間とメモリの最大使用量を比較します。
+
+    cd server
+    python -m benchmarks.bench_formatter --sizes-mb 1 4 16 --chain to_half_width to_lower to_full_width
+"""
+import argparse
+import asyncio
+import time
+import tracemalloc
+from typing import List
+
+from services.formatter_service import FORMATTER_CHUNK_CHARS, FormatterService
+
+SAMPLE_LINE = "ｶﾀｶﾅとＡＢＣ、１２３のＯＣＲ結果です。The Quick Brown Fox ﾊﾟﾋﾞｭｰﾝ\n"
+
+
+async def per_node(service: FormatterService, text: str, configs: List[dict]) -> str:
+    """変更前の実行方法（ノードごとにテキスト全体を変換し、各ノードの結果を保持する）"""
+    results = []
+    for config in configs:
+        text = await service.format_text(text, config)
+        results.append(text)
+    return results[-1]
+
+
+async def fused(service: FormatterService, text: str, configs: List[dict]) -> str:
+    final_text, _ = await service.format_chain(text, configs)
+    return final_text
+
+
+async def measure(fn, service, text, configs):
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = await fn(service, text, configs)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+async def main_async(args):
+    service = FormatterService()
+    configs = [{"operation": operation} for operation in args.chain]
+    print(f"chain={' -> '.join(args.chain)}, chunk_chars={FORMATTER_CHUNK_CHARS}")
+    print(f"{'size(MB)':>8} {'per_node(ms)':>13} {'fused(ms)':>10} {'per_node peak(MB)':>18} {'fused peak(MB)':>15}")
+    for size_mb in args.sizes_mb:
+        text = SAMPLE_LINE * max(1, int(size_mb * 1024 * 1024 / len(SAMPLE_LINE.encode())))
+        expected, per_node_s, per_node_peak = await measure(per_node, service, text, configs)
+        result, fused_s, fused_peak = await measure(fused, service, text, configs)
+        assert result == expected, "fused result differs from per-node result"
+        print(f"{size_mb:>8} {per_node_s * 1000:>13.1f} {fused_s * 1000:>10.1f} "
+              f"{per_node_peak / 1024 ** 2:>18.1f} {fused_peak / 1024 ** 2:>15.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes-mb", type=float, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--chain", nargs="+", default=["to_half_width", "to_lower", "to_full_width"],
+                        choices=["to_upper", "to_lower", "to_full_width", "to_half_width"])
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
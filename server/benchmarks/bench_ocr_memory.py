@@ -0,0 +1,103 @@
+"""
+PDFのラスタライズ・OCRのメモリ使用量の計測
+
+画像のみのPDF（スキャンしたPDF相当）をページ数を変えて生成し、
+全ページを一度にラスタライズする方法（変更前）と、DocumentService のウィンドウごとのラスタライズで、
+プロセスの最大RSSを比較します。ウィンドウごとのラスタライズではページ数が増えても一定になります。
+計測は1回ごとに別プロセスで行います。popplerが必要です（--rasterize-only でない場合はtesseractも必要）。
+
+    cd server
+    python -m benchmarks.bench_ocr_memory --pages 5 20 80
+    python -m benchmarks.bench_ocr_memory --pages 50 200 --rasterize-only --no-to-disk --max-memory-mb 64
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+from benchmarks.harness import create_sample_pdf
+
+
+def _run(mode: str, pdf_path: str, pages: int, args: dict, queue) -> None:
+    os.environ.setdefault("DATABASE_URL", "sqlite://")
+    from pdf2image import convert_from_path
+    import services.document_service as document_service
+
+    if args["rasterize_only"]:
+        # OCRの代わりに画像を読み込むだけにして、ラスタライズのメモリのみを計測する
+        def fake_ocr(image, lang=None):
+            if isinstance(image, str):
+                from PIL import Image
+                with Image.open(image) as loaded:
+                    loaded.load()
+            return ""
+        document_service.pytesseract.image_to_string = fake_ocr
+
+    started = time.perf_counter()
+    if mode == "all_pages":
+        images = convert_from_path(pdf_path)
+        for image in images:
+            document_service.pytesseract.image_to_string(image, lang=document_service.OCR_LANG)
+    else:
+        service = document_service.DocumentService(
+            to_disk=args["to_disk"], max_memory_mb=args["max_memory_mb"], window_pages=args["window_pages"]
+        )
+        service.ocr_pages(pdf_path, list(range(1, pages + 1)))
+    elapsed = time.perf_counter() - started
+
+    # ru_maxrss はLinuxではKB、macOSではバイト
+    scale = 1 if sys.platform == "darwin" else 1024
+    queue.put({
+        "elapsed_s": elapsed,
+        "self_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 1024 ** 2,
+        "children_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale / 1024 ** 2,
+    })
+
+
+def measure(mode: str, pdf_path: str, pages: int, args: dict) -> dict:
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=_run, args=(mode, pdf_path, pages, args, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[5, 20, 80])
+    parser.add_argument("--modes", nargs="+", choices=["all_pages", "windowed"], default=["all_pages", "windowed"])
+    parser.add_argument("--rasterize-only", action="store_true", help="OCRを行わずラスタライズのみを計測（tesseract不要）")
+    parser.add_argument("--no-to-disk", dest="to_disk", action="store_false", help="画像をメモリ上でラスタライズ")
+    parser.add_argument("--max-memory-mb", type=int, default=256)
+    parser.add_argument("--window-pages", type=int, default=8)
+    args = parser.parse_args()
+
+    required = ["pdftoppm", "pdfinfo"] + ([] if args.rasterize_only else ["tesseract"])
+    missing = [command for command in required if not shutil.which(command)]
+    if missing:
+        print(f"スキップしました（{', '.join(missing)} が必要です）")
+        return
+
+    options = {"rasterize_only": args.rasterize_only, "to_disk": args.to_disk,
+               "max_memory_mb": args.max_memory_mb, "window_pages": args.window_pages}
+    workdir = tempfile.mkdtemp(prefix="llm_app_bench_ocr_")
+    try:
+        print(f"{'pages':>6} {'mode':>10} {'elapsed(s)':>11} {'peak RSS(MB)':>13} {'children peak(MB)':>18}")
+        for pages in args.pages:
+            pdf_path = create_sample_pdf(os.path.join(workdir, f"sample_{pages}.pdf"), pages)
+            for mode in args.modes:
+                result = measure(mode, pdf_path, pages, options)
+                print(f"{pages:>6} {mode:>10} {result['elapsed_s']:>11.2f} {result['self_mb']:>13.1f} "
+                      f"{result['children_mb']:>18.1f}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
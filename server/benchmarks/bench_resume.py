@@ -0,0 +1,152 @@
+"""
+実行の中断と再開の検証（チェックポイント）
+
+スタブのLLM（benchmarks/fake_openai.py）とアプリケーションをバックグラウンドで起動し、
+テキスト抽出 → 生成AI → エージェント → 生成AI のワークフローをワーカープロセス（worker.py）で実行します。
+
+    1. 中断せずに実行し、LLMの呼び出し回数を数える（基準）
+    2. 同じワークフローを実行し、--kill-after 回のLLM呼び出しの後にワーカーを SIGKILL で停止する
+    3. リースが切れるのを待って POST /runs/{run_id}/resume で再開し、新しいワーカーで最後まで実行する
+
+中断前と再開後の呼び出し回数の合計が基準を超えた回数（繰り返した呼び出し）と、
+チェックポイントから復元したノードの数を出力します。実行が成功しない場合や、
+繰り返した呼び出しが停止時に応答を待っていた1回を超える場合は終了コード1で終了します。
+DATABASE_URL が未設定の場合は一時ディレクトリのSQLiteを使用します。
+
+    cd server
+    python -m benchmarks.bench_resume --latency-ms 200 --kill-after 5
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.fake_openai import FakeOpenAI, FakeOpenAIConfig
+from benchmarks.harness import ThreadedServer
+from benchmarks.run_benchmarks import _agent_node, _extract_text_node, _generative_ai_node
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LEASE_SECONDS = 2
+
+
+def _start_worker(env: dict) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "worker.py", "--concurrency", "1"],
+        cwd=SERVER_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+
+def _wait_finished(client: httpx.Client, run_id: str, timeout: float) -> str:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = client.get(f"/runs/{run_id}").json()["status"]
+        if status in ("success", "error", "cancelled"):
+            return status
+        time.sleep(0.1)
+    raise TimeoutError(f"実行が終了しませんでした: run_id={run_id}")
+
+
+def _node_updates(client: httpx.Client, run_id: str) -> list:
+    updates = []
+    with client.stream("GET", f"/runs/{run_id}/events") as response:
+        event = None
+        for line in response.iter_lines():
+            if line.startswith("event:"):
+                event = line.split(":", 1)[1].strip()
+            elif line.startswith("data:") and event == "node_update":
+                updates.append(json.loads(line.split(":", 1)[1]))
+    return updates
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--kill-after", type=int, default=5, help="ワーカーを停止するまでのLLMの呼び出し回数")
+    parser.add_argument("--timeout", type=float, default=120)
+    args = parser.parse_args()
+
+    fake = FakeOpenAI(FakeOpenAIConfig(latency_ms=args.latency_ms, latency_dist="fixed"))
+    fake_server = ThreadedServer(fake.app).start()
+
+    workdir = tempfile.mkdtemp(prefix="llm_app_bench_resume_")
+    os.environ["OPENAI_BASE_URL"] = f"{fake_server.url}/v1"
+    os.environ.setdefault("OPENAI_SECRET", "fake")
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(workdir, 'bench.db')}")
+    worker_env = {**os.environ, "WORKER_LEASE_SECONDS": str(LEASE_SECONDS),
+                  "WORKER_HEARTBEAT_SECONDS": "0.5", "WORKER_POLL_SECONDS": "0.1"}
+    sys.path.insert(0, SERVER_DIR)
+    import main as app_main
+    logging.getLogger().setLevel(logging.WARNING)
+
+    app_server = ThreadedServer(app_main.app).start()
+    workers = []
+    try:
+        with httpx.Client(base_url=app_server.url, timeout=args.timeout) as client:
+            workflow_id = client.post("/workflows", json={"name": "bench_resume"}).json()["id"]
+            nodes = [_extract_text_node(), _generative_ai_node(2, 1), _agent_node(3, 2), _generative_ai_node(4, 3)]
+            client.post(f"/workflows/{workflow_id}/nodes:batch", json={"nodes": nodes}).raise_for_status()
+
+            # 1. 中断しない実行
+            workers.append(_start_worker(worker_env))
+            started = time.perf_counter()
+            run_id = client.post(f"/workflows/{workflow_id}/runs").json()["run_id"]
+            baseline_status = _wait_finished(client, run_id, args.timeout)
+            baseline_elapsed = time.perf_counter() - started
+            baseline_calls = fake.stats["calls"]
+            workers.pop().send_signal(signal.SIGKILL)
+
+            # 2. LLMの呼び出しの途中でワーカーを停止する
+            fake.stats.clear()
+            workers.append(_start_worker(worker_env))
+            run_id = client.post(f"/workflows/{workflow_id}/runs").json()["run_id"]
+            while fake.stats["calls"] < args.kill_after:
+                time.sleep(0.01)
+            workers.pop().send_signal(signal.SIGKILL)
+            killed_at = time.perf_counter()
+            calls_before_kill = fake.stats["calls"]
+
+            # 3. リースが切れた後に再開する（切れるまでは 409）
+            while True:
+                response = client.post(f"/runs/{run_id}/resume")
+                if response.status_code != 409:
+                    response.raise_for_status()
+                    break
+                time.sleep(0.2)
+            fake.stats.clear()
+            workers.append(_start_worker(worker_env))
+            resumed_at = time.perf_counter()
+            status = _wait_finished(client, run_id, args.timeout)
+            resume_elapsed = time.perf_counter() - resumed_at
+            calls_after_resume = fake.stats["calls"]
+            restored = sum(1 for update in _node_updates(client, run_id) if update.get("restored"))
+
+        repeated = calls_before_kill + calls_after_resume - baseline_calls
+        print(f"stub: latency={args.latency_ms}ms (fixed), database={os.environ['DATABASE_URL']}")
+        print(f"{'':>22} {'status':>8} {'llm calls':>10} {'elapsed(s)':>11}")
+        print(f"{'uninterrupted':>22} {baseline_status:>8} {baseline_calls:>10} {baseline_elapsed:>11.2f}")
+        print(f"{'before kill':>22} {'killed':>8} {calls_before_kill:>10} {'':>11}")
+        print(f"{'after resume':>22} {status:>8} {calls_after_resume:>10} {resume_elapsed:>11.2f}")
+        print(f"repeated llm calls={repeated}, restored nodes={restored}, "
+              f"waited for lease expiry={resumed_at - killed_at:.2f}s")
+        if status != "success" or baseline_status != "success" or repeated > 1:
+            print("NG: 再開した実行が成功しなかったか、完了済みのLLMの呼び出しを繰り返しました")
+            sys.exit(1)
+        print("OK")
+    finally:
+        for worker in workers:
+            worker.send_signal(signal.SIGKILL)
+        app_server.stop()
+        fake_server.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
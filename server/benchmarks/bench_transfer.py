@@ -0,0 +1,114 @@
+"""
+ワークフローのインポート・エクスポート（NDJSON）のスループットの計測
+
+ワークフロー（1件あたり --nodes 個のノード）のNDJSONファイルを生成し、アプリケーションをバックグラウンドで起動して、
+POST /workflows/import（ファイルをストリーミングで送信）と GET /workflows/export（ストリーミングで受信して破棄）の
+スループットを行/秒（ワークフロー + ノード）で計測します。
+比較として、変更前の方法（POST /workflows と POST /workflows/{id}/nodes を1件ずつ）も --legacy-workflows 件で計測します。
+DATABASE_URL が未設定の場合は一時ディレクトリのSQLiteを使用します。
+
+    cd server
+    python -m benchmarks.bench_transfer --workflows 20000 --nodes 5 --legacy-workflows 200
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+
+import httpx
+
+from benchmarks.harness import ThreadedServer
+
+
+def _node_config(index: int) -> dict:
+    return {
+        "node": {"id": str(index), "type": "custom", "position": {"x": 0, "y": 150 * index}},
+        "edge": {"id": f"e-{index}", "type": "smoothstep", "source": str(index - 1), "target": str(index),
+                 "animated": True} if index > 1 else None,
+        "operation": "to_upper",
+    }
+
+
+def write_ndjson(path: str, workflows: int, nodes: int) -> int:
+    """NDJSONファイルを生成し、行数（ワークフロー + ノード）を返します。"""
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"type": "export", "version": 1}) + "\n")
+        for i in range(workflows):
+            wf_id = str(uuid.uuid4())
+            f.write(json.dumps({"type": "workflow", "id": wf_id, "name": f"workflow {i}"}) + "\n")
+            for n in range(1, nodes + 1):
+                f.write(json.dumps({
+                    "type": "node", "id": str(uuid.uuid4()), "workflow_id": wf_id, "node_type": "formatter",
+                    "config": _node_config(n), "x": 0, "y": 150 * n,
+                }, ensure_ascii=False) + "\n")
+    return workflows * (nodes + 1)
+
+
+def _file_chunks(path: str, chunk_size: int = 1024 * 1024):
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            yield chunk
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workflows", type=int, default=20000)
+    parser.add_argument("--nodes", type=int, default=5, help="ワークフローあたりのノード数")
+    parser.add_argument("--legacy-workflows", type=int, default=200, help="1件ずつ作成する場合の計測件数（0で省略）")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="llm_app_bench_transfer_")
+    os.environ.setdefault("OPENAI_SECRET", "fake")
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(workdir, 'bench.db')}")
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import main as app_main
+
+    server = ThreadedServer(app_main.app).start()
+    try:
+        path = os.path.join(workdir, "workflows.ndjson")
+        rows = write_ndjson(path, args.workflows, args.nodes)
+        size_mb = os.path.getsize(path) / 1024 ** 2
+        print(f"database={os.environ['DATABASE_URL']}, rows={rows} "
+              f"({args.workflows} workflows x (1 + {args.nodes} nodes)), file={size_mb:.1f}MB")
+        print(f"{'operation':>10} {'rows':>9} {'elapsed(s)':>11} {'rows/s':>10}")
+
+        with httpx.Client(base_url=server.url, timeout=3600) as client:
+            started = time.perf_counter()
+            response = client.post("/workflows/import", content=_file_chunks(path),
+                                   headers={"Content-Type": "application/x-ndjson"})
+            response.raise_for_status()
+            elapsed = time.perf_counter() - started
+            imported = response.json()["workflows"] + response.json()["nodes"]
+            print(f"{'import':>10} {imported:>9} {elapsed:>11.2f} {imported / elapsed:>10.0f}")
+
+            started = time.perf_counter()
+            exported = 0
+            with client.stream("GET", "/workflows/export") as response:
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    if line.startswith('{"type":"workflow"') or line.startswith('{"type":"node"'):
+                        exported += 1
+            elapsed = time.perf_counter() - started
+            print(f"{'export':>10} {exported:>9} {elapsed:>11.2f} {exported / elapsed:>10.0f}")
+
+            if args.legacy_workflows:
+                started = time.perf_counter()
+                for i in range(args.legacy_workflows):
+                    wf_id = client.post("/workflows", json={"name": f"legacy {i}"}).json()["id"]
+                    for n in range(1, args.nodes + 1):
+                        client.post(f"/workflows/{wf_id}/nodes",
+                                    json={"node_type": "formatter", "config": _node_config(n)}).raise_for_status()
+                elapsed = time.perf_counter() - started
+                legacy_rows = args.legacy_workflows * (args.nodes + 1)
+                print(f"{'legacy':>10} {legacy_rows:>9} {elapsed:>11.2f} {legacy_rows / elapsed:>10.0f}")
+    finally:
+        server.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
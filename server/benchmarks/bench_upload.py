@@ -0,0 +1,114 @@
+"""
+同時アップロード時のファイル保存のスループットとレイテンシーの計測
+
+テキスト抽出を除いたアップロードの保存処理だけを、変更前の方法（サイズ確認のために全体を読み込み、
+先頭に戻して shutil.copyfileobj で uploads/<ファイル名> に同期的にコピー）と、
+UploadStorage（リクエストボディを受信しながら解析し、一意な一時ファイルに非同期書き込み、SHA-256も計算）で比較します。
+すべてのリクエストが同じファイル名・異なる内容でアップロードし、保存された内容が
+送信した内容と異なった件数（上書きによる破損）も数えます。
+
+    cd server
+    python -m benchmarks.bench_upload --size-mb 8 --runs 64 --concurrency 1 8 32
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import shutil
+import tempfile
+
+import httpx
+from fastapi import FastAPI, File, Request, UploadFile
+
+from benchmarks.harness import ThreadedServer, percentile, run_concurrently
+from services.upload_storage import UploadStorage
+
+
+def create_app(directory: str) -> FastAPI:
+    app = FastAPI()
+    storage = UploadStorage(directory, max_bytes=1024 ** 3)
+
+    @app.post("/legacy")
+    async def legacy(file: UploadFile = File(...)):
+        """変更前の保存方法"""
+        file_size = 0
+        while chunk := await file.read(1024 * 1024):
+            file_size += len(chunk)
+        await file.seek(0)
+        file_path = os.path.join(directory, file.filename)
+        with open(file_path, "wb") as buffer:
+            shutil.copyfileobj(file.file, buffer)
+        # 他のリクエストの処理を挟んでから保存した内容を確認する（変更前はこの間に抽出処理が走る）
+        await asyncio.sleep(0)
+        try:
+            with open(file_path, "rb") as f:
+                sha256 = hashlib.sha256(f.read()).hexdigest()
+            os.remove(file_path)
+        except FileNotFoundError:
+            # 同じファイル名の別のリクエストが削除した
+            sha256 = "missing"
+        return {"sha256": sha256}
+
+    @app.post("/streaming")
+    async def streaming(request: Request):
+        async with storage.receive(request, "file", suffix=".pdf") as stored:
+            await asyncio.sleep(0)
+            with open(stored.path, "rb") as f:
+                sha256 = hashlib.sha256(f.read()).hexdigest()
+        return {"sha256": sha256 if sha256 == stored.sha256 else "hash mismatch"}
+
+    return app
+
+
+async def run_mode(url: str, endpoint: str, payloads, runs: int, concurrency: int):
+    corrupted = 0
+    async with httpx.AsyncClient(base_url=url, timeout=600) as client:
+        async def upload(i: int):
+            nonlocal corrupted
+            data, expected = payloads[i % len(payloads)]
+            response = await client.post(endpoint, files={"file": ("sample.pdf", data, "application/pdf")})
+            response.raise_for_status()
+            if response.json()["sha256"] != expected:
+                corrupted += 1
+
+        elapsed, latencies, errors, _ = await run_concurrently(runs, concurrency, upload)
+    return elapsed, latencies, errors, corrupted
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=float, default=8)
+    parser.add_argument("--runs", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--modes", nargs="+", choices=["legacy", "streaming"], default=["legacy", "streaming"])
+    args = parser.parse_args()
+
+    size = int(args.size_mb * 1024 * 1024)
+    payloads = []
+    for i in range(8):
+        data = bytes([i]) * size
+        payloads.append((data, hashlib.sha256(data).hexdigest()))
+
+    workdir = tempfile.mkdtemp(prefix="llm_app_bench_upload_")
+    server = ThreadedServer(create_app(workdir)).start()
+    try:
+        print(f"size={args.size_mb}MB, runs={args.runs}")
+        print(f"{'mode':>10} {'conc':>5} {'MB/s':>8} {'p50(ms)':>9} {'p99(ms)':>9} {'errors':>7} {'corrupted':>10}")
+        for concurrency in args.concurrency:
+            for mode in args.modes:
+                elapsed, latencies, errors, corrupted = asyncio.run(
+                    run_mode(server.url, f"/{mode}", payloads, args.runs, concurrency)
+                )
+                throughput = (args.runs - errors) * size / 1024 ** 2 / elapsed
+                print(f"{mode:>10} {concurrency:>5} {throughput:>8.1f} {percentile(latencies, 50):>9.1f} "
+                      f"{percentile(latencies, 99):>9.1f} {errors:>7} {corrupted:>10}")
+        leftovers = os.listdir(workdir)
+        if leftovers:
+            print(f"削除されなかった一時ファイル: {len(leftovers)}")
+    finally:
+        server.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
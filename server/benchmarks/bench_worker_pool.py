@@ -0,0 +1,147 @@
+"""
+ワーカープールのスループット計測
+
+スタブのLLM（一定のレイテンシで応答する）を使い、ワーカープロセス数を
+1からNまで増やしたときの実行スループットを計測します。
+DATABASE_URL のDBを使用するため、PostgreSQLで実行してください
+（SQLiteは行ロックを持たないため参考値になります）。
+
+    cd server
+    python -m benchmarks.bench_worker_pool --workers 1 2 4 8 --runs-per-worker 20
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import time
+from types import SimpleNamespace
+
+from database import SessionLocal, engine, Base
+from models import RunDB, RunEventDB, RunStatus
+from repositories.node_repository import NodeRepository
+from repositories.run_repository import RunRepository, TERMINAL_STATUSES
+from repositories.workflow_repository import WorkflowRepository
+
+
+class StubCompletions:
+    """一定のレイテンシで固定の応答を返すLLMのスタブ"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    async def create(self, **kwargs):
+        await asyncio.sleep(self.latency)
+        content = json.dumps({"status": "success", "output": "stub"}) if kwargs.get("response_format") else "stub"
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+def _stub_workflow_service(latency: float):
+    from services.workflow_service import WorkflowService
+
+    service = WorkflowService()
+    service.ai_service.client.chat.completions = StubCompletions(latency)
+    return service
+
+
+def _worker_process(latency: float, concurrency: int):
+    from services.run_worker import RunWorker
+
+    # ワーカー数によるスループットを計測するため、同時実行数の上限（RUN_MAX_PER_WORKFLOW など）は適用しない
+    worker = RunWorker(
+        _stub_workflow_service(latency), poll_seconds=0.02, heartbeat_seconds=5,
+        max_concurrent=10 ** 6, max_per_workflow=10 ** 6
+    )
+    asyncio.run(worker.run_forever(concurrency=concurrency))
+
+
+def _create_workflow(llm_nodes: int) -> str:
+    db = SessionLocal()
+    try:
+        workflow = WorkflowRepository(db).create_workflow("bench_worker_pool")
+        node_repo = NodeRepository(db)
+        for i in range(llm_nodes):
+            node_repo.add_node(workflow.id, "generative_ai", {
+                "node": {"id": str(i + 1), "type": "custom", "position": {"x": 0, "y": 0}},
+                "edge": {"id": f"e-{i + 1}", "source": str(i), "target": str(i + 1)} if i > 0 else None,
+                "prompt": "bench",
+                "model": "stub",
+                "temperature": 0,
+                "max_tokens": 16
+            })
+        return workflow.id
+    finally:
+        db.close()
+
+
+def _measure(workflow_id: str, workers: int, runs: int, latency: float, concurrency: int, warmup: float) -> float:
+    ctx = multiprocessing.get_context("spawn")
+    processes = [ctx.Process(target=_worker_process, args=(latency, concurrency), daemon=True) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    # プロセスの起動時間を計測に含めない
+    time.sleep(warmup)
+
+    try:
+        start = time.perf_counter()
+        db = SessionLocal()
+        try:
+            run_repo = RunRepository(db)
+            run_ids = [run_repo.enqueue_run(workflow_id).id for _ in range(runs)]
+        finally:
+            db.close()
+
+        while True:
+            db = SessionLocal()
+            try:
+                done = db.query(RunDB).filter(RunDB.id.in_(run_ids), RunDB.status.in_(TERMINAL_STATUSES)).count()
+            finally:
+                db.close()
+            if done == runs:
+                break
+            time.sleep(0.05)
+        elapsed = time.perf_counter() - start
+    finally:
+        for process in processes:
+            process.terminate()
+            process.join()
+
+    db = SessionLocal()
+    try:
+        failed = db.query(RunDB).filter(RunDB.id.in_(run_ids), RunDB.status != RunStatus.SUCCESS.value).count()
+        if failed:
+            print(f"  警告: {failed}件の実行が失敗しました")
+        db.query(RunEventDB).filter(RunEventDB.run_id.in_(run_ids)).delete(synchronize_session=False)
+        db.query(RunDB).filter(RunDB.id.in_(run_ids)).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--runs-per-worker", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=1, help="ワーカー1プロセスあたりの同時実行数")
+    parser.add_argument("--llm-nodes", type=int, default=2, help="ワークフローあたりの生成AIノード数")
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--warmup", type=float, default=3.0, help="ワーカープロセスの起動待ち時間（秒）")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    workflow_id = _create_workflow(args.llm_nodes)
+    latency = args.latency_ms / 1000
+
+    print(f"{'workers':>8} {'runs':>6} {'elapsed(s)':>11} {'runs/s':>8} {'speedup':>8} {'efficiency':>11}")
+    baseline = None
+    for workers in args.workers:
+        runs = workers * args.runs_per_worker
+        elapsed = _measure(workflow_id, workers, runs, latency, args.concurrency, args.warmup)
+        throughput = runs / elapsed
+        baseline = baseline or throughput / workers
+        speedup = throughput / baseline
+        print(f"{workers:>8} {runs:>6} {elapsed:>11.2f} {throughput:>8.2f} {speedup:>8.2f} {speedup / workers:>10.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+ワークフロー一覧のページングの計測
+
+大量のワークフロー（既定100万件、1割にノードあり）を作成し、GET /workflows と同じ処理
+（キーセットページネーション + ページ内のワークフローのノード数の集計）で、
+先頭・途中・末尾付近のページを取得する時間を計測します。比較として、同じ位置をOFFSETで取得する時間も計測します。
+キーセットではページの位置によらず一定で、OFFSETは位置に比例して遅くなります。
+DATABASE_URL が未設定の場合は一時ディレクトリのSQLiteを使用します。
+
+    cd server
+    python -m benchmarks.bench_workflow_list --workflows 1000000 --limit 50
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+
+def populate(engine, workflows: int, batch: int = 10000) -> None:
+    from models import NodeDB, WorkflowDB
+
+    started_at = datetime(2024, 1, 1)
+    with engine.begin() as conn:
+        for start in range(0, workflows, batch):
+            rows = []
+            nodes = []
+            for i in range(start, min(start + batch, workflows)):
+                wf_id = str(uuid.uuid4())
+                created_at = started_at + timedelta(seconds=i)
+                rows.append({"id": wf_id, "name": f"workflow {i}", "created_at": created_at})
+                if i % 10 == 0:
+                    for n in range(3):
+                        nodes.append({
+                            "id": str(uuid.uuid4()), "workflow_id": wf_id, "node_type": "formatter",
+                            "config": {"operation": "to_upper"}, "x": 0, "y": 0,
+                            "created_at": created_at, "updated_at": created_at,
+                        })
+            conn.execute(WorkflowDB.__table__.insert(), rows)
+            if nodes:
+                conn.execute(NodeDB.__table__.insert(), nodes)
+
+
+def timed(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workflows", type=int, default=1_000_000)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="llm_app_bench_list_")
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(workdir, 'bench.db')}")
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from database import Base, SessionLocal, engine
+    from models import WorkflowDB
+    from repositories.workflow_repository import WorkflowRepository
+
+    try:
+        Base.metadata.create_all(bind=engine)
+        started = time.perf_counter()
+        populate(engine, args.workflows)
+        print(f"database={os.environ['DATABASE_URL']}, workflows={args.workflows} "
+              f"(作成 {time.perf_counter() - started:.1f}s), limit={args.limit}")
+
+        db = SessionLocal()
+        repo = WorkflowRepository(db)
+
+        def keyset_page(after):
+            page = repo.list_workflows(args.limit + 1, after=after)
+            repo.count_nodes([wf_id for wf_id, _, _ in page[:args.limit]])
+
+        def offset_page(offset):
+            page = [
+                tuple(row) for row in
+                db.query(WorkflowDB.id, WorkflowDB.name, WorkflowDB.created_at)
+                .order_by(WorkflowDB.created_at.desc(), WorkflowDB.id.desc())
+                .offset(offset).limit(args.limit + 1)
+            ]
+            repo.count_nodes([wf_id for wf_id, _, _ in page[:args.limit]])
+
+        print(f"{'offset':>10} {'keyset(ms)':>11} {'offset(ms)':>11}")
+        last = max(0, args.workflows - args.limit - 1)
+        for offset in sorted({0, min(1000, last), last // 10, last // 2, last}):
+            after = None
+            if offset:
+                # カーソルは1つ前の行（計測に含めない）
+                wf_id, _, created_at = db.query(WorkflowDB.id, WorkflowDB.name, WorkflowDB.created_at) \
+                    .order_by(WorkflowDB.created_at.desc(), WorkflowDB.id.desc()).offset(offset - 1).first()
+                after = (created_at, wf_id)
+            keyset_ms = timed(lambda: keyset_page(after), args.repeat)
+            offset_ms = timed(lambda: offset_page(offset), args.repeat)
+            print(f"{offset:>10} {keyset_ms:>11.2f} {offset_ms:>11.2f}")
+        db.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
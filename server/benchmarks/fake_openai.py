@@ -0,0 +1,229 @@
+"""
+OpenAI互換のスタブサーバー
+
+`/v1/chat/completions` を実装し、レイテンシの分布、ストリーミング、429（レート制限）、
+JSONモードの応答（エージェントの計画・タスク・まとめて実行したタスク・レビュー）をシミュレートします。OpenAI APIを呼ばずにベンチマークを実行するために使用します。
+
+    cd server
+    python -m benchmarks.fake_openai --port 8001 --latency-ms 300 --latency-dist lognormal
+
+アプリケーションからは `OPENAI_BASE_URL=http://127.0.0.1:8001/v1` を設定して接続します。
+呼び出し回数などの統計は `GET /_stats` で取得、`POST /_reset` でリセットできます。
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import re
+import time
+from collections import Counter
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, List
+from uuid import uuid4
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+@dataclass
+class FakeOpenAIConfig:
+    latency_ms: float = 200.0  # 応答時間の中央値
+    latency_dist: str = "lognormal"  # fixed | uniform | lognormal
+    latency_sigma: float = 0.5  # lognormalの形状パラメータ / uniformの場合は中央値に対する幅の割合
+    ttft_ratio: float = 0.3  # ストリーミング時、最初のトークンまでの時間が応答時間に占める割合
+    rate_limit_ratio: float = 0.0  # 429を返す確率
+    completion_tokens: int = 64  # テキスト応答のトークン数
+    plan_tasks: int = 3  # 計画（JSON）に含めるタスク数
+    review_score: float = 0.8  # レビュー（JSON）のoverall_score
+    batch_drop_ratio: float = 0.0  # まとめて実行したタスク（task_batch）の結果を1件ずつ欠落させる確率
+    seed: int = 0
+
+    def sample_latency(self, rng: random.Random) -> float:
+        """応答時間（秒）をサンプリングします。"""
+        median = self.latency_ms / 1000
+        if self.latency_dist == "fixed":
+            return median
+        if self.latency_dist == "uniform":
+            return max(0.0, rng.uniform(median * (1 - self.latency_sigma), median * (1 + self.latency_sigma)))
+        return rng.lognormvariate(math.log(median), self.latency_sigma) if median > 0 else 0.0
+
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def _classify(messages: List[Dict[str, Any]], json_mode: bool) -> str:
+    """プロンプトからエージェントのどのステップの呼び出しかを推定します。"""
+    prompt = messages[-1].get("content", "") if messages else ""
+    if not json_mode:
+        return "text"
+    if '"tasks"' in prompt:
+        return "plan"
+    if '"results"' in prompt:
+        return "task_batch"
+    if '"overall_score"' in prompt:
+        return "aggregate" if '"priority_improvements"' in prompt else "review"
+    if '"output"' in prompt:
+        return "task"
+    return "json"
+
+
+class FakeOpenAI:
+    def __init__(self, config: FakeOpenAIConfig):
+        self.config = config
+        self.rng = random.Random(config.seed)
+        self.stats: Counter = Counter()
+        self.app = self._build_app()
+
+    def _text(self, tokens: int) -> str:
+        return " ".join(f"token{i}" for i in range(tokens))
+
+    def _json_content(self, kind: str, prompt: str) -> Dict[str, Any]:
+        if kind == "plan":
+            return {
+                "tasks": [
+                    {
+                        "description": f"タスク{i + 1}",
+                        "resources": ["スタブ"],
+                        "dependencies": [],
+                        "expected_result": self._text(8)
+                    }
+                    for i in range(self.config.plan_tasks)
+                ],
+                "fallback_plans": []
+            }
+        if kind == "task":
+            return {"status": "success", "output": self._text(self.config.completion_tokens), "next_steps": []}
+        if kind == "task_batch":
+            # プロンプトのタスク一覧の task_id ごとに結果を返す（batch_drop_ratio の確率で欠落させる）
+            task_ids = sorted({int(task_id) for task_id in re.findall(r'"task_id": (\d+)', prompt)})
+            return {"results": [
+                {"task_id": task_id, "status": "success", "output": self._text(self.config.completion_tokens),
+                 "next_steps": []}
+                for task_id in task_ids if self.rng.random() >= self.config.batch_drop_ratio
+            ]}
+        if kind in ("review", "aggregate"):
+            scores = {key: self.config.review_score for key in
+                      ("purpose_achievement", "constraint_compliance", "quality_standards", "feasibility")}
+            return {
+                "scores": scores,
+                "overall_score": self.config.review_score,
+                "improvements": ["スタブの改善提案"],
+                "priority_improvements": ["スタブの改善提案"],
+                "priority": "low"
+            }
+        return {"result": "ok"}
+
+    def _build_app(self) -> FastAPI:
+        app = FastAPI(title="Fake OpenAI")
+
+        @app.get("/_stats")
+        def get_stats():
+            return dict(self.stats)
+
+        @app.post("/_reset")
+        def reset_stats():
+            self.stats.clear()
+            return {"status": "ok"}
+
+        @app.post("/v1/chat/completions")
+        async def chat_completions(request: Request):
+            body = await request.json()
+            messages = body.get("messages", [])
+            json_mode = (body.get("response_format") or {}).get("type") == "json_object"
+            stream = bool(body.get("stream"))
+            kind = _classify(messages, json_mode)
+            prompt = "\n".join(str(m.get("content", "")) for m in messages)
+
+            self.stats["requests"] += 1
+            if self.rng.random() < self.config.rate_limit_ratio:
+                self.stats["rate_limited"] += 1
+                return JSONResponse(
+                    status_code=429,
+                    headers={"retry-after-ms": "50"},
+                    content={"error": {"message": "Rate limit reached (fake)", "type": "requests", "code": "rate_limit_exceeded"}}
+                )
+
+            self.stats["calls"] += 1
+            self.stats[f"calls.{kind}"] += 1
+            content = json.dumps(self._json_content(kind, prompt), ensure_ascii=False) if json_mode \
+                else self._text(self.config.completion_tokens)
+            prompt_tokens = _estimate_tokens(prompt)
+            completion_tokens = _estimate_tokens(content)
+            self.stats["prompt_tokens"] += prompt_tokens
+            self.stats["completion_tokens"] += completion_tokens
+
+            latency = self.config.sample_latency(self.rng)
+            completion_id = f"chatcmpl-{uuid4().hex}"
+            created = int(time.time())
+            model = body.get("model", "gpt-4o-mini")
+
+            if stream:
+                self.stats["stream_calls"] += 1
+                return StreamingResponse(
+                    self._stream(completion_id, created, model, content, latency),
+                    media_type="text/event-stream"
+                )
+
+            await asyncio.sleep(latency)
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop"
+                }],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens
+                }
+            }
+
+        return app
+
+    async def _stream(self, completion_id: str, created: int, model: str, content: str, latency: float):
+        # JSONの途中で区切られるよう、固定長のチャンクに分割する
+        chunks = [content[i:i + 16] for i in range(0, len(content), 16)] or [""]
+        await asyncio.sleep(latency * self.config.ttft_ratio)
+        interval = latency * (1 - self.config.ttft_ratio) / len(chunks)
+
+        def chunk(delta: Dict[str, Any], finish_reason=None) -> str:
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+            }
+            return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+        yield chunk({"role": "assistant", "content": ""})
+        for i, piece in enumerate(chunks):
+            if i:
+                await asyncio.sleep(interval)
+            yield chunk({"content": piece})
+        yield chunk({}, "stop")
+        yield "data: [DONE]\n\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    defaults = FakeOpenAIConfig()
+    for name, value in asdict(defaults).items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=type(value), default=value)
+    args = vars(parser.parse_args())
+    host, port = args.pop("host"), args.pop("port")
+
+    uvicorn.run(FakeOpenAI(FakeOpenAIConfig(**args)).app, host=host, port=port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
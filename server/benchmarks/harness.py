@@ -0,0 +1,206 @@
+"""
+ベンチマークの共通処理（計測・集計・レポート、テスト用サーバーの起動、サンプルPDFの生成）
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import uvicorn
+
+
+def percentile(values: List[float], p: float) -> float:
+    """線形補間でパーセンタイルを求めます。"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * p / 100
+    lower = int(k)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (k - lower)
+
+
+@dataclass
+class ScenarioResult:
+    scenario: str
+    runs: int
+    concurrency: int
+    elapsed_s: float
+    latencies_ms: List[float] = field(default_factory=list)
+    errors: int = 0
+    llm_stats: Dict[str, int] = field(default_factory=dict)
+    extra: Dict[str, float] = field(default_factory=dict)  # シナリオ固有の指標（time-to-first-eventなど）
+
+    @property
+    def throughput(self) -> float:
+        return self.runs / self.elapsed_s if self.elapsed_s else 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        calls = self.llm_stats.get("calls", 0)
+        return {
+            "scenario": self.scenario,
+            "runs": self.runs,
+            "concurrency": self.concurrency,
+            "errors": self.errors,
+            "elapsed_s": round(self.elapsed_s, 3),
+            "throughput_per_s": round(self.throughput, 3),
+            "p50_ms": round(percentile(self.latencies_ms, 50), 1),
+            "p95_ms": round(percentile(self.latencies_ms, 95), 1),
+            "p99_ms": round(percentile(self.latencies_ms, 99), 1),
+            "llm_calls": calls,
+            "llm_calls_per_run": round(calls / self.runs, 2) if self.runs else 0,
+            "llm_rate_limited": self.llm_stats.get("rate_limited", 0),
+            "llm_prompt_tokens": self.llm_stats.get("prompt_tokens", 0),
+            "llm_completion_tokens": self.llm_stats.get("completion_tokens", 0),
+            **{key: round(value, 3) for key, value in self.extra.items()},
+        }
+
+
+async def run_concurrently(
+    runs: int,
+    concurrency: int,
+    task: Callable[[int], Awaitable[Optional[Dict[str, float]]]],
+) -> tuple:
+    """
+    taskをruns回、最大concurrency並列で実行し、1回ごとの所要時間を計測します。
+
+    Args:
+        runs: 実行回数
+        concurrency: 同時実行数
+        task: 実行する処理。シナリオ固有の指標をdictで返せる
+
+    Returns:
+        (全体の所要時間(秒), 所要時間(ミリ秒)のリスト, エラー数, シナリオ固有の指標のリスト)
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    extras: List[Dict[str, float]] = []
+    errors = 0
+
+    async def one(i: int):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                extra = await task(i)
+                if extra:
+                    extras.append(extra)
+            except Exception as e:
+                errors += 1
+                print(f"  エラー: {type(e).__name__}: {e}")
+                return
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(runs)))
+    return time.perf_counter() - started, latencies, errors, extras
+
+
+class ThreadedServer:
+    """ASGIアプリケーションをバックグラウンドスレッドのuvicornで起動します。"""
+
+    def __init__(self, app, host: str = "127.0.0.1", port: int = 0):
+        self.server = uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.servers[0].sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "ThreadedServer":
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    def stop(self) -> None:
+        self.server.should_exit = True
+        self.thread.join()
+
+
+def create_sample_pdf(path: str, pages: int, text_layer: bool = False) -> str:
+    """
+    OCR用のサンプルPDFを生成します。
+
+    Args:
+        path: 出力先
+        pages: ページ数
+        text_layer: Trueの場合はテキストレイヤー付きのPDF（pdflatexなどで作成したPDF相当）を生成
+            Falseの場合は画像のみのPDF（スキャンしたPDF相当）を生成
+
+    Returns:
+        出力先のパス
+    """
+    if text_layer:
+        _write_text_pdf(path, pages)
+        return path
+
+    from PIL import Image, ImageDraw
+
+    images = []
+    for page in range(pages):
+        image = Image.new("L", (1240, 1754), color=255)  # A4 150dpi
+        draw = ImageDraw.Draw(image)
+        for line in range(40):
+            draw.text((80, 80 + line * 40), f"Page {page + 1} line {line + 1}: The quick brown fox jumps over the lazy dog.", fill=0)
+        images.append(image)
+    images[0].save(path, save_all=True, append_images=images[1:], resolution=150)
+    return path
+
+
+def _write_text_pdf(path: str, pages: int) -> None:
+    """外部ライブラリを使わずに、テキストレイヤーのみのPDFを書き出します。"""
+    objects: List[bytes] = []
+    page_ids = []
+    font_id = 3
+    objects.append(b"<< /Type /Catalog /Pages 2 0 R >>")
+    objects.append(b"")  # Pagesは後で埋める
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    for page in range(pages):
+        lines = [f"Page {page + 1} line {line + 1}: The quick brown fox jumps over the lazy dog." for line in range(40)]
+        stream = "BT /F1 11 Tf 50 800 Td 14 TL " + " ".join(f"({line}) '" for line in lines) + " ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream".encode())
+        content_id = len(objects)
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents {content_id} 0 R "
+            f"/Resources << /Font << /F1 {font_id} 0 R >> >> >>".encode()
+        )
+        page_ids.append(len(objects))
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(f'{i} 0 R' for i in page_ids)}] /Count {pages} >>".encode()
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, obj in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{i} 0 obj\n".encode() + obj + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def print_report(results: List[ScenarioResult], output: Optional[str] = None) -> None:
+    """結果を表形式で表示し、outputが指定されていればJSONで保存します。"""
+    summaries = [result.summary() for result in results]
+    columns = ["scenario", "runs", "concurrency", "errors", "throughput_per_s", "p50_ms", "p95_ms", "p99_ms",
+               "llm_calls", "llm_calls_per_run", "llm_rate_limited"]
+    widths = [max([len(column)] + [len(str(summary[column])) for summary in summaries]) for column in columns]
+    print(" ".join(f"{column:>{width}}" for column, width in zip(columns, widths)))
+    for summary in summaries:
+        print(" ".join(f"{summary[column]!s:>{width}}" for column, width in zip(columns, widths)))
+        extras = {key: value for key, value in summary.items() if key not in columns and key != "elapsed_s"
+                  and not key.startswith("llm_")}
+        if extras:
+            print(f"{'':>{widths[0]}} " + ", ".join(f"{key}={value}" for key, value in extras.items()))
+
+    if output:
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, "w") as f:
+            json.dump(summaries, f, indent=2, ensure_ascii=False)
+        print(f"結果を保存しました: {output}")
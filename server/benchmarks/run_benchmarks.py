@@ -0,0 +1,244 @@
+"""
+オフラインベンチマーク
+
+OpenAI互換のスタブサーバー（benchmarks/fake_openai.py）とアプリケーションを
+バックグラウンドで起動し、HTTP経由で各シナリオを実行します。OpenAI APIは呼び出しません。
+DATABASE_URL が未設定の場合は一時ディレクトリのSQLiteを使用します。
+
+    cd server
+    python -m benchmarks.run_benchmarks --runs 50 --concurrency 8 --latency-ms 200
+    python -m benchmarks.run_benchmarks --scenarios agent sse --rate-limit-ratio 0.05 --output results/bench.json
+
+シナリオ:
+    linear  : テキスト抽出 → 生成AI×N の直列ワークフローを POST /workflows/{id}/run で実行
+    fanout  : テキスト抽出 → 生成AI×K（すべてテキスト抽出に依存）を実行
+    agent   : テキスト抽出 → エージェント を実行し、計画の開始から最初のタスクの実行開始までの時間も計測
+              （AGENT_STREAM_PLAN=false で計画の完了を待つ場合と比較できる）
+    upload  : サンプルPDFを POST /workflows/{id}/upload でアップロード（popplerとtesseractが必要。
+              --pdf-text-layer の場合はテキストレイヤーから抽出するためpopplerのみ）
+    sse     : linearと同じワークフローを GET /workflows/{id}/run/stream で実行し、最初のイベントまでの時間も計測
+"""
+import argparse
+import asyncio
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+from dataclasses import asdict
+from typing import Any, Callable, Dict, List
+
+import httpx
+
+from benchmarks.fake_openai import FakeOpenAI, FakeOpenAIConfig
+from benchmarks.harness import ScenarioResult, ThreadedServer, create_sample_pdf, print_report, run_concurrently
+
+SAMPLE_TEXT = "ベンチマーク用のサンプル文書です。" * 50
+
+
+def _node(index: int, source: int = None) -> Dict[str, Any]:
+    return {
+        "node": {"id": str(index), "type": "custom", "position": {"x": 0, "y": 150 * index}},
+        "edge": {"id": f"e-{index}", "type": "smoothstep", "source": str(source), "target": str(index), "animated": True}
+        if source else None,
+    }
+
+
+def _extract_text_node() -> Dict[str, Any]:
+    return {"node_type": "extract_text", "config": {
+        **_node(1), "file_name": "sample.pdf", "file_size": len(SAMPLE_TEXT), "file_type": "application/pdf",
+        "extracted_text": SAMPLE_TEXT,
+    }}
+
+
+def _generative_ai_node(index: int, source: int) -> Dict[str, Any]:
+    return {"node_type": "generative_ai", "config": {
+        **_node(index, source), "prompt": f"要約してください（{index}）", "model": "gpt-4o-mini",
+        "temperature": 0.7, "max_tokens": 256,
+    }}
+
+
+def _agent_node(index: int, source: int) -> Dict[str, Any]:
+    return {"node_type": "agent", "config": {
+        **_node(index, source), "goal": "文書の要点をまとめる", "constraints": ["日本語で回答する"],
+        "capabilities": {"planning": True, "web_search": False, "execution": True, "review": True},
+        "behavior": {"aggressiveness": 0.7, "caution": 0.3}, "operation": "agent_operation",
+    }}
+
+
+async def _create_workflow(client: httpx.AsyncClient, name: str, nodes: List[Dict[str, Any]]) -> str:
+    response = await client.post("/workflows", json={"name": name})
+    response.raise_for_status()
+    workflow_id = response.json()["id"]
+    for node in nodes:
+        (await client.post(f"/workflows/{workflow_id}/nodes", json=node)).raise_for_status()
+    return workflow_id
+
+
+async def _run_collect(client: httpx.AsyncClient, workflow_id: str) -> None:
+    response = await client.post(f"/workflows/{workflow_id}/run")
+    response.raise_for_status()
+    body = response.json()
+    if body["status"] != "success":
+        raise RuntimeError(f"run status={body['status']}")
+
+
+async def scenario_linear(client: httpx.AsyncClient, args) -> Callable:
+    nodes = [_extract_text_node()] + [_generative_ai_node(i + 2, i + 1) for i in range(args.nodes)]
+    workflow_id = await _create_workflow(client, "bench_linear", nodes)
+    return lambda i: _run_collect(client, workflow_id)
+
+
+async def scenario_fanout(client: httpx.AsyncClient, args) -> Callable:
+    nodes = [_extract_text_node()] + [_generative_ai_node(i + 2, 1) for i in range(args.fanout)]
+    workflow_id = await _create_workflow(client, "bench_fanout", nodes)
+    return lambda i: _run_collect(client, workflow_id)
+
+
+async def scenario_agent(client: httpx.AsyncClient, args) -> Callable:
+    workflow_id = await _create_workflow(client, "bench_agent", [_extract_text_node(), _agent_node(2, 1)])
+    return lambda i: _run_collect(client, workflow_id)
+
+
+async def scenario_upload(client: httpx.AsyncClient, args) -> Callable:
+    if args.pdf_text_layer:
+        # テキストレイヤーのあるページはOCRしない
+        if not (shutil.which("pdfinfo") and shutil.which("pdftotext")):
+            raise RuntimeError("poppler（pdfinfo, pdftotext）が必要です")
+    elif not (shutil.which("pdftoppm") and shutil.which("tesseract")):
+        raise RuntimeError("poppler（pdftoppm）とtesseractが必要です")
+
+    workflow_id = await _create_workflow(client, "bench_upload", [])
+    pdf_path = create_sample_pdf(os.path.join(args.workdir, "sample.pdf"), args.pdf_pages, text_layer=args.pdf_text_layer)
+    with open(pdf_path, "rb") as f:
+        pdf_bytes = f.read()
+
+    async def upload(i: int):
+        response = await client.post(
+            f"/workflows/{workflow_id}/upload",
+            files={"file": ("sample.pdf", pdf_bytes, "application/pdf")}
+        )
+        response.raise_for_status()
+
+    return upload
+
+
+async def scenario_sse(client: httpx.AsyncClient, args) -> Callable:
+    nodes = [_extract_text_node()] + [_generative_ai_node(i + 2, i + 1) for i in range(args.nodes)]
+    workflow_id = await _create_workflow(client, "bench_sse", nodes)
+
+    async def stream(i: int) -> Dict[str, float]:
+        started = time.perf_counter()
+        first_event_ms = None
+        events = 0
+        async with client.stream("GET", f"/workflows/{workflow_id}/run/stream") as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if line.startswith("event: node_update"):
+                    events += 1
+                    if first_event_ms is None:
+                        first_event_ms = (time.perf_counter() - started) * 1000
+                elif line.startswith("event: workflow_error"):
+                    raise RuntimeError("workflow_error")
+        return {"time_to_first_event_ms": first_event_ms or 0.0, "sse_events": events}
+
+    return stream
+
+
+SCENARIOS = {
+    "linear": scenario_linear,
+    "fanout": scenario_fanout,
+    "agent": scenario_agent,
+    "upload": scenario_upload,
+    "sse": scenario_sse,
+}
+
+
+def _time_to_first_task() -> Dict[Any, tuple]:
+    # アプリケーションと同じプロセスで実行しているため、メトリクスを直接参照する
+    from services.metrics import AGENT_TIME_TO_FIRST_TASK
+    return AGENT_TIME_TO_FIRST_TASK.stats()
+
+
+async def run_scenarios(app_url: str, fake: FakeOpenAI, args) -> List[ScenarioResult]:
+    results = []
+    async with httpx.AsyncClient(base_url=app_url, timeout=600) as client:
+        for name in args.scenarios:
+            try:
+                task = await SCENARIOS[name](client, args)
+            except RuntimeError as e:
+                print(f"{name}: スキップしました（{e}）")
+                continue
+
+            fake.stats.clear()
+            first_task_before = _time_to_first_task()
+            elapsed, latencies, errors, extras = await run_concurrently(args.runs, args.concurrency, task)
+            result = ScenarioResult(
+                scenario=name,
+                runs=args.runs,
+                concurrency=args.concurrency,
+                elapsed_s=elapsed,
+                latencies_ms=latencies,
+                errors=errors,
+                llm_stats=dict(fake.stats),
+            )
+            if extras:
+                for key in extras[0]:
+                    result.extra[f"{key}_avg"] = sum(extra[key] for extra in extras) / len(extras)
+            # エージェントの計画の開始から最初のタスクの実行開始まで（stream・full の合計）
+            count = total = 0.0
+            for labels, (n, seconds) in _time_to_first_task().items():
+                before_n, before_seconds = first_task_before.get(labels, (0, 0.0))
+                count += n - before_n
+                total += seconds - before_seconds
+            if count:
+                result.extra["time_to_first_task_ms_avg"] = total / count * 1000
+            results.append(result)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--nodes", type=int, default=3, help="linear/sseの生成AIノード数")
+    parser.add_argument("--fanout", type=int, default=4, help="fanoutの生成AIノード数")
+    parser.add_argument("--pdf-pages", type=int, default=3)
+    parser.add_argument("--pdf-text-layer", action="store_true", help="テキストレイヤー付きのPDFでuploadを計測")
+    parser.add_argument("--output", help="結果を保存するJSONファイル")
+    defaults = FakeOpenAIConfig()
+    for name, value in asdict(defaults).items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=type(value), default=value,
+                            help="スタブサーバーの設定")
+    args = parser.parse_args()
+
+    fake_config = FakeOpenAIConfig(**{name: getattr(args, name) for name in asdict(defaults)})
+    fake = FakeOpenAI(fake_config)
+    fake_server = ThreadedServer(fake.app).start()
+
+    args.workdir = tempfile.mkdtemp(prefix="llm_app_bench_")
+    os.environ["OPENAI_BASE_URL"] = f"{fake_server.url}/v1"
+    os.environ.setdefault("OPENAI_SECRET", "fake")
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(args.workdir, 'bench.db')}")
+
+    # 環境変数を設定してからアプリケーションを読み込む（OpenAIクライアントは読み込み時に作成される）
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import main as app_main
+    logging.getLogger().setLevel(logging.WARNING)
+
+    app_server = ThreadedServer(app_main.app).start()
+    try:
+        print(f"stub: latency={fake_config.latency_ms}ms ({fake_config.latency_dist}), "
+              f"rate_limit_ratio={fake_config.rate_limit_ratio}, database={os.environ['DATABASE_URL']}")
+        results = asyncio.run(run_scenarios(app_server.url, fake, args))
+        print_report(results, args.output)
+    finally:
+        app_server.stop()
+        fake_server.stop()
+        shutil.rmtree(args.workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,32 +1,53 @@
-from fastapi import FastAPI, HTTPException, Depends, UploadFile, File
+from fastapi import FastAPI, HTTPException, Depends, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, Response
 from sse_starlette.sse import EventSourceResponse # type: ignore
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 import os
-import shutil
-from pdf2image import convert_from_path
-import pytesseract
-from typing import List, Dict, Any
-from models import NodeType
-from services.workflow_service import WorkflowService
+from typing import List, Dict, Any, Literal, Optional, Tuple
+from models import NodeType, RunStatus
+from services.workflow_service import FAILED_NODE_STATUSES, WorkflowService
+from services.document_service import DocumentService
+from services.upload_storage import UploadStorage, UploadTooLargeError, UploadFormatError
+from services.workflow_transfer import WorkflowExporter, WorkflowImporter, WorkflowImportError, iter_lines
+from services.execution_plan import snapshot_nodes
+from services.cancellation import RunRegistry
+from services.budget import cancelled_run_status
+from services.checkpoints import prune_checkpoints
+from services.document_blobs import prune_document_blobs
+from services.run_context import RunContext
+from services.admission import AdmissionController, AdmissionRejected
+from services.cost_estimator import WorkflowEstimator
+from services.executors import executors, dumps_json
+from services.structured_logging import configure_logging, LazyJSON
+from services.metrics import registry as metrics_registry, CONTENT_TYPE as METRICS_CONTENT_TYPE, SSE_EVENTS
 import logging
 import json
+import asyncio
+import time
+import base64
 from datetime import datetime
 
 from schemas import (
     CreateWorkflowRequest, CreateWorkflowResponse, 
     AddNodeRequest, WorkflowDetailResponse,
+    NodeRunResult, RunWorkflowResponse,
+    WorkflowSummary, WorkflowListResponse,
+    NodeResponse, AddNodeResponse, AddNodesRequest, AddNodesResponse,
+    WorkflowEstimateResponse,
 )
-from database import get_db, engine, Base
+from database import get_db, engine, Base, SessionLocal, upgrade_schema
 from repositories.workflow_repository import WorkflowRepository
 from repositories.node_repository import NodeRepository
+from repositories.run_repository import RunRepository, TERMINAL_STATUSES
+from repositories.document_blob_repository import DocumentBlobRepository
+
+# デバッグモードの設定
+DEBUG_MODE = os.getenv("DEBUG_MODE", "false").lower() == "true"
 
 # ロガーの設定
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+configure_logging(debug=DEBUG_MODE)
 logger = logging.getLogger('WorkflowApp')
 
 app = FastAPI(title="Workflow App")
@@ -41,17 +62,129 @@ app.add_middleware(
 
 # データベースの初期化
 Base.metadata.create_all(bind=engine)
+upgrade_schema()
+
+def _migrate_data():
+    """既存のデータを現在のスキーマに移行します。"""
+    db = SessionLocal()
+    try:
+        backfilled = WorkflowRepository(db).backfill_created_at()
+        if backfilled:
+            logger.info(f"ワークフローの作成日時を設定しました: {backfilled}件")
+        migrated = NodeRepository(db).migrate_document_text()
+        if migrated:
+            logger.info(f"文書のテキストを document_blobs に移行しました: {migrated}ノード")
+    finally:
+        db.close()
+
+_migrate_data()
+# 再開されないまま期限を過ぎたチェックポイントを削除する（以降は実行の登録時に一定間隔で削除）
+prune_checkpoints(SessionLocal, force=True)
+# ノードが保存されなかったアップロードなど、参照されていない文書のテキストを削除する（以降はアップロード時に一定間隔で削除）
+prune_document_blobs(SessionLocal, force=True)
 
 # 一時ファイルの保存ディレクトリ
 UPLOAD_DIR = "uploads"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+upload_storage = UploadStorage(UPLOAD_DIR)
 
-# デバッグモードの設定
-DEBUG_MODE = os.getenv("DEBUG_MODE", "false").lower() == "true"
-
-# ワークフロー実行サービスのインスタンス
+# ワークフロー実行サービスのインスタンス（全リクエストで共有。実行ごとの状態はRunContextに保持）
 workflow_service = WorkflowService(debug=DEBUG_MODE)
 
+# 実行前の見積もり（実行計画とプロンプトのテンプレートは workflow_service のものを使用）
+workflow_estimator = WorkflowEstimator(workflow_service)
+
+# PDFのテキスト抽出サービス
+document_service = DocumentService()
+
+# このプロセスで実行中のワークフローのキャンセルトークン
+run_registry = RunRegistry()
+
+# 実行の受け付け制御（全体・ワークフローごとの同時実行数の上限と待ち行列）
+# 他のAPIプロセスで受け付けたキャンセル要求は、ハートビートで検知してこのプロセスの実行をキャンセルする
+admission = AdmissionController(SessionLocal, on_cancel_requested=run_registry.cancel)
+
+# 出力時に値を求めるメトリクス
+metrics_registry.gauge("db_pool_checked_out", "使用中のDB接続の数", function=lambda: engine.pool.checkedout())
+metrics_registry.gauge("db_pool_size", "DB接続プールのサイズ", function=lambda: engine.pool.size())
+metrics_registry.gauge(
+    "plan_cache_hit_ratio", "実行計画キャッシュのヒット率",
+    function=lambda: workflow_service.plan_cache.hits / max(workflow_service.plan_cache.hits + workflow_service.plan_cache.misses, 1)
+)
+metrics_registry.gauge("run_queue_depth", "このプロセスで開始を待っている実行の数", function=lambda: admission.waiting)
+metrics_registry.gauge("run_admitted", "このプロセスで受け付けて実行中の実行の数", function=lambda: admission.running)
+metrics_registry.gauge("plan_cache_entries", "キャッシュされている実行計画の数", function=lambda: len(workflow_service.plan_cache))
+
+@app.on_event("shutdown")
+def shutdown_executors():
+    """実行バックエンドのスレッド・プロセスプールを終了します（実行中の処理は完了を待つ）。"""
+    executors.shutdown()
+
+def _store_document_text(text: str) -> Dict[str, Any]:
+    """抽出したテキストを document_blobs に保存し、ノードの設定に保存する参照を返します。"""
+    db = SessionLocal()
+    try:
+        repo = DocumentBlobRepository(db)
+        blob = repo.put(text)
+        db.commit()
+        return repo.reference(blob, text)
+    finally:
+        db.close()
+
+def _record_run_status(run_id: str, status: RunStatus, detail: str = None):
+    """
+    実行ステータスを記録します。
+    SSEのレスポンス中はリクエストのセッションが閉じられている可能性があるため、専用のセッションを使用します。
+    """
+    db = SessionLocal()
+    try:
+        RunRepository(db).update_status(run_id, status, detail)
+    finally:
+        db.close()
+
+async def _admit(workflow_id: str) -> str:
+    """
+    実行を受け付けます。同時実行数の上限を超える場合は 429 と Retry-After を返します。
+
+    Returns:
+        作成した実行のID
+    """
+    await asyncio.to_thread(prune_checkpoints, SessionLocal)
+    try:
+        return await admission.admit(workflow_id)
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=429,
+            detail=f"同時に実行できる数の上限に達しています（{e.reason}）",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
+class AdmittedEventSourceResponse(EventSourceResponse):
+    """
+    受け付けた実行をストリーミングするSSEレスポンス
+
+    ジェネレーターは admission.hold の中で実行しますが、ストリームを開始する前にクライアントが切断した場合などは
+    ジェネレーターが一度も実行されないため、レスポンスの終了時に hold に入らなかった実行を終了させて枠を解放します。
+    """
+
+    def __init__(self, run_id: str, content, **kwargs):
+        super().__init__(content, **kwargs)
+        self.run_id = run_id
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await admission.abandon(self.run_id)
+
+async def _count_sse_events(endpoint: str, events):
+    """送信するSSEイベントをメトリクスに記録します。"""
+    try:
+        async for event in events:
+            SSE_EVENTS.labels(endpoint, event.get("event", "message")).inc()
+            yield event
+    finally:
+        await events.aclose()
+
 @app.post("/workflows", response_model=CreateWorkflowResponse)
 def create_workflow(req: CreateWorkflowRequest, db: Session = Depends(get_db)):
     """
@@ -68,6 +201,107 @@ def create_workflow(req: CreateWorkflowRequest, db: Session = Depends(get_db)):
     workflow = repo.create_workflow(req.name)
     return CreateWorkflowResponse(id=workflow.id, name=workflow.name)
 
+def _encode_cursor(created_at: datetime, wf_id: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([created_at.isoformat(), wf_id]).encode()).decode()
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        created_at, wf_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(created_at), wf_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="カーソルが不正です")
+
+@app.get("/workflows", response_model=WorkflowListResponse)
+def list_workflows(
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    order: Literal["desc", "asc"] = "desc",
+    db: Session = Depends(get_db)
+):
+    """
+    ワークフローの一覧を作成日時順に取得します。ノードの設定は返さず、ノード数のみを返します。
+
+    Args:
+        limit: 1ページの件数
+        cursor: 前のページの next_cursor（最初のページは省略）
+        order: "desc"（新しい順）| "asc"（古い順）
+        db: データベースセッション
+
+    Returns:
+        ワークフローのID・名前・作成日時・ノード数のリストと、次のページのカーソル
+    """
+    repo = WorkflowRepository(db)
+    after = _decode_cursor(cursor) if cursor else None
+    # 1件多く取得し、次のページがあるかどうかを判定する
+    rows = repo.list_workflows(limit + 1, after=after, descending=order == "desc")
+    page = rows[:limit]
+    node_counts = repo.count_nodes([wf_id for wf_id, _, _ in page])
+
+    next_cursor = None
+    if len(rows) > limit:
+        wf_id, _, created_at = page[-1]
+        next_cursor = _encode_cursor(created_at, wf_id)
+
+    return WorkflowListResponse(
+        items=[
+            WorkflowSummary(id=wf_id, name=name, created_at=created_at, node_count=node_counts.get(wf_id, 0))
+            for wf_id, name, created_at in page
+        ],
+        next_cursor=next_cursor
+    )
+
+@app.get("/workflows/export")
+def export_workflows(workflow_id: Optional[List[str]] = Query(None)):
+    """
+    ワークフローとノード（エッジを含む設定）、参照する文書のテキストをNDJSONでストリーミングします。
+
+    Args:
+        workflow_id: エクスポートするワークフローのID（複数指定可。省略時はすべて）
+
+    Returns:
+        NDJSON（application/x-ndjson）
+    """
+    def stream():
+        # レスポンスの送信中も使うため、リクエストとは別のセッションを使用する
+        db = SessionLocal()
+        try:
+            yield from WorkflowExporter(db).iter_ndjson(workflow_id)
+        finally:
+            db.close()
+
+    return StreamingResponse(
+        stream(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="workflows.ndjson"'}
+    )
+
+@app.post("/workflows/import")
+async def import_workflows(request: Request, keep_ids: bool = False):
+    """
+    GET /workflows/export のNDJSONをインポートします。リクエストボディは行ごとに読み込み、
+    バッチごとに複数行のINSERTで書き込みます。全体を1つのトランザクションで行い、エラーの場合は何もインポートしません。
+
+    Args:
+        request: NDJSONのリクエストボディ
+        keep_ids: エクスポート元のIDを使うかどうか（既定は新しいIDを割り当てる）
+
+    Returns:
+        インポートしたワークフロー・ノード・文書のテキストの数
+    """
+    importer = await asyncio.to_thread(WorkflowImporter, engine, keep_ids)
+    try:
+        async for line in iter_lines(request.stream()):
+            importer.add_line(line)
+            if importer.should_flush:
+                await asyncio.to_thread(importer.flush)
+        return await asyncio.to_thread(importer.commit)
+    except WorkflowImportError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except IntegrityError:
+        raise HTTPException(status_code=409, detail="同じIDのワークフローまたはノードが存在します")
+    finally:
+        await asyncio.to_thread(importer.close)
+
 @app.get("/workflows/{wf_id}", response_model=WorkflowDetailResponse)
 def get_workflow(wf_id: str, db: Session = Depends(get_db)):
     """
@@ -91,7 +325,28 @@ def get_workflow(wf_id: str, db: Session = Depends(get_db)):
         nodes=[{ "id": node.id, "node_type": node.node_type, "config": node.config } for node in wf.nodes]
     )
 
-@app.post("/workflows/{wf_id}/nodes")
+@app.get("/workflows/{wf_id}/estimate", response_model=WorkflowEstimateResponse)
+def estimate_workflow(wf_id: str, db: Session = Depends(get_db)):
+    """
+    ワークフローを実行する前に、LLM呼び出し回数・入力と出力のトークン数・所要時間を見積もります。
+    LLMは呼び出しません。
+
+    Args:
+        wf_id: ワークフローのID
+        db: データベースセッション
+
+    Returns:
+        全体とノードごとの見積もり（expected: 想定される値、max: エージェントが上限まで繰り返した場合の値）
+    """
+    workflow = WorkflowRepository(db).get_workflow(wf_id)
+    if not workflow:
+        raise HTTPException(status_code=404, detail="ワークフローが見つかりません")
+    return workflow_estimator.estimate(snapshot_nodes(workflow.nodes), wf_id)
+
+def _node_response(node) -> NodeResponse:
+    return NodeResponse(id=node.id, node_type=node.node_type, config=node.config)
+
+@app.post("/workflows/{wf_id}/nodes", response_model=AddNodeResponse)
 def add_node(wf_id: str, req: AddNodeRequest, db: Session = Depends(get_db)):
     """
     ワークフローにノードを追加します。
@@ -102,73 +357,113 @@ def add_node(wf_id: str, req: AddNodeRequest, db: Session = Depends(get_db)):
         db: データベースセッション
 
     Returns:
-        ノードのID
+        ノードのIDと、追加されたノード（クライアントはワークフローを取得し直さずに反映できる）
     """
     workflow_repo = WorkflowRepository(db)
-    wf = workflow_repo.get_workflow(wf_id)
-    if not wf:
+    if not workflow_repo.exists(wf_id):
         raise HTTPException(status_code=404, detail="ワークフローが見つかりません")
 
     node_repo = NodeRepository(db)
     node = node_repo.add_node(wf_id, req.node_type.value, req.config)
-    return {"message": "Node added", "node_id": node.id}
+    workflow_service.plan_cache.invalidate(wf_id)
+    return AddNodeResponse(message="Node added", node_id=node.id, node=_node_response(node))
 
-@app.post("/workflows/{wf_id}/upload")
-async def upload_pdf(wf_id: str, file: UploadFile = File(...)):
+@app.post("/workflows/{wf_id}/nodes:batch", response_model=AddNodesResponse)
+def add_nodes(wf_id: str, req: AddNodesRequest, db: Session = Depends(get_db)):
     """
-    PDFファイルをアップロードします。
+    ワークフローに複数のノード（エッジを含む設定）を1つのトランザクションで追加します。
 
     Args:
         wf_id: ワークフローのID
-        file: アップロードするPDFファイル
+        req: 追加するノードのリスト
+        db: データベースセッション
 
     Returns:
-        抽出されたテキスト
+        追加されたノードのリスト（リクエストと同じ順）
     """
-    # TODO： OCRはRun時にまとめてやってもいいかも
-    if not file.filename.endswith('.pdf'):
-        raise HTTPException(status_code=400, detail="PDFファイルのみアップロードできます")
-
-    MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
-    file_size = 0
-    chunk_size = 1024 * 1024
+    if not WorkflowRepository(db).exists(wf_id):
+        raise HTTPException(status_code=404, detail="ワークフローが見つかりません")
 
-    while chunk := await file.read(chunk_size): # ここでポインタがズレる
-        file_size += len(chunk)
-        if file_size > MAX_FILE_SIZE:
-            raise HTTPException(status_code=400, detail="ファイルサイズは10MB以下にしてください")
+    nodes = NodeRepository(db).add_nodes(wf_id, [(node.node_type.value, node.config) for node in req.nodes])
+    workflow_service.plan_cache.invalidate(wf_id)
+    return AddNodesResponse(nodes=[_node_response(node) for node in nodes])
 
-    await file.seek(0) # ポインタを先頭に戻す
+@app.post("/workflows/{wf_id}/upload")
+async def upload_pdf(wf_id: str, request: Request):
+    """
+    PDFファイルをアップロードします。
 
-    file_path = os.path.join(UPLOAD_DIR, file.filename)
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    Args:
+        wf_id: ワークフローのID
+        request: multipart/form-data のリクエスト（file フィールドにPDFファイル）
 
+    Returns:
+        抽出されたテキストへの参照（text_blob_id・text_preview・text_size）、ページ数、
+        OCRしたページの番号（テキストレイヤーのあるページはOCRしない）、ファイルのSHA-256
+    """
+    # TODO： OCRはRun時にまとめてやってもいいかも
     try:
-        images = convert_from_path(file_path)
-        extracted_text = ""
-        for i, image in enumerate(images):
-            text = pytesseract.image_to_string(image, lang='jpn+eng')
-            extracted_text += f"\n--- Page {i+1} ---\n{text}"
-
-        os.remove(file_path)
-        return {"text": extracted_text.strip()}
+        # リクエストボディを受信しながら一意な名前の一時ファイルに書き込み、処理後（エラーの場合も）削除する
+        async with upload_storage.receive(request, "file", suffix=".pdf") as stored:
+            if not (stored.filename or "").endswith('.pdf'):
+                raise HTTPException(status_code=400, detail="PDFファイルのみアップロードできます")
+            document = await asyncio.to_thread(document_service.extract_text, stored.path)
+        # テキストは圧縮して別に保存し、ノードの設定には参照のみを保存する
+        # （ノードが保存されなかった場合は、猶予の後に prune_document_blobs で削除する）
+        reference = await asyncio.to_thread(_store_document_text, document.text)
+        await asyncio.to_thread(prune_document_blobs, SessionLocal)
+    except HTTPException:
+        raise
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=400, detail=f"ファイルサイズは{e.max_bytes / 1024 ** 2:g}MB以下にしてください")
+    except UploadFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        if os.path.exists(file_path):
-            os.remove(file_path)
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/workflows/{workflow_id}/run", response_model=List[str])
-async def run_workflow(workflow_id: str, db: Session = Depends(get_db)):
+    return {
+        **reference,
+        "pages": len(document.pages),
+        "ocr_pages": document.ocr_pages,
+        "sha256": stored.sha256,
+    }
+
+@app.get("/documents/{blob_id}/text")
+def get_document_text(blob_id: str, db: Session = Depends(get_db)):
     """
-    ワークフローを実行します。
+    抽出した文書のテキスト全体を取得します。
+    テキストの内容はIDから変わらないため、キャッシュできます。
+
+    Args:
+        blob_id: テキストのID（ノードの設定の text_blob_id）
+        db: データベースセッション
+
+    Returns:
+        テキスト（text/plain）
+    """
+    text = DocumentBlobRepository(db).get_text(blob_id)
+    if text is None:
+        raise HTTPException(status_code=404, detail="文書のテキストが見つかりません")
+    return Response(
+        content=text,
+        media_type="text/plain; charset=utf-8",
+        headers={"ETag": f'"{blob_id}"', "Cache-Control": "public, max-age=31536000, immutable"}
+    )
+
+@app.post("/workflows/{workflow_id}/run", response_model=RunWorkflowResponse)
+async def run_workflow(workflow_id: str, intermediate: bool = False, db: Session = Depends(get_db)):
+    """
+    ワークフローを実行し、ノードごとの最終結果をまとめて返します。
+    途中経過を生成しないため、進捗表示が不要なAPI・バッチ利用ではSSEより低負荷です。
+    実行中は `POST /runs/{run_id}/cancel` でキャンセルできます。
 
     Args:
         workflow_id: ワークフローのID
+        intermediate: Trueの場合、まとめて実行した連続するフォーマッターの途中の結果も返す
         db: データベースセッション
 
     Returns:
-        ワークフローの実行結果（文字列の配列）
+        実行ID、全体のステータスと所要時間、ノードごとの結果と所要時間
     """
     try:
         if DEBUG_MODE:
@@ -179,25 +474,55 @@ async def run_workflow(workflow_id: str, db: Session = Depends(get_db)):
         if not workflow:
             raise HTTPException(status_code=404, detail="ワークフローが見つかりません")
 
-        nodes = [
-            {
-                "id": node.id,
-                "node_type": node.node_type,
-                "config": node.config
-            }
-            for node in workflow.nodes
-        ]
+        nodes = snapshot_nodes(workflow.nodes)
 
         if DEBUG_MODE:
-            logger.debug(f"実行するノード: {json.dumps(nodes, indent=2, ensure_ascii=False)}")
-
-        results = workflow_service.execute(nodes)
+            logger.debug("実行するノード: %s", LazyJSON(nodes))
+
+        run_id = await _admit(workflow_id)
+        async with admission.hold(run_id):
+            cancel_token = run_registry.register(run_id)
+            try:
+                results = await workflow_service.collect(nodes, RunContext(
+                    run_id=run_id, workflow_id=workflow_id, cancel_token=cancel_token, record_intermediate=intermediate
+                ))
+            finally:
+                run_registry.unregister(run_id)
+
+            if cancel_token.cancelled:
+                # 実行全体の予算を超えた場合は budget_exceeded
+                status, detail = cancelled_run_status(cancel_token), cancel_token.reason
+            elif any(result["status"] in FAILED_NODE_STATUSES for result in results):
+                # ノードの上限を超えた場合はエラー
+                status, detail = RunStatus.ERROR, next(
+                    result["result"] for result in results if result["status"] in FAILED_NODE_STATUSES
+                )
+            else:
+                status, detail = RunStatus.SUCCESS, None
+            await asyncio.to_thread(_record_run_status, run_id, status, detail)
 
         if DEBUG_MODE:
-            logger.debug(f"実行結果: {json.dumps(results, indent=2, ensure_ascii=False)}")
-
-        return results
+            logger.debug("実行結果: %s", LazyJSON(results))
+
+        return RunWorkflowResponse(
+            run_id=run_id,
+            status=status.value,
+            elapsed_ms=round(sum(result["elapsedMs"] for result in results), 3),
+            results=[
+                NodeRunResult(
+                    node_id=result["nodeId"],
+                    node_type=result["nodeType"],
+                    status=result["status"],
+                    result=result["result"],
+                    elapsed_ms=result["elapsedMs"],
+                    fused_into=result.get("fusedInto")
+                )
+                for result in results
+            ]
+        )
 
+    except HTTPException:
+        raise
     except ValueError as e:
         if DEBUG_MODE:
             logger.error(f"バリデーションエラー: {str(e)}")
@@ -215,6 +540,7 @@ async def update_nodes(
 ):
     node_repo = NodeRepository(db)
     updated_nodes = node_repo.update_nodes(workflow_id=workflow_id, nodes=nodes)
+    workflow_service.plan_cache.invalidate(workflow_id)
 
     if not updated_nodes:
         raise HTTPException(status_code=404, detail="No nodes found to update")
@@ -223,37 +549,76 @@ async def update_nodes(
 
 # REFACTOR: このstreamでワークフローを実行しているが、本来分けるべき。ステータスをRedis等で管理する。
 @app.get("/workflows/{wf_id}/run/stream")
-async def run_workflow_stream(wf_id: str, db: Session = Depends(get_db)):
+async def run_workflow_stream(wf_id: str, intermediate: bool = False, db: Session = Depends(get_db)):
     """
     ワークフローの実行状態をストリーミングします。
+    連続するフォーマッターはまとめて実行し、途中のノードには空の結果と fusedInto を返します
+    （intermediate=true の場合は途中の結果も返す）。
     """
     workflow_repo = WorkflowRepository(db)
     workflow = workflow_repo.get_workflow(wf_id)
     if not workflow:
         raise HTTPException(status_code=404, detail="Workflow not found")
 
+    nodes = snapshot_nodes(workflow.nodes)
+    # 上限を超える場合はストリームを開始する前に 429 を返す
+    run_id = await _admit(wf_id)
+
     async def event_generator():
+        async with admission.hold(run_id):
+            async for event in run_events():
+                yield event
+
+    async def run_events():
+        cancel_token = run_registry.register(run_id)
         try:
-            # ワークフローの実行を開始
-            workflow_service = WorkflowService(debug=DEBUG_MODE)
-            nodes = [
-                {
-                    "id": node.id,
-                    "node_type": node.node_type,
-                    "config": node.config
-                }
-                for node in workflow.nodes
-            ]
+            yield {
+                "event": "run_start",
+                "data": json.dumps({"runId": run_id}, ensure_ascii=False)
+            }
 
             # 実行順序に従ってノードを実行
-            async for result in workflow_service.execute(nodes):
+            context = RunContext(run_id=run_id, workflow_id=wf_id, cancel_token=cancel_token, record_intermediate=intermediate)
+            failure = None  # 最初に失敗したノードの結果
+            async for result in workflow_service.execute(nodes, context):
+                if failure is None and result["status"] in FAILED_NODE_STATUSES:
+                    failure = result["result"]
+                # 大きな結果のシリアライズはイベントループ外で行い、他のストリームの配信を止めない
                 yield {
                     "event": "node_update",
-                    "data": json.dumps(result, ensure_ascii=False)
+                    "data": await executors.run("serialize", dumps_json, result, size=len(result.get("result") or ""))
                 }
 
+            if cancel_token.cancelled:
+                # 実行全体の予算を超えた場合は、ユーザーのキャンセルと区別して run_budget_exceeded を送る
+                status = cancelled_run_status(cancel_token)
+                await asyncio.to_thread(_record_run_status, run_id, status, cancel_token.reason)
+                yield {
+                    "event": "run_budget_exceeded" if status == RunStatus.BUDGET_EXCEEDED else "run_cancelled",
+                    "data": json.dumps({
+                        "runId": run_id,
+                        "status": status.value,
+                        "timestamp": datetime.now().isoformat(),
+                        "result": cancel_token.reason
+                    }, ensure_ascii=False)
+                }
+            elif failure is not None:
+                # 失敗したノードがある実行はエラーとして記録する（チェックポイントを残し、再開できる）
+                await asyncio.to_thread(_record_run_status, run_id, RunStatus.ERROR, failure)
+            else:
+                await asyncio.to_thread(_record_run_status, run_id, RunStatus.SUCCESS)
+
+        except asyncio.CancelledError:
+            # クライアントが切断した場合、実行中のLLM呼び出しは中断済み
+            cancel_token.cancel("client_disconnected")
+            logger.info(f"Client disconnected, run cancelled: run_id={run_id}")
+            # キャンセルされたタスクではDBの更新を待てないため、hold を抜けるときに記録する
+            admission.finish_as(run_id, RunStatus.CANCELLED, cancel_token.reason)
+            raise
+
         except Exception as e:
             logger.error(f"Error in workflow execution: {str(e)}")
+            await asyncio.to_thread(_record_run_status, run_id, RunStatus.ERROR, str(e))
             yield {
                 "event": "workflow_error",
                 "data": json.dumps({
@@ -263,4 +628,174 @@ async def run_workflow_stream(wf_id: str, db: Session = Depends(get_db)):
                 }, ensure_ascii=False)
             }
 
-    return EventSourceResponse(event_generator())
+        finally:
+            run_registry.unregister(run_id)
+
+    return AdmittedEventSourceResponse(run_id, _count_sse_events("run_stream", event_generator()))
+
+@app.post("/runs/{run_id}/cancel")
+def cancel_run(run_id: str, db: Session = Depends(get_db)):
+    """
+    実行中のワークフローをキャンセルします。
+
+    Args:
+        run_id: 実行ID
+        db: データベースセッション
+
+    Returns:
+        実行IDとステータス
+    """
+    run_repo = RunRepository(db)
+    run = run_repo.get_run(run_id)
+    if not run:
+        raise HTTPException(status_code=404, detail="実行が見つかりません")
+
+    if run.status in TERMINAL_STATUSES:
+        return {"run_id": run.id, "status": run.status}
+
+    if run.status == RunStatus.QUEUED.value:
+        # まだどのワーカーも取得していない
+        run = run_repo.update_status(run_id, RunStatus.CANCELLED, "cancelled_by_user")
+        return {"run_id": run.id, "status": run.status}
+
+    # ワーカーや他のAPIプロセスで実行中の場合は、それぞれのハートビートでキャンセル要求が検知される
+    run = run_repo.update_status(run_id, RunStatus.CANCEL_REQUESTED, "cancelled_by_user")
+    run_registry.cancel(run_id, "cancelled_by_user")
+    return {"run_id": run.id, "status": run.status}
+
+@app.post("/runs/{run_id}/resume")
+def resume_run(run_id: str, db: Session = Depends(get_db)):
+    """
+    中断した実行（エラー・キャンセルで終了した実行、または実行していたプロセスが停止した実行）を再開します。
+    実行はキューに戻り、ワーカープロセス（worker.py）がチェックポイントから続きを実行します。
+    完了済みのノードとLLMの呼び出しは繰り返しません。イベントは `GET /runs/{run_id}/events` で購読できます。
+
+    Args:
+        run_id: 実行ID
+        db: データベースセッション
+
+    Returns:
+        実行IDとステータス
+    """
+    run_repo = RunRepository(db)
+    run = run_repo.get_run(run_id)
+    if not run:
+        raise HTTPException(status_code=404, detail="実行が見つかりません")
+
+    if run.status == RunStatus.QUEUED.value:
+        return {"run_id": run.id, "status": run.status}
+
+    resumed = run_repo.requeue_run(run_id, admission.stale_seconds)
+    if resumed:
+        logger.info(f"Run resumed: run_id={run_id}, previous_status={run.status}")
+        return {"run_id": resumed.id, "status": resumed.status}
+
+    db.refresh(run)
+    if run.status == RunStatus.SUCCESS.value:
+        raise HTTPException(status_code=409, detail="実行は完了しています")
+    if run.status == RunStatus.QUEUED.value:
+        return {"run_id": run.id, "status": run.status}
+    raise HTTPException(status_code=409, detail="実行中のため再開できません")
+
+@app.post("/workflows/{wf_id}/runs")
+def enqueue_run(wf_id: str, db: Session = Depends(get_db)):
+    """
+    ワークフローの実行をキューに登録します。
+    実行はワーカープロセス（worker.py）が行います。
+
+    Args:
+        wf_id: ワークフローのID
+        db: データベースセッション
+
+    Returns:
+        実行IDとステータス
+    """
+    workflow_repo = WorkflowRepository(db)
+    if not workflow_repo.get_workflow(wf_id):
+        raise HTTPException(status_code=404, detail="ワークフローが見つかりません")
+
+    run = RunRepository(db).enqueue_run(wf_id)
+    prune_checkpoints(SessionLocal)
+    return {"run_id": run.id, "status": run.status}
+
+@app.get("/runs/{run_id}")
+def get_run(run_id: str, db: Session = Depends(get_db)):
+    """
+    実行のステータスを取得します。
+    """
+    run = RunRepository(db).get_run(run_id)
+    if not run:
+        raise HTTPException(status_code=404, detail="実行が見つかりません")
+
+    return {
+        "run_id": run.id,
+        "workflow_id": run.workflow_id,
+        "status": run.status,
+        "status_detail": run.status_detail,
+        "worker_id": run.lease_owner,
+        "attempts": run.attempts,
+        "created_at": run.created_at,
+        "finished_at": run.finished_at,
+    }
+
+# ワーカーが記録したイベントをポーリングする間隔（秒）
+RUN_EVENT_POLL_SECONDS = float(os.getenv("RUN_EVENT_POLL_SECONDS", "0.5"))
+# 1回のポーリングで取得するイベントの最大数（残りは続けて取得する）
+RUN_EVENT_POLL_LIMIT = int(os.getenv("RUN_EVENT_POLL_LIMIT", "100"))
+
+def _poll_run_events(run_id: str, after_seq: int):
+    """
+    実行のステータスと after_seq より後のイベントを取得します。
+
+    Returns:
+        (イベントのリスト, 実行が終了していて残りのイベントがないかどうか)
+    """
+    db = SessionLocal()
+    try:
+        run_repo = RunRepository(db)
+        # ステータスを先に読むことで、終了後に記録されたイベントの取りこぼしを防ぐ
+        status = run_repo.get_run(run_id).status
+        events = [
+            (run_event.seq, run_event.event, run_event.data)
+            for run_event in run_repo.get_events(run_id, after_seq, limit=RUN_EVENT_POLL_LIMIT)
+        ]
+        return events, not events and status in TERMINAL_STATUSES
+    finally:
+        db.close()
+
+@app.get("/runs/{run_id}/events")
+def stream_run_events(run_id: str, request: Request, db: Session = Depends(get_db)):
+    """
+    ワーカーで実行中のワークフローのイベントを中継します。
+    どのAPIプロセスからでも同じ実行を購読でき、Last-Event-IDを指定すると続きから再開します。
+    接続を切っても実行はキャンセルされません。
+    """
+    if not RunRepository(db).get_run(run_id):
+        raise HTTPException(status_code=404, detail="実行が見つかりません")
+
+    last_event_id = request.headers.get("last-event-id")
+    after_seq = int(last_event_id) if last_event_id and last_event_id.isdigit() else -1
+
+    async def event_generator():
+        nonlocal after_seq
+        while True:
+            # DBの読み込みはスレッドで行い、購読者が多くても他のストリームの配信を止めない
+            events, finished = await asyncio.to_thread(_poll_run_events, run_id, after_seq)
+
+            for seq, event, data in events:
+                after_seq = seq
+                yield {"id": str(seq), "event": event, "data": data}
+
+            if finished:
+                return
+            if len(events) < RUN_EVENT_POLL_LIMIT:
+                await asyncio.sleep(RUN_EVENT_POLL_SECONDS)
+
+    return EventSourceResponse(_count_sse_events("run_events", event_generator()))
+
+@app.get("/metrics")
+def metrics():
+    """
+    メトリクスをPrometheusのテキスト形式で返します。
+    """
+    return Response(content=metrics_registry.render(), media_type=METRICS_CONTENT_TYPE)
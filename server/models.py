@@ -1,4 +1,4 @@
-from sqlalchemy import Column, DateTime, String, Integer, JSON, ForeignKey, Enum as SQLAlchemyEnum
+from sqlalchemy import Column, DateTime, Float, String, Integer, Text, JSON, ForeignKey, Index, LargeBinary, Enum as SQLAlchemyEnum
 from sqlalchemy.orm import relationship
 from typing import List
 from enum import Enum
@@ -17,8 +17,14 @@ class WorkflowDB(Base):
 
     id = Column(String, primary_key=True)
     name = Column(String, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
     nodes = relationship("NodeDB", back_populates="workflow", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        # 一覧のキーセットページネーション（作成日時順、同じ日時はID順）
+        Index("ix_workflows_created_at_id", "created_at", "id"),
+    )
+
 class NodeDB(Base):
     __tablename__ = "nodes"
 
@@ -32,6 +38,95 @@ class NodeDB(Base):
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     workflow = relationship("WorkflowDB", back_populates="nodes")
 
+    __table_args__ = (
+        Index("ix_nodes_workflow_id", "workflow_id"),
+    )
+
+class DocumentBlobDB(Base):
+    """抽出した文書のテキスト。ノードの設定とは別に圧縮して保存し、内容のSHA-256をIDとする（同じ内容は1件のみ）"""
+    __tablename__ = "document_blobs"
+
+    id = Column(String, primary_key=True)  # テキスト（UTF-8）のSHA-256
+    size = Column(Integer, nullable=False)  # 圧縮前のバイト数
+    data = Column(LargeBinary, nullable=False)  # zlibで圧縮したテキスト
+    created_at = Column(DateTime, default=datetime.utcnow)  # 同じ内容を保存し直した場合は更新する（参照されていないテキストの削除の猶予の起点）
+
+class RunStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    CANCEL_REQUESTED = "cancel_requested"
+    CANCELLED = "cancelled"
+    SUCCESS = "success"
+    ERROR = "error"
+    BUDGET_EXCEEDED = "budget_exceeded"  # 実行全体の予算（RUN_TIMEOUT_SECONDS など）を超えて中断した
+
+class RunDB(Base):
+    __tablename__ = "runs"
+
+    id = Column(String, primary_key=True)
+    workflow_id = Column(String, ForeignKey("workflows.id"), nullable=False, index=True)
+    status = Column(String, nullable=False, default=RunStatus.RUNNING.value)
+    status_detail = Column(String, nullable=True)  # キャンセル理由やエラー内容
+    lease_owner = Column(String, nullable=True)  # 実行中のワーカーID（API内で実行する場合はNone）
+    lease_expires_at = Column(DateTime, nullable=True)  # この時刻を過ぎたら他のワーカーが引き継げる
+    heartbeat_at = Column(DateTime, nullable=True)
+    attempts = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_runs_status_created_at", "status", "created_at"),
+    )
+
+class RunEventDB(Base):
+    """ワーカーが記録する実行イベント。どのAPIプロセスからでも中継できるようにDBに保存する"""
+    __tablename__ = "run_events"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    run_id = Column(String, ForeignKey("runs.id"), nullable=False)
+    seq = Column(Integer, nullable=False)
+    event = Column(String, nullable=False)
+    data = Column(Text, nullable=False)  # JSON文字列（SSEのdataにそのまま流す）
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_run_events_run_id_seq", "run_id", "seq", unique=True),
+    )
+
+class RunCheckpointDB(Base):
+    """実行のチェックポイント（完了したノードのイベントとLLMの応答）。中断した実行を再開するときに使用する"""
+    __tablename__ = "run_checkpoints"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    run_id = Column(String, ForeignKey("runs.id"), nullable=False)
+    key = Column(String, nullable=False)  # "node:{fingerprint}:{ノードID}" または "llm:{step}:{ハッシュ}:{回数}"
+    data = Column(LargeBinary, nullable=False)  # zlibで圧縮したJSON
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_run_checkpoints_run_id_key", "run_id", "key", unique=True),
+    )
+
+class RunLLMStatDB(Base):
+    """実行ごとのLLM呼び出しのモデル・処理ごとの集計。実行前の見積もりに、どのプロセスで実行した実行も反映するために使用する"""
+    __tablename__ = "run_llm_stats"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    run_id = Column(String, ForeignKey("runs.id"), nullable=False)
+    model = Column(String, nullable=False)
+    step = Column(String, nullable=False)  # 呼び出し元の処理（"plan", "task", "generative_ai" など）
+    calls = Column(Integer, nullable=False, default=0)  # 呼び出し回数（失敗を含む）
+    success_calls = Column(Integer, nullable=False, default=0)
+    success_seconds = Column(Float, nullable=False, default=0.0)  # 成功した呼び出しの合計時間
+    completion_calls = Column(Integer, nullable=False, default=0)  # 出力トークン数を記録した呼び出しの回数
+    completion_tokens = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_run_llm_stats_created_at", "created_at"),
+    )
+
 class Node(BaseModel):
     id: str
     node_type: NodeType
@@ -0,0 +1,135 @@
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from typing import Any, Dict, Optional, Set
+from datetime import datetime, timedelta
+import hashlib
+import os
+import zlib
+
+from models import DocumentBlobDB, NodeDB, NodeType
+
+# これより長い extracted_text はノードの設定から document_blobs に移す
+DOCUMENT_INLINE_MAX_CHARS = int(os.getenv("DOCUMENT_INLINE_MAX_CHARS", "4096"))
+# ノードの設定に残すテキストの先頭の文字数
+DOCUMENT_PREVIEW_CHARS = 500
+
+class DocumentBlobRepository:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def put(self, text: str) -> DocumentBlobDB:
+        """
+        テキストを圧縮して保存します。同じ内容のテキストが保存済みの場合はそれを返します。
+        コミットは呼び出し元で行います（ノードと同じトランザクションで保存するため）。
+
+        Args:
+            text: 保存するテキスト
+
+        Returns:
+            保存したテキスト（IDは内容のSHA-256）
+        """
+        data = text.encode("utf-8")
+        blob_id = hashlib.sha256(data).hexdigest()
+        blob = self.get(blob_id)
+        if blob:
+            # 参照されていないテキストの削除（prune_unreferenced）の猶予を、保存し直した時点から数える
+            blob.created_at = datetime.utcnow()
+            self.db.flush()
+            return blob
+
+        blob = DocumentBlobDB(id=blob_id, size=len(data), data=zlib.compress(data))
+        try:
+            # 重複した場合にセーブポイントまでを取り消し、同じセッションの他の変更は残す
+            with self.db.begin_nested():
+                self.db.add(blob)
+                self.db.flush()
+        except IntegrityError:
+            # 同じ内容が同時に保存された
+            return self.get(blob_id)
+        return blob
+
+    def prune_unreferenced(self, grace_seconds: int, batch_size: int = 1000) -> int:
+        """
+        どのノードの設定からも参照されていないテキストを削除します。
+
+        アップロードしたテキストは、クライアントがノードを保存するまで参照されないため、
+        保存（または保存し直し）から grace_seconds 以内のテキストは削除しません。
+
+        Args:
+            grace_seconds: 保存してから削除の対象にするまでの秒数
+            batch_size: 一度に読み込むノード・削除するテキストの数
+
+        Returns:
+            削除したテキストの数
+        """
+        expired = [
+            blob_id for (blob_id,) in
+            self.db.query(DocumentBlobDB.id).filter(
+                DocumentBlobDB.created_at < datetime.utcnow() - timedelta(seconds=grace_seconds)
+            )
+        ]
+        if not expired:
+            return 0
+
+        unreferenced = set(expired) - self._referenced_blob_ids(batch_size)
+        deleted = 0
+        blob_ids = list(unreferenced)
+        for start in range(0, len(blob_ids), batch_size):
+            deleted += self.db.query(DocumentBlobDB).filter(
+                DocumentBlobDB.id.in_(blob_ids[start:start + batch_size]),
+                # 集計中に保存し直されたテキストは残す
+                DocumentBlobDB.created_at < datetime.utcnow() - timedelta(seconds=grace_seconds)
+            ).delete(synchronize_session=False)
+        self.db.commit()
+        return deleted
+
+    def _referenced_blob_ids(self, batch_size: int) -> Set[str]:
+        """テキスト抽出ノードの設定から参照されているテキストのIDを、ノードを batch_size 件ずつ読み込んで集めます。"""
+        referenced: Set[str] = set()
+        query = self.db.query(NodeDB.id, NodeDB.config).filter(
+            NodeDB.node_type == NodeType.EXTRACT_TEXT.value
+        ).order_by(NodeDB.id)
+        last_id = None
+        while True:
+            rows = (query if last_id is None else query.filter(NodeDB.id > last_id)).limit(batch_size).all()
+            if not rows:
+                return referenced
+            last_id = rows[-1][0]
+            for _, config in rows:
+                if isinstance(config, dict) and config.get("text_blob_id"):
+                    referenced.add(config["text_blob_id"])
+
+    def get(self, blob_id: str) -> Optional[DocumentBlobDB]:
+        return self.db.query(DocumentBlobDB).filter(DocumentBlobDB.id == blob_id).first()
+
+    def get_text(self, blob_id: str) -> Optional[str]:
+        blob = self.get(blob_id)
+        if not blob:
+            return None
+        return zlib.decompress(blob.data).decode("utf-8")
+
+    def reference(self, blob: DocumentBlobDB, text: str) -> Dict[str, Any]:
+        """ノードの設定に保存する、テキストへの参照（ID・先頭・サイズ）を返します。"""
+        return {
+            "text_blob_id": blob.id,
+            "text_preview": text[:DOCUMENT_PREVIEW_CHARS],
+            "text_size": blob.size,
+        }
+
+    def externalize(self, config: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        設定の extracted_text が長い場合は保存し、テキストへの参照に置き換えた設定を返します。
+
+        Args:
+            config: テキスト抽出ノードの設定
+
+        Returns:
+            extracted_text を text_blob_id・text_preview・text_size に置き換えた設定（短い場合はそのまま）
+        """
+        text = config.get("extracted_text")
+        if not isinstance(text, str) or len(text) <= DOCUMENT_INLINE_MAX_CHARS:
+            return config
+        blob = self.put(text)
+        externalized = {key: value for key, value in config.items() if key != "extracted_text"}
+        externalized.update(self.reference(blob, text))
+        return externalized
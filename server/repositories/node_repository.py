@@ -1,14 +1,24 @@
+from sqlalchemy import Text, cast, func
 from sqlalchemy.orm import Session
 from uuid import uuid4
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple
+from datetime import datetime
 
-from models import NodeDB
+from models import NodeDB, NodeType
+from repositories.document_blob_repository import DOCUMENT_INLINE_MAX_CHARS, DocumentBlobRepository
 
 class NodeRepository:
     def __init__(self, db: Session):
         self.db = db
 
+    def _externalize(self, node_type: str, config: dict) -> dict:
+        """テキスト抽出ノードの長いテキストを document_blobs に移します。"""
+        if node_type != NodeType.EXTRACT_TEXT.value:
+            return config
+        return DocumentBlobRepository(self.db).externalize(config)
+
     def add_node(self, workflow_id: str, node_type: str, config: dict) -> NodeDB:
+        config = self._externalize(node_type, config)
         node_id = str(uuid4())
         new_node = NodeDB(
             id=node_id,
@@ -21,6 +31,37 @@ class NodeRepository:
         self.db.refresh(new_node)
         return new_node
 
+    def add_nodes(self, workflow_id: str, nodes: List[Tuple[str, dict]]) -> List[NodeDB]:
+        """
+        複数のノードを1つのトランザクションで追加します。
+
+        Args:
+            workflow_id: ワークフローID
+            nodes: 追加するノードの (ノードタイプ, 設定) のリスト。エッジは設定に含める
+
+        Returns:
+            追加されたノードのリスト（引数と同じ順）
+        """
+        now = datetime.utcnow()
+        new_nodes = [
+            NodeDB(
+                id=str(uuid4()),
+                workflow_id=workflow_id,
+                node_type=node_type,
+                config=self._externalize(node_type, config),
+                created_at=now,
+                updated_at=now
+            )
+            for node_type, config in nodes
+        ]
+        self.db.add_all(new_nodes)
+        self.db.commit()
+
+        # コミットで失効した属性を、ノードごとではなく1回のクエリで読み込み直す
+        node_ids = [node.id for node in new_nodes]
+        loaded = {node.id: node for node in self.db.query(NodeDB).filter(NodeDB.id.in_(node_ids))}
+        return [loaded[node_id] for node_id in node_ids]
+
     def update_nodes(self, workflow_id: str, nodes: List[Dict[str, Any]]) -> List[NodeDB]:
         """
         複数のノードをまとめて更新します。
@@ -40,11 +81,48 @@ class NodeRepository:
             ).first()
 
             if node:
-                node.config = node_data['config']
+                node.config = self._externalize(node.node_type, node_data['config'])
                 updated_nodes.append(node)
 
         self.db.commit()
         for node in updated_nodes:
             self.db.refresh(node)
 
-        return updated_nodes
\ No newline at end of file
+        return updated_nodes
+
+    def migrate_document_text(self, batch_size: int = 100) -> int:
+        """
+        設定に長い extracted_text を持つ既存のテキスト抽出ノードを、document_blobs への参照に移行します。
+
+        対象はSQLで絞り込み（extracted_text を含み、設定全体が DOCUMENT_INLINE_MAX_CHARS 文字より長いノード）、
+        batch_size 件ずつ読み込んでバッチごとにコミットします。移行済みの場合は1回のクエリで終わります。
+        複数のプロセスが同時に移行しても、テキストは内容のハッシュで保存されるため同じ結果になります。
+
+        Args:
+            batch_size: 一度に読み込むノードの数
+
+        Returns:
+            移行したノードの数
+        """
+        config_text = cast(NodeDB.config, Text)
+        candidates = self.db.query(NodeDB).filter(
+            NodeDB.node_type == NodeType.EXTRACT_TEXT.value,
+            config_text.like('%"extracted_text"%'),
+            func.length(config_text) > DOCUMENT_INLINE_MAX_CHARS
+        ).order_by(NodeDB.id)
+
+        migrated = 0
+        last_id = None
+        while True:
+            # 短いテキストのため移行しなかったノードを読み直さないよう、IDの順に進める
+            batch = candidates if last_id is None else candidates.filter(NodeDB.id > last_id)
+            nodes = batch.limit(batch_size).all()
+            if not nodes:
+                return migrated
+            last_id = nodes[-1].id
+            for node in nodes:
+                config = self._externalize(node.node_type, node.config)
+                if config is not node.config:
+                    node.config = config
+                    migrated += 1
+            self.db.commit()
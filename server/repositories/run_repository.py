@@ -0,0 +1,387 @@
+from sqlalchemy import or_, and_, func, case, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from uuid import uuid4
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+import json
+import zlib
+
+from models import RunCheckpointDB, RunDB, RunEventDB, RunLLMStatDB, RunStatus
+
+# これ以上状態が変化しない実行ステータス
+TERMINAL_STATUSES = {
+    RunStatus.CANCELLED.value, RunStatus.SUCCESS.value, RunStatus.ERROR.value, RunStatus.BUDGET_EXCEEDED.value
+}
+# 同時実行数に数える実行ステータス
+ACTIVE_STATUSES = (RunStatus.RUNNING.value, RunStatus.CANCEL_REQUESTED.value)
+# 実行の受け付けを直列化するPostgreSQLの勧告ロックのキー
+RUN_ADMISSION_LOCK_KEY = 4_172_031_001
+
+class RunRepository:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def create_run(self, workflow_id: str) -> RunDB:
+        run = RunDB(id=str(uuid4()), workflow_id=workflow_id, status=RunStatus.RUNNING.value)
+        self.db.add(run)
+        self.db.commit()
+        self.db.refresh(run)
+        return run
+
+    def start_run_if_capacity(
+        self,
+        workflow_id: str,
+        max_concurrent: int,
+        max_per_workflow: int,
+        stale_seconds: int
+    ) -> Optional[RunDB]:
+        """
+        実行中の数が上限未満の場合のみ、実行を開始状態で作成します。
+
+        実行中の数は、直近 stale_seconds 秒以内にハートビートのある実行中の行（APIプロセス・ワーカーの両方）から数えるため、
+        プロセスが停止して残った行は上限に含まれません。
+        先に行を挿入してから数えることで、SQLiteでは書き込みロックにより他のプロセスと直列化されます。
+        PostgreSQLでは勧告ロックで直列化します。
+
+        Args:
+            workflow_id: ワークフローID
+            max_concurrent: 全体の同時実行数の上限
+            max_per_workflow: ワークフローごとの同時実行数の上限
+            stale_seconds: ハートビートがこの秒数より古い実行は数えない
+
+        Returns:
+            作成した実行（上限に達している場合はNone）
+        """
+        now = datetime.utcnow()
+        if self.db.bind.dialect.name == "postgresql":
+            self.db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": RUN_ADMISSION_LOCK_KEY})
+
+        run = RunDB(id=str(uuid4()), workflow_id=workflow_id, status=RunStatus.RUNNING.value, heartbeat_at=now)
+        self.db.add(run)
+        self.db.flush()
+
+        if self._over_capacity(workflow_id, max_concurrent, max_per_workflow, now - timedelta(seconds=stale_seconds)):
+            self.db.rollback()
+            return None
+        self.db.commit()
+        self.db.refresh(run)
+        return run
+
+    def _over_capacity(self, workflow_id: str, max_concurrent: int, max_per_workflow: int, fresh_after: datetime) -> bool:
+        """開始した実行を含めて数えた実行中の数が、全体またはワークフローごとの上限を超えているかどうかを返します。"""
+        active, active_in_workflow = self.db.query(
+            func.count(RunDB.id),
+            func.coalesce(func.sum(case((RunDB.workflow_id == workflow_id, 1), else_=0)), 0)
+        ).filter(
+            RunDB.status.in_(ACTIVE_STATUSES),
+            RunDB.heartbeat_at >= fresh_after
+        ).one()
+        return active > max_concurrent or active_in_workflow > max_per_workflow
+
+    def touch_runs(self, run_ids: List[str]) -> Dict[str, str]:
+        """
+        APIプロセスで実行中の実行のハートビートを更新します。
+
+        Returns:
+            キャンセルが要求されている実行のID -> 理由（他のAPIプロセスで受け付けたキャンセル要求）
+        """
+        if not run_ids:
+            return {}
+        self.db.query(RunDB).filter(
+            RunDB.id.in_(run_ids),
+            RunDB.status.in_(ACTIVE_STATUSES)
+        ).update({RunDB.heartbeat_at: datetime.utcnow()}, synchronize_session=False)
+        self.db.commit()
+        rows = self.db.query(RunDB.id, RunDB.status_detail).filter(
+            RunDB.id.in_(run_ids),
+            RunDB.status == RunStatus.CANCEL_REQUESTED.value
+        ).all()
+        return {run_id: detail or "cancelled_by_user" for run_id, detail in rows}
+
+    def enqueue_run(self, workflow_id: str) -> RunDB:
+        """ワーカーが実行する実行をキューに追加します。"""
+        run = RunDB(id=str(uuid4()), workflow_id=workflow_id, status=RunStatus.QUEUED.value)
+        self.db.add(run)
+        self.db.commit()
+        self.db.refresh(run)
+        return run
+
+    def get_run(self, run_id: str) -> Optional[RunDB]:
+        return self.db.query(RunDB).filter(RunDB.id == run_id).first()
+
+    def update_status(self, run_id: str, status: RunStatus, detail: Optional[str] = None) -> Optional[RunDB]:
+        """
+        実行ステータスを更新します。
+        終了済みの実行は上書きしません。
+
+        Args:
+            run_id: 実行ID
+            status: 新しいステータス
+            detail: キャンセル理由やエラー内容
+
+        Returns:
+            更新後の実行（存在しない場合はNone）
+        """
+        run = self.get_run(run_id)
+        if not run or run.status in TERMINAL_STATUSES:
+            return run
+
+        run.status = status.value
+        if detail is not None:
+            run.status_detail = detail
+        if status.value in TERMINAL_STATUSES:
+            run.finished_at = datetime.utcnow()
+            run.lease_owner = None
+            run.lease_expires_at = None
+        if status == RunStatus.SUCCESS:
+            # 成功した実行は再開しないため、チェックポイントは不要
+            self.db.query(RunCheckpointDB).filter(RunCheckpointDB.run_id == run_id).delete(synchronize_session=False)
+
+        self.db.commit()
+        self.db.refresh(run)
+        return run
+
+    def requeue_run(self, run_id: str, stale_seconds: int) -> Optional[RunDB]:
+        """
+        中断した実行を、ワーカーが再開できるようにキューに戻します。
+
+        対象は、エラー・キャンセル・予算超過で終了した実行と、実行していたプロセスが停止した実行
+        （ワーカーのリースが切れた実行、またはAPIプロセスのハートビートが stale_seconds 秒より古い実行）です。
+        チェックポイントは残るため、再開した実行は完了済みのノードとLLMの呼び出しを繰り返しません。
+
+        Args:
+            run_id: 実行ID
+            stale_seconds: ハートビートがこの秒数より古いAPIプロセスの実行は停止したものとみなす
+
+        Returns:
+            キューに戻した実行（対象外の場合はNone）
+        """
+        now = datetime.utcnow()
+        requeued = self.db.query(RunDB).filter(
+            RunDB.id == run_id,
+            or_(
+                RunDB.status.in_([RunStatus.ERROR.value, RunStatus.CANCELLED.value, RunStatus.BUDGET_EXCEEDED.value]),
+                and_(
+                    RunDB.status.in_(ACTIVE_STATUSES),
+                    or_(
+                        and_(RunDB.lease_owner.isnot(None), RunDB.lease_expires_at < now),
+                        and_(
+                            RunDB.lease_owner.is_(None),
+                            or_(RunDB.heartbeat_at.is_(None), RunDB.heartbeat_at < now - timedelta(seconds=stale_seconds))
+                        )
+                    )
+                )
+            )
+        ).update({
+            RunDB.status: RunStatus.QUEUED.value,
+            RunDB.status_detail: "resumed",
+            RunDB.lease_owner: None,
+            RunDB.lease_expires_at: None,
+            RunDB.finished_at: None
+        }, synchronize_session=False)
+        self.db.commit()
+
+        if requeued == 0:
+            return None
+        return self.get_run(run_id)
+
+    def claim_next_run(
+        self,
+        worker_id: str,
+        lease_seconds: int,
+        max_concurrent: int,
+        max_per_workflow: int,
+        stale_seconds: int
+    ) -> Optional[RunDB]:
+        """
+        キューから実行を1件取得し、リースを設定します。
+
+        `FOR UPDATE SKIP LOCKED` で他のワーカーがロック中の行を読み飛ばすため、
+        複数のワーカーが同じ実行を取得することはありません。
+        リースが切れた実行（ワーカーが停止した実行）も再取得の対象になります。
+        APIの受け付け（start_run_if_capacity）と同じ同時実行数の上限を守り、上限に達しているワークフローの実行は取得しません。
+
+        Args:
+            worker_id: ワーカーID
+            lease_seconds: リースの有効期間（秒）
+            max_concurrent: 全体の同時実行数の上限
+            max_per_workflow: ワークフローごとの同時実行数の上限
+            stale_seconds: ハートビートがこの秒数より古い実行は同時実行数に数えない
+
+        Returns:
+            取得した実行（キューが空の場合、または上限に達している場合はNone）
+        """
+        now = datetime.utcnow()
+        fresh_after = now - timedelta(seconds=stale_seconds)
+        if self.db.bind.dialect.name == "postgresql":
+            self.db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": RUN_ADMISSION_LOCK_KEY})
+
+        active = self.db.query(RunDB.workflow_id).filter(
+            RunDB.status.in_(ACTIVE_STATUSES),
+            RunDB.heartbeat_at >= fresh_after
+        )
+        if active.count() >= max_concurrent:
+            self.db.rollback()
+            return None
+        # 上限に達しているワークフローの実行は読み飛ばし、他のワークフローの実行を待たせない
+        full_workflows = active.group_by(RunDB.workflow_id).having(func.count(RunDB.id) >= max_per_workflow)
+
+        run = self.db.query(RunDB).filter(
+            or_(
+                RunDB.status == RunStatus.QUEUED.value,
+                and_(
+                    RunDB.status.in_([RunStatus.RUNNING.value, RunStatus.CANCEL_REQUESTED.value]),
+                    RunDB.lease_owner.isnot(None),
+                    RunDB.lease_expires_at < now
+                )
+            ),
+            RunDB.workflow_id.notin_(full_workflows.scalar_subquery())
+        ).order_by(RunDB.created_at).with_for_update(skip_locked=True).first()
+
+        if not run:
+            self.db.rollback()
+            return None
+
+        # 行ロックを持たないDB（SQLiteなど）でも二重取得しないよう、取得時の状態を条件に更新する
+        claimed = self.db.query(RunDB).filter(
+            RunDB.id == run.id,
+            RunDB.status == run.status,
+            RunDB.lease_owner.is_(None) if run.lease_owner is None else RunDB.lease_owner == run.lease_owner
+        ).update({
+            RunDB.status: RunStatus.RUNNING.value if run.status == RunStatus.QUEUED.value else run.status,
+            RunDB.lease_owner: worker_id,
+            RunDB.lease_expires_at: now + timedelta(seconds=lease_seconds),
+            RunDB.heartbeat_at: now,
+            RunDB.attempts: RunDB.attempts + 1
+        }, synchronize_session=False)
+
+        # 取得してから数え直す（SQLiteでは更新の書き込みロックにより、他のプロセスの受け付けと直列化される）
+        if claimed == 0 or self._over_capacity(run.workflow_id, max_concurrent, max_per_workflow, fresh_after):
+            self.db.rollback()
+            return None
+        self.db.commit()
+        return self.get_run(run.id)
+
+    def heartbeat(self, run_id: str, worker_id: str, lease_seconds: int) -> Optional[RunDB]:
+        """
+        リースを延長します。
+
+        Returns:
+            延長後の実行。リースを他のワーカーに奪われていた場合はNone
+        """
+        now = datetime.utcnow()
+        extended = self.db.query(RunDB).filter(
+            RunDB.id == run_id,
+            RunDB.lease_owner == worker_id
+        ).update({
+            RunDB.lease_expires_at: now + timedelta(seconds=lease_seconds),
+            RunDB.heartbeat_at: now
+        }, synchronize_session=False)
+        self.db.commit()
+
+        if extended == 0:
+            return None
+        return self.get_run(run_id)
+
+    def next_event_seq(self, run_id: str) -> int:
+        last_seq = self.db.query(func.max(RunEventDB.seq)).filter(RunEventDB.run_id == run_id).scalar()
+        return 0 if last_seq is None else last_seq + 1
+
+    def append_event(self, run_id: str, seq: int, event: str, data: str) -> RunEventDB:
+        run_event = RunEventDB(run_id=run_id, seq=seq, event=event, data=data)
+        self.db.add(run_event)
+        self.db.commit()
+        return run_event
+
+    def get_events(self, run_id: str, after_seq: int = -1, limit: int = 100) -> List[RunEventDB]:
+        return self.db.query(RunEventDB).filter(
+            RunEventDB.run_id == run_id,
+            RunEventDB.seq > after_seq
+        ).order_by(RunEventDB.seq).limit(limit).all()
+
+    def get_checkpoint(self, run_id: str, key: str) -> Optional[Any]:
+        """チェックポイントを返します（存在しない場合はNone）。"""
+        data = self.db.query(RunCheckpointDB.data).filter(
+            RunCheckpointDB.run_id == run_id,
+            RunCheckpointDB.key == key
+        ).scalar()
+        if data is None:
+            return None
+        return json.loads(zlib.decompress(data).decode("utf-8"))
+
+    def put_checkpoint(self, run_id: str, key: str, value: Any) -> None:
+        """
+        チェックポイントを保存します。同じキーのチェックポイントが保存済みの場合は何もしません。
+
+        Args:
+            run_id: 実行ID
+            key: チェックポイントのキー
+            value: JSONに変換できる値
+        """
+        data = zlib.compress(json.dumps(value, ensure_ascii=False).encode("utf-8"))
+        self.db.add(RunCheckpointDB(run_id=run_id, key=key, data=data))
+        try:
+            self.db.commit()
+        except IntegrityError:
+            # 引き継いだ実行が同じ結果を保存した
+            self.db.rollback()
+
+    def prune_checkpoints(self, ttl_seconds: int) -> int:
+        """
+        終了してから ttl_seconds を過ぎた実行（再開されなかったエラー・キャンセルの実行など）のチェックポイントを削除します。
+
+        Args:
+            ttl_seconds: 終了後にチェックポイントを残す秒数
+
+        Returns:
+            削除したチェックポイントの数
+        """
+        expired = self.db.query(RunDB.id).filter(
+            RunDB.status.in_(TERMINAL_STATUSES),
+            RunDB.finished_at < datetime.utcnow() - timedelta(seconds=ttl_seconds)
+        )
+        deleted = self.db.query(RunCheckpointDB).filter(
+            RunCheckpointDB.run_id.in_(expired.scalar_subquery())
+        ).delete(synchronize_session=False)
+        self.db.commit()
+        return deleted
+
+    def count_checkpoints(self, run_id: str) -> int:
+        return self.db.query(func.count(RunCheckpointDB.id)).filter(RunCheckpointDB.run_id == run_id).scalar()
+
+    def add_llm_stats(self, run_id: str, stats: Dict[Tuple[str, str], Dict[str, float]]) -> None:
+        """
+        実行のLLM呼び出しの集計を保存します。
+
+        Args:
+            run_id: 実行ID
+            stats: (モデル, 処理) -> 集計（calls, success_calls, success_seconds, completion_calls, completion_tokens）
+        """
+        for (model, step), values in stats.items():
+            self.db.add(RunLLMStatDB(run_id=run_id, model=model, step=step, **values))
+        self.db.commit()
+
+    def llm_stats(self, since_seconds: int) -> Dict[Tuple[str, str], Dict[str, float]]:
+        """
+        直近 since_seconds に保存したLLM呼び出しの集計を、モデル・処理ごとに合計して返します。
+
+        Returns:
+            (モデル, 処理) -> 集計（calls, success_calls, success_seconds, completion_calls, completion_tokens）
+        """
+        columns = ("calls", "success_calls", "success_seconds", "completion_calls", "completion_tokens")
+        rows = self.db.query(
+            RunLLMStatDB.model, RunLLMStatDB.step,
+            *(func.sum(getattr(RunLLMStatDB, column)) for column in columns)
+        ).filter(
+            RunLLMStatDB.created_at >= datetime.utcnow() - timedelta(seconds=since_seconds)
+        ).group_by(RunLLMStatDB.model, RunLLMStatDB.step).all()
+        return {(row[0], row[1]): dict(zip(columns, (value or 0 for value in row[2:]))) for row in rows}
+
+    def prune_llm_stats(self, ttl_seconds: int) -> int:
+        """保存してから ttl_seconds を過ぎたLLM呼び出しの集計を削除し、削除した数を返します。"""
+        deleted = self.db.query(RunLLMStatDB).filter(
+            RunLLMStatDB.created_at < datetime.utcnow() - timedelta(seconds=ttl_seconds)
+        ).delete(synchronize_session=False)
+        self.db.commit()
+        return deleted
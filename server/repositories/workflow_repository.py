@@ -1,6 +1,9 @@
+from sqlalchemy import func, or_, select
 from sqlalchemy.orm import Session
 from uuid import uuid4
-from models import WorkflowDB
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from models import NodeDB, WorkflowDB
 from sqlalchemy.orm import joinedload
 
 class WorkflowRepository:
@@ -18,4 +21,88 @@ class WorkflowRepository:
     def get_workflow(self, wf_id: str) -> WorkflowDB:
         return self.db.query(WorkflowDB).options(
             joinedload(WorkflowDB.nodes)
-        ).filter(WorkflowDB.id == wf_id).first()
\ No newline at end of file
+        ).filter(WorkflowDB.id == wf_id).first()
+
+    def exists(self, wf_id: str) -> bool:
+        """ノードを読み込まずに、ワークフローが存在するかどうかを返します。"""
+        return self.db.query(WorkflowDB.id).filter(WorkflowDB.id == wf_id).first() is not None
+
+    def list_workflows(
+        self,
+        limit: int,
+        after: Optional[Tuple[datetime, str]] = None,
+        descending: bool = True
+    ) -> List[Tuple[str, str, datetime]]:
+        """
+        ワークフローを作成日時順に取得します（キーセットページネーション）。
+        ノードの設定は読み込みません。
+
+        (created_at, id) のインデックスを前回の最後の行から読み進めるため、
+        何ページ目でも1ページの取得にかかる時間は変わりません。
+
+        Args:
+            limit: 取得する件数
+            after: 前のページの最後の行の (created_at, id)。最初のページはNone
+            descending: 新しい順に取得するかどうか
+
+        Returns:
+            (id, name, created_at) のリスト
+        """
+        query = self.db.query(WorkflowDB.id, WorkflowDB.name, WorkflowDB.created_at)
+        if after:
+            created_at, wf_id = after
+            # 先頭の created_at の範囲条件でインデックスを使って読み始める（ORだけではインデックスの範囲検索にならない）
+            if descending:
+                query = query.filter(
+                    WorkflowDB.created_at <= created_at,
+                    or_(WorkflowDB.created_at < created_at, WorkflowDB.id < wf_id)
+                )
+            else:
+                query = query.filter(
+                    WorkflowDB.created_at >= created_at,
+                    or_(WorkflowDB.created_at > created_at, WorkflowDB.id > wf_id)
+                )
+        if descending:
+            query = query.order_by(WorkflowDB.created_at.desc(), WorkflowDB.id.desc())
+        else:
+            query = query.order_by(WorkflowDB.created_at.asc(), WorkflowDB.id.asc())
+        return [tuple(row) for row in query.limit(limit)]
+
+    def count_nodes(self, wf_ids: List[str]) -> Dict[str, int]:
+        """
+        ワークフローごとのノード数を1回の集計クエリで取得します。
+
+        Args:
+            wf_ids: ワークフローIDのリスト
+
+        Returns:
+            ワークフローID -> ノード数（ノードのないワークフローは含まない）
+        """
+        if not wf_ids:
+            return {}
+        rows = self.db.execute(
+            select(NodeDB.workflow_id, func.count())
+            .where(NodeDB.workflow_id.in_(wf_ids))
+            .group_by(NodeDB.workflow_id)
+        )
+        return {wf_id: count for wf_id, count in rows}
+
+    def backfill_created_at(self) -> int:
+        """
+        created_at のないワークフロー（列の追加前に作成されたもの）に、最初のノードの作成日時
+        （ノードがない場合は現在時刻）を設定します。
+
+        Returns:
+            更新したワークフローの数
+        """
+        first_node_created_at = (
+            select(func.min(NodeDB.created_at))
+            .where(NodeDB.workflow_id == WorkflowDB.id)
+            .scalar_subquery()
+        )
+        updated = self.db.query(WorkflowDB).filter(WorkflowDB.created_at.is_(None)).update(
+            {WorkflowDB.created_at: func.coalesce(first_node_created_at, datetime.utcnow())},
+            synchronize_session=False
+        )
+        self.db.commit()
+        return updated
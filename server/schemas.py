@@ -1,5 +1,6 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
+from datetime import datetime
 from models import NodeType
 
 class NodeConfig(BaseModel):
@@ -21,7 +22,10 @@ class ExtractTextConfig(WorkflowConfig):
     file_name: str
     file_size: int
     file_type: str
-    extracted_text: str
+    extracted_text: Optional[str] = None  # 短いテキストのみ。長いテキストは document_blobs に保存する
+    text_blob_id: Optional[str] = None
+    text_preview: Optional[str] = None
+    text_size: Optional[int] = None
 
 class GenerativeAIConfig(WorkflowConfig):
     prompt: str
@@ -51,6 +55,53 @@ class AddNodeRequest(BaseModel):
     node_type: NodeType
     config: Dict[str, Any]
 
+class AddNodeResponse(BaseModel):
+    message: str
+    node_id: str
+    node: NodeResponse
+
+# 一度に追加できるノードの最大数
+NODE_BATCH_MAX = 500
+
+class AddNodesRequest(BaseModel):
+    nodes: List[AddNodeRequest] = Field(..., min_length=1, max_length=NODE_BATCH_MAX)
+
+class AddNodesResponse(BaseModel):
+    nodes: List[NodeResponse]  # リクエストと同じ順
+
+class WorkflowSummary(BaseModel):
+    id: str
+    name: str
+    created_at: datetime
+    node_count: int
+
+class WorkflowListResponse(BaseModel):
+    items: List[WorkflowSummary]
+    next_cursor: Optional[str] = None  # 次のページのカーソル（最後のページの場合はNone）
+
+class EstimateRange(BaseModel):
+    expected: float  # 想定される値（エージェントは最初のイテレーションで品質チェックを通過する場合）
+    max: float  # エージェントが上限まで改善を繰り返した場合の値
+
+class NodeEstimate(BaseModel):
+    node_id: str
+    node_type: NodeType
+    model: Optional[str] = None
+    llm_calls: EstimateRange
+    input_tokens: EstimateRange
+    output_tokens: EstimateRange
+    wall_seconds: EstimateRange
+    error: Optional[str] = None  # 設定の検証エラー（実行時にこのノードはエラーになる）
+
+class WorkflowEstimateResponse(BaseModel):
+    workflow_id: str
+    llm_calls: EstimateRange
+    input_tokens: EstimateRange
+    output_tokens: EstimateRange
+    wall_seconds: EstimateRange
+    history_calls: int  # 見積もりに使用したLLM呼び出しの記録の数（0の場合は既定値のみ）
+    nodes: List[NodeEstimate]  # 実行順
+
 class WorkflowDetailResponse(BaseModel):
     id: str
     name: str
@@ -58,3 +109,17 @@ class WorkflowDetailResponse(BaseModel):
 
 class WorkflowExecutionResult(BaseModel):
     outputs: Dict[str, Any]
+
+class NodeRunResult(BaseModel):
+    node_id: str
+    node_type: NodeType
+    status: str
+    result: str
+    elapsed_ms: float
+    fused_into: Optional[str] = None  # まとめて実行された場合、結果を返したノードのID
+
+class RunWorkflowResponse(BaseModel):
+    run_id: str
+    status: str
+    elapsed_ms: float
+    results: List[NodeRunResult]
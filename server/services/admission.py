@@ -0,0 +1,252 @@
+"""
+ワークフロー実行の受け付け制御
+
+全体とワークフローごとの同時実行数の上限を、runs テーブルの実行中の行から数えるため、
+APIプロセスが複数あってもワーカー（worker.py）の実行を含めて上限が守られます。
+上限に達している場合は、プロセスごとの待ち行列で空きを待ち、待ち行列が一杯の場合や
+待機時間を過ぎた場合は AdmissionRejected を送出します（APIは 429 と Retry-After を返す）。
+
+環境変数:
+    RUN_MAX_CONCURRENT: 全体の同時実行数の上限（既定32）
+    RUN_MAX_PER_WORKFLOW: ワークフローごとの同時実行数の上限（既定4）
+    RUN_QUEUE_MAX: このプロセスで空きを待てる実行の数（既定64）。超えた場合はすぐに拒否する
+    RUN_QUEUE_TIMEOUT_SECONDS: 空きを待つ最大時間（既定10秒。0の場合は待たずに拒否する）
+    RUN_HEARTBEAT_SECONDS: APIプロセスで実行中の実行のハートビートの間隔（既定10秒）。
+        他のAPIプロセスで受け付けたキャンセル要求もこの間隔で検知する
+    RUN_STALE_SECONDS: ハートビートがこの秒数より古い実行は同時実行数に数えない（既定60秒）
+"""
+import asyncio
+import logging
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Dict, Optional, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+from models import RunStatus
+from repositories.run_repository import RunRepository
+from services.metrics import RUN_ADMISSIONS, RUN_QUEUE_WAIT
+
+logger = logging.getLogger('WorkflowApp')
+
+RUN_MAX_CONCURRENT = int(os.getenv("RUN_MAX_CONCURRENT", "32"))
+RUN_MAX_PER_WORKFLOW = int(os.getenv("RUN_MAX_PER_WORKFLOW", "4"))
+RUN_QUEUE_MAX = int(os.getenv("RUN_QUEUE_MAX", "64"))
+RUN_QUEUE_TIMEOUT_SECONDS = float(os.getenv("RUN_QUEUE_TIMEOUT_SECONDS", "10"))
+RUN_HEARTBEAT_SECONDS = float(os.getenv("RUN_HEARTBEAT_SECONDS", "10"))
+RUN_STALE_SECONDS = int(os.getenv("RUN_STALE_SECONDS", "60"))
+
+# 他のプロセスの実行が終わったことは通知されないため、この間隔で空きを確認し直す
+ADMISSION_POLL_SECONDS = 0.25
+
+
+class AdmissionRejected(Exception):
+    """同時実行数の上限により実行を受け付けられなかったことを表す例外"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after  # 再試行までの目安（秒）
+
+
+class AdmissionController:
+    """
+    ワークフロー実行の受け付け制御
+
+    Args:
+        session_factory: データベースセッションの作成関数
+        max_concurrent: 全体の同時実行数の上限
+        max_per_workflow: ワークフローごとの同時実行数の上限
+        queue_max: このプロセスで空きを待てる実行の数
+        queue_timeout: 空きを待つ最大時間（秒）
+        on_cancel_requested: ハートビートでキャンセル要求（CANCEL_REQUESTED）を検知した実行のID・理由を受け取る関数
+            （このプロセスで実行中の実行のキャンセルトークンをキャンセルする）
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        max_concurrent: int = RUN_MAX_CONCURRENT,
+        max_per_workflow: int = RUN_MAX_PER_WORKFLOW,
+        queue_max: int = RUN_QUEUE_MAX,
+        queue_timeout: float = RUN_QUEUE_TIMEOUT_SECONDS,
+        heartbeat_seconds: float = RUN_HEARTBEAT_SECONDS,
+        stale_seconds: int = RUN_STALE_SECONDS,
+        on_cancel_requested: Optional[Callable[[str, str], object]] = None
+    ):
+        self.session_factory = session_factory
+        self.max_concurrent = max_concurrent
+        self.max_per_workflow = max_per_workflow
+        self.queue_max = queue_max
+        self.queue_timeout = queue_timeout
+        self.heartbeat_seconds = heartbeat_seconds
+        self.stale_seconds = stale_seconds
+        self.on_cancel_requested = on_cancel_requested
+        self.waiting = 0  # このプロセスで空きを待っている実行の数
+        self._running: Set[str] = set()  # このプロセスで実行中の実行ID
+        self._pending: Set[str] = set()  # 受け付けて、まだ hold に入っていない実行ID
+        self._outcomes: Dict[str, Tuple[RunStatus, Optional[str]]] = {}  # hold を抜けたときに記録するステータス
+        self._released: Optional[asyncio.Condition] = None
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._avg_run_seconds: Optional[float] = None  # 実行時間の指数移動平均（Retry-Afterの目安）
+
+    @property
+    def running(self) -> int:
+        return len(self._running)
+
+    def _condition(self) -> asyncio.Condition:
+        # イベントループの中で作成する
+        if self._released is None:
+            self._released = asyncio.Condition()
+        return self._released
+
+    def _try_start(self, workflow_id: str) -> Optional[str]:
+        db = self.session_factory()
+        try:
+            run = RunRepository(db).start_run_if_capacity(
+                workflow_id, self.max_concurrent, self.max_per_workflow, self.stale_seconds
+            )
+            return run.id if run else None
+        finally:
+            db.close()
+
+    def retry_after(self) -> int:
+        """再試行までの目安（秒）。平均の実行時間から求めます。"""
+        if self._avg_run_seconds is None:
+            return max(1, math.ceil(self.queue_timeout))
+        return max(1, min(60, math.ceil(self._avg_run_seconds)))
+
+    async def admit(self, workflow_id: str) -> str:
+        """
+        実行を受け付け、実行中の状態で作成します。上限に達している場合は空きを待ちます。
+
+        Args:
+            workflow_id: ワークフローID
+
+        Returns:
+            作成した実行のID
+
+        Raises:
+            AdmissionRejected: 待ち行列が一杯の場合、または待機時間内に空きがなかった場合
+        """
+        started_at = time.perf_counter()
+        run_id = await asyncio.to_thread(self._try_start, workflow_id)
+        if run_id:
+            RUN_ADMISSIONS.labels("admitted").inc()
+            RUN_QUEUE_WAIT.observe(time.perf_counter() - started_at)
+            self._pending.add(run_id)
+            return run_id
+
+        if self.waiting >= self.queue_max or self.queue_timeout <= 0:
+            RUN_ADMISSIONS.labels("rejected").inc()
+            raise AdmissionRejected("queue_full", self.retry_after())
+
+        self.waiting += 1
+        released = self._condition()
+        deadline = time.monotonic() + self.queue_timeout
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    RUN_ADMISSIONS.labels("rejected").inc()
+                    RUN_QUEUE_WAIT.observe(time.perf_counter() - started_at)
+                    raise AdmissionRejected("queue_timeout", self.retry_after())
+
+                # このプロセスの実行が終わったとき、または一定時間ごとに空きを確認する
+                async with released:
+                    try:
+                        await asyncio.wait_for(released.wait(), min(remaining, ADMISSION_POLL_SECONDS))
+                    except asyncio.TimeoutError:
+                        pass
+
+                run_id = await asyncio.to_thread(self._try_start, workflow_id)
+                if run_id:
+                    RUN_ADMISSIONS.labels("queued").inc()
+                    RUN_QUEUE_WAIT.observe(time.perf_counter() - started_at)
+                    self._pending.add(run_id)
+                    return run_id
+        finally:
+            self.waiting -= 1
+
+    @asynccontextmanager
+    async def hold(self, run_id: str) -> AsyncIterator[None]:
+        """
+        受け付けた実行の実行中に使用します。実行中はハートビートを更新し、終了すると待っている実行に通知します。
+        実行のステータスはブロック内で終了状態に更新してください（終了状態になると同時実行数に数えられない）。
+        更新されないままブロックを抜けた場合（例外など）はエラーとして終了させます。
+        """
+        self._pending.discard(run_id)
+        self._running.add(run_id)
+        if self._heartbeat_task is None or self._heartbeat_task.done():
+            self._heartbeat_task = asyncio.create_task(self._heartbeat())
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._running.discard(run_id)
+            elapsed = time.perf_counter() - started_at
+            self._avg_run_seconds = elapsed if self._avg_run_seconds is None else 0.8 * self._avg_run_seconds + 0.2 * elapsed
+            await self._release(run_id)
+
+    def finish_as(self, run_id: str, status: RunStatus, detail: Optional[str] = None) -> None:
+        """
+        hold を抜けたときに記録するステータスを指定します（既定はエラー）。
+        クライアントの切断などでタスクがキャンセルされ、ブロック内でステータスの更新を待てない場合に使用します。
+        """
+        self._outcomes[run_id] = (status, detail)
+
+    async def abandon(self, run_id: str) -> None:
+        """
+        受け付けたまま hold に入らなかった実行（SSEのストリームを開始する前にクライアントが切断した場合など）を
+        エラーとして終了させ、待っている実行に通知します。hold に入った実行には何もしません。
+        """
+        if run_id not in self._pending:
+            return
+        self._pending.discard(run_id)
+        await self._release(run_id)
+
+    async def _release(self, run_id: str) -> None:
+        status, detail = self._outcomes.pop(run_id, (RunStatus.ERROR, "aborted"))
+        try:
+            await asyncio.to_thread(self._finish, run_id, status, detail)
+        except Exception as e:
+            logger.warning(f"実行のステータスを更新できませんでした: run_id={run_id}: {str(e)}")
+        released = self._condition()
+        async with released:
+            released.notify_all()
+
+    async def _heartbeat(self) -> None:
+        """
+        このプロセスで実行中の実行のハートビートを更新します（実行がなくなると終了する）。
+        他のAPIプロセスでキャンセルが要求された実行は on_cancel_requested に通知します。
+        """
+        while self._running:
+            await asyncio.sleep(self.heartbeat_seconds)
+            run_ids = list(self._running)
+            try:
+                cancel_requested = await asyncio.to_thread(self._touch, run_ids)
+            except Exception as e:
+                logger.warning(f"実行のハートビートを更新できませんでした: {str(e)}")
+                continue
+            if self.on_cancel_requested is None:
+                continue
+            for run_id, reason in cancel_requested.items():
+                if run_id in self._running:
+                    self.on_cancel_requested(run_id, reason)
+
+    def _finish(self, run_id: str, status: RunStatus, detail: Optional[str]) -> None:
+        db = self.session_factory()
+        try:
+            # 終了済みの実行は上書きされない
+            RunRepository(db).update_status(run_id, status, detail)
+        finally:
+            db.close()
+
+    def _touch(self, run_ids) -> Dict[str, str]:
+        db = self.session_factory()
+        try:
+            return RunRepository(db).touch_runs(run_ids)
+        finally:
+            db.close()
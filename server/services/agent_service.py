@@ -1,24 +1,45 @@
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, AsyncIterator, Callable, List, Optional
 from services.generative_ai_service import GenerativeAIService
+from services.cancellation import CancellationToken, RunCancelledError
+from services.structured_logging import LazyJSON
+from services.cost_estimator import DEFAULT_COMPLETION_TOKENS, count_tokens
+from services.json_stream import JSONArrayStreamParser
+from services.metrics import AGENT_TIME_TO_FIRST_TASK
+from contextlib import suppress
+import asyncio
 import json
+import os
 import time
 from datetime import datetime
 import logging
 
-# ロガーの設定
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger('AgentService')
 
+# 依存関係のない連続したタスクを1回の呼び出しでまとめて実行する最大のタスク数（1の場合はまとめない）
+AGENT_TASK_BATCH_MAX_TASKS = int(os.getenv("AGENT_TASK_BATCH_MAX_TASKS", "4"))
+# まとめて実行するタスクのトークン数の上限（タスクの内容と、タスクごとの出力の見込みの合計）
+AGENT_TASK_BATCH_MAX_TOKENS = int(os.getenv("AGENT_TASK_BATCH_MAX_TOKENS", "4000"))
+# 計画をストリーミングで受信し、受信したタスクから実行を始める（false の場合は計画の完了を待つ）
+AGENT_STREAM_PLAN = os.getenv("AGENT_STREAM_PLAN", "true").lower() != "false"
+
+TASK_RULES = """重要な制約事項：
+1. 事実確認が必要な情報は、必ず「要確認」としてマークしてください
+2. 不確実な情報は「推測」として明示してください
+3. 情報源がある場合は必ず明記してください
+4. 仮定に基づく判断は「仮定：」として明示してください
+5. 実際に行った調査や実験は、具体的な手順と結果を記録してください
+6. 行っていない調査や実験については、決して「行った」と記述しないでください"""
+
 class AgentService:
-    def __init__(self, debug: bool = False):
-        self.ai_service = GenerativeAIService()
+    def __init__(self, debug: bool = False, ai_service: Optional[GenerativeAIService] = None):
+        self.ai_service = ai_service or GenerativeAIService()
         self.max_iterations = 2  # 最大実行回数を2回に制限
         self.max_improvement_cycles = 2  # 改善サイクルの最大回数
         self.timeout_seconds = 300  # タイムアウト（5分）
         self.min_success_rate = 0.7  # 最低成功率
+        self.task_batch_max_tasks = AGENT_TASK_BATCH_MAX_TASKS
+        self.task_batch_max_tokens = AGENT_TASK_BATCH_MAX_TOKENS
+        self.stream_plan = AGENT_STREAM_PLAN
         self.debug = debug
         # TODO:　品質確認用のペルソナをUIから入力できるようにする
         self.quality_check_personas = {
@@ -44,12 +65,14 @@ class AgentService:
             }
         }
 
-    async def execute_agent(self, goal: str, constraints: List[str], capabilities: Dict[str, bool], behavior: Dict[str, float], context: Dict[str, Any]) -> Dict[str, Any]:
+    async def execute_agent(self, goal: str, constraints: List[str], capabilities: Dict[str, bool], behavior: Dict[str, float], context: Dict[str, Any], cancel_token: Optional[CancellationToken] = None, emit_progress: bool = True) -> Dict[str, Any]:
         """
         エージェントを実行し、タスクの計画と実行を行う
+        cancel_tokenがキャンセルされると、実行中のLLM呼び出しを中断してRunCancelledErrorを送出する
+        emit_progress=Falseの場合は途中経過（status="running"）を返さず、最終結果のみを返す
         """
         if self.debug:
-            logger.debug(f"エージェント実行開始: goal={goal}, constraints={constraints}, capabilities={capabilities}, behavior={behavior}, context={context}")
+            logger.debug("エージェント実行開始: goal=%s, constraints=%s, capabilities=%s, behavior=%s, context=%s", LazyJSON(goal), LazyJSON(constraints), LazyJSON(capabilities), LazyJSON(behavior), LazyJSON(context))
 
         start_time = time.time()
         iteration = 0
@@ -59,16 +82,21 @@ class AgentService:
         current_content = ""
 
         # 初期ステータスを返す
-        yield {
-            'status': 'running',
-            'execution_log': [{
-                'step': 'initialization',
-                'result': 'エージェントの初期化を開始',
-                'timestamp': datetime.now().isoformat()
-            }]
-        }
+        if emit_progress:
+            yield {
+                'status': 'running',
+                'execution_log': [{
+                    'step': 'initialization',
+                    'result': 'エージェントの初期化を開始',
+                    'timestamp': datetime.now().isoformat()
+                }]
+            }
 
         while True:
+            # キャンセルチェック
+            if cancel_token:
+                cancel_token.raise_if_cancelled()
+
             # タイムアウトチェック
             if time.time() - start_time > self.timeout_seconds:
                 if self.debug:
@@ -115,73 +143,80 @@ class AgentService:
                 logger.debug(f"イテレーション {iteration + 1} 開始 (改善サイクル: {improvement_cycle + 1})")
 
             # 1. タスクの計画
-            yield {
-                'status': 'running',
-                'execution_log': execution_log + [{
-                    'step': 'planning',
-                    'result': f'イテレーション {iteration + 1} の計画を作成中',
-                    'timestamp': datetime.now().isoformat()
-                }]
-            }
-
-            plan = self._create_plan(goal, constraints, capabilities, context)
-            if self.debug:
-                logger.debug(f"作成された計画: {json.dumps(plan, indent=2, ensure_ascii=False)}")
-            
-            # 2. 計画の実行
-            for task in plan['tasks']:
-                if self.debug:
-                    logger.debug(f"タスク実行: {task['description']}")
-                
+            if emit_progress:
                 yield {
                     'status': 'running',
                     'execution_log': execution_log + [{
-                        'step': 'task_execution',
-                        'result': f'タスク実行中: {task["description"]}',
+                        'step': 'planning',
+                        'result': f'イテレーション {iteration + 1} の計画を作成中',
                         'timestamp': datetime.now().isoformat()
                     }]
                 }
 
-                result = self._execute_task(task, context)
-                if self.debug:
-                    logger.debug(f"タスク実行結果: {json.dumps(result, indent=2, ensure_ascii=False)}")
-
-                execution_log.append({
-                    'iteration': iteration,
-                    'task': task['description'],
-                    'result': result['output'],
-                    'status': result['status'],
-                    'timestamp': datetime.now().isoformat()
-                })
-                
-                if result['status'] == 'success':
-                    current_content = result['output']
+            # 2. 計画の実行（依存関係のない連続したタスクはまとめて実行。
+            #    ストリーミングの場合は計画の受信中に、受信済みのタスクから実行を始める）
+            planned: Dict[str, Any] = {}
+            batches = self._planned_batches(goal, constraints, capabilities, context, cancel_token, planned)
+            running: List[tuple] = []  # 実行中のまとまりと、その実行（開始順）
+            try:
+                async for tasks in batches:
+                    if self.debug:
+                        logger.debug("タスク実行: %s", [task['description'] for task in tasks])
+
+                    if emit_progress:
+                        yield {
+                            'status': 'running',
+                            'execution_log': execution_log + [{
+                                'step': 'task_execution',
+                                'result': f'タスク実行中: {", ".join(task["description"] for task in tasks)}',
+                                'timestamp': datetime.now().isoformat()
+                            }]
+                        }
+
+                    # 依存関係のあるタスクは、それまでのタスクの結果を待ってから実行する
+                    if any(task.get('dependencies') for task in tasks):
+                        for done, execution in running:
+                            current_content = self._record_results(done, await execution, iteration, execution_log) or current_content
+                        running = []
+                    running.append((tasks, asyncio.ensure_future(self._execute_tasks(tasks, context, cancel_token))))
+
+                for done, execution in running:
+                    current_content = self._record_results(done, await execution, iteration, execution_log) or current_content
+                running = []
+            finally:
+                for _, execution in running:
+                    execution.cancel()
+                await batches.aclose()
+            plan = planned['plan']
+            if self.debug:
+                logger.debug("作成された計画: %s", LazyJSON(plan))
 
             # 3. 品質チェック
             if current_content:
-                yield {
-                    'status': 'running',
-                    'execution_log': execution_log + [{
-                        'step': 'quality_check',
-                        'result': '品質チェックを実行中',
-                        'timestamp': datetime.now().isoformat()
-                    }]
-                }
+                if emit_progress:
+                    yield {
+                        'status': 'running',
+                        'execution_log': execution_log + [{
+                            'step': 'quality_check',
+                            'result': '品質チェックを実行中',
+                            'timestamp': datetime.now().isoformat()
+                        }]
+                    }
 
                 reviews = []
                 for persona_name, persona in self.quality_check_personas.items():
-                    review = self._get_persona_review(current_content, persona)
+                    review = await self._get_persona_review(current_content, persona, cancel_token)
                     reviews.append({
                         'persona': persona_name,
                         'review': review
                     })
                     if self.debug:
-                        logger.debug(f"{persona_name}のレビュー: {json.dumps(review, indent=2, ensure_ascii=False)}")
+                        logger.debug("%sのレビュー: %s", persona_name, LazyJSON(review))
 
                 # レビューの集約
-                aggregated_review = self._aggregate_reviews(reviews)
+                aggregated_review = await self._aggregate_reviews(reviews, cancel_token)
                 if self.debug:
-                    logger.debug(f"集約されたレビュー: {json.dumps(aggregated_review, indent=2, ensure_ascii=False)}")
+                    logger.debug("集約されたレビュー: %s", LazyJSON(aggregated_review))
 
                 # 成功率の更新
                 current_success_rate = aggregated_review['overall_score']
@@ -193,7 +228,7 @@ class AgentService:
                         logger.info(f"目標達成: 成功率 {current_success_rate:.2f} (改善サイクル: {improvement_cycle})")
 
                     # まとめ役のペルソナによる最終報告
-                    summary = self._get_persona_review(current_content, self.quality_check_personas["summarizer"])
+                    summary = await self._get_persona_review(current_content, self.quality_check_personas["summarizer"], cancel_token)
                     
                     yield {
                         'status': 'success',
@@ -211,24 +246,25 @@ class AgentService:
 
                 # 改善の適用（成功率が閾値を下回る場合のみ）
                 if aggregated_review['priority_improvements'] and current_success_rate < self.min_success_rate:
-                    yield {
-                        'status': 'running',
-                        'execution_log': execution_log + [{
-                            'step': 'improvement',
-                            'result': f'改善を適用中 (サイクル {improvement_cycle + 1})',
-                            'timestamp': datetime.now().isoformat()
-                        }]
-                    }
-
-                    current_content = self._apply_improvements(current_content, aggregated_review['priority_improvements'])
+                    if emit_progress:
+                        yield {
+                            'status': 'running',
+                            'execution_log': execution_log + [{
+                                'step': 'improvement',
+                                'result': f'改善を適用中 (サイクル {improvement_cycle + 1})',
+                                'timestamp': datetime.now().isoformat()
+                            }]
+                        }
+
+                    current_content = await self._apply_improvements(current_content, aggregated_review['priority_improvements'], cancel_token)
                     improvement_cycle += 1  # 改善サイクルをカウントアップ
                     if self.debug:
-                        logger.debug(f"改善適用後の内容 (サイクル {improvement_cycle}): {current_content}")
+                        logger.debug("改善適用後の内容 (サイクル %s): %s", improvement_cycle, LazyJSON(current_content))
 
             iteration += 1
 
-    def _create_plan(self, goal: str, constraints: List[str], capabilities: Dict[str, bool], context: Dict[str, Any]) -> Dict[str, Any]:
-        """タスクの計画を作成"""
+    def plan_prompt(self, goal: str, constraints: List[str], capabilities: Dict[str, bool], context: Dict[str, Any]) -> str:
+        """タスクの計画を作成するプロンプト"""
         prompt = f"""
 目標: {goal}
 制約条件: {', '.join(constraints)}
@@ -255,10 +291,115 @@ class AgentService:
     "fallback_plans": ["代替計画"]
 }}
 """
-        return self.ai_service.generate_json(prompt)
+        return prompt
 
-    def _execute_task(self, task: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
-        """個別のタスクを実行"""
+    async def _create_plan(self, goal: str, constraints: List[str], capabilities: Dict[str, bool], context: Dict[str, Any], cancel_token: Optional[CancellationToken] = None) -> Dict[str, Any]:
+        """タスクの計画を作成"""
+        prompt = self.plan_prompt(goal, constraints, capabilities, context)
+        return await self.ai_service.generate_json(prompt, cancel_token=cancel_token, step="plan")
+
+    async def _stream_plan(self, goal: str, constraints: List[str], capabilities: Dict[str, bool], context: Dict[str, Any],
+                           on_task: Callable[[Optional[Dict[str, Any]]], None], cancel_token: Optional[CancellationToken] = None) -> Dict[str, Any]:
+        """
+        タスクの計画をストリーミングで作成し、tasks の要素が閉じるたびに on_task を呼び出します。
+        tasks の配列が閉じた時点（応答の残りを受信する前）で on_task(None) を呼び出します。
+
+        受信の完了後は全体を解析し、逐次解析で取り出せなかったタスクも on_task に渡します。
+        ストリーミングが途中で切れた場合は、計画全体をストリーミングなしで作成し直し、
+        まだ渡していない位置のタスクだけを渡します（実行を始めたタスクは繰り返さない）。
+
+        Returns:
+            計画
+        """
+        prompt = self.plan_prompt(goal, constraints, capabilities, context)
+        parser = JSONArrayStreamParser("tasks")
+        parts = []
+        try:
+            async for chunk in self.ai_service.stream_json(prompt, cancel_token=cancel_token, step="plan"):
+                parts.append(chunk)
+                closed = parser.closed
+                for task in parser.feed(chunk):
+                    on_task(task)
+                if parser.closed and not closed:
+                    on_task(None)
+        except RunCancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"計画のストリーミングが中断しました。計画全体を作成し直します（受信済みのタスク: {len(parser.items)}件）: {str(e)}")
+            plan = await self._create_plan(goal, constraints, capabilities, context, cancel_token)
+        else:
+            try:
+                plan = json.loads("".join(parts))
+            except json.JSONDecodeError as e:
+                logger.warning(f"計画のJSONの解析に失敗しました。受信済みのタスクで続行します: {str(e)}")
+                plan = {"tasks": list(parser.items), "fallback_plans": []}
+
+        for task in [task for task in plan['tasks'] if isinstance(task, dict)][len(parser.items):]:
+            on_task(task)
+        return plan
+
+    async def _planned_batches(self, goal: str, constraints: List[str], capabilities: Dict[str, bool], context: Dict[str, Any],
+                               cancel_token: Optional[CancellationToken], planned: Dict[str, Any]) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        計画を作成し、実行するタスクのまとまりを実行順に返します。計画は完了後に planned["plan"] に設定します。
+
+        stream_plan が有効な場合は、計画の受信中に、最初のタスクを受信した時点で単独で返し、
+        以降のタスクは _task_batches と同じ規則でまとめ、まとまりが確定した時点（上限に達した・依存関係のあるタスク・
+        tasks の配列が閉じた・計画の完了）で返します。まとまりは受信のタイミングによらず計画の内容だけで決まるため、
+        チェックポイントから再開した実行でも同じ呼び出しになります。
+        """
+        started_at = time.perf_counter()
+        if not self.stream_plan:
+            plan = await self._create_plan(goal, constraints, capabilities, context, cancel_token)
+            planned['plan'] = plan
+            for i, tasks in enumerate(self._task_batches(plan['tasks'])):
+                if i == 0:
+                    AGENT_TIME_TO_FIRST_TASK.labels("full").observe(time.perf_counter() - started_at)
+                yield tasks
+            return
+
+        received: asyncio.Queue = asyncio.Queue()
+        finished = object()
+        producer = asyncio.create_task(
+            self._stream_plan(goal, constraints, capabilities, context, received.put_nowait, cancel_token)
+        )
+        # 計画の完了（例外を含む）を通知する
+        producer.add_done_callback(lambda _: received.put_nowait(finished))
+        pending: List[Dict[str, Any]] = []
+        first = True
+        closed = False
+        try:
+            while True:
+                item = await received.get()
+                if item is None or item is finished:
+                    closed = True
+                else:
+                    pending.append(item)
+                if first and pending:
+                    first = False
+                    AGENT_TIME_TO_FIRST_TASK.labels("stream").observe(time.perf_counter() - started_at)
+                    yield [pending.pop(0)]
+
+                batches = self._task_batches(pending)
+                if not closed and batches:
+                    # 最後のまとまりは、上限に達したか依存関係のあるタスクで終わる場合のみ確定
+                    last = batches[-1]
+                    if len(last) < self.task_batch_max_tasks and not last[-1].get("dependencies"):
+                        batches = batches[:-1]
+                for tasks in batches:
+                    yield tasks
+                pending = pending[sum(len(tasks) for tasks in batches):]
+                if item is finished:
+                    break
+            planned['plan'] = await producer
+        finally:
+            if not producer.done():
+                producer.cancel()
+                with suppress(asyncio.CancelledError):
+                    await producer
+
+    def task_prompt(self, task: Dict[str, Any], context: Dict[str, Any]) -> str:
+        """個別のタスクを実行するプロンプト"""
         prompt = f"""
 以下のタスクを実行してください：
 
@@ -268,13 +409,7 @@ class AgentService:
 コンテキスト:
 {json.dumps(context, indent=2, ensure_ascii=False)}
 
-重要な制約事項：
-1. 事実確認が必要な情報は、必ず「要確認」としてマークしてください
-2. 不確実な情報は「推測」として明示してください
-3. 情報源がある場合は必ず明記してください
-4. 仮定に基づく判断は「仮定：」として明示してください
-5. 実際に行った調査や実験は、具体的な手順と結果を記録してください
-6. 行っていない調査や実験については、決して「行った」と記述しないでください
+{TASK_RULES}
 
 実行結果を以下の形式でJSONを返してください：
 {{
@@ -287,9 +422,145 @@ class AgentService:
     "sources": ["情報源のリスト"]
 }}
 """
-        return self.ai_service.generate_json(prompt)
+        return prompt
+
+    async def _execute_task(self, task: Dict[str, Any], context: Dict[str, Any], cancel_token: Optional[CancellationToken] = None) -> Dict[str, Any]:
+        """個別のタスクを実行"""
+        prompt = self.task_prompt(task, context)
+        return await self.ai_service.generate_json(prompt, cancel_token=cancel_token, step="task")
+
+    def _record_results(self, tasks: List[Dict[str, Any]], results: List[Dict[str, Any]], iteration: int,
+                        execution_log: List[Dict[str, Any]]) -> Optional[str]:
+        """タスクの結果を実行ログに追加し、最後に成功したタスクの出力を返します（成功したタスクがない場合はNone）。"""
+        content = None
+        for task, result in zip(tasks, results):
+            if self.debug:
+                logger.debug("タスク実行結果: %s", LazyJSON(result))
+
+            execution_log.append({
+                'iteration': iteration,
+                'task': task['description'],
+                'result': result['output'],
+                'status': result['status'],
+                'timestamp': datetime.now().isoformat()
+            })
+
+            if result['status'] == 'success':
+                content = result['output']
+        return content
+
+    def _task_batches(self, tasks: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        """
+        タスクを実行順のまとまりに分けます。
+
+        依存関係（dependencies）のない連続したタスクを、task_batch_max_tasks 件、
+        かつタスクの内容と出力の見込みのトークン数の合計が task_batch_max_tokens 以下になるようにまとめます。
+        依存関係のあるタスクは、それまでのタスクの結果を待つため単独で実行します。
+        """
+        batches: List[List[Dict[str, Any]]] = []
+        batch: List[Dict[str, Any]] = []
+        batch_tokens = 0
+        for task in tasks:
+            tokens = count_tokens(json.dumps(task, ensure_ascii=False)) + DEFAULT_COMPLETION_TOKENS["task"]
+            independent = not task.get("dependencies")
+            if batch and (
+                not independent
+                or len(batch) >= self.task_batch_max_tasks
+                or batch_tokens + tokens > self.task_batch_max_tokens
+            ):
+                batches.append(batch)
+                batch, batch_tokens = [], 0
+            batch.append(task)
+            batch_tokens += tokens
+            if not independent:
+                batches.append(batch)
+                batch, batch_tokens = [], 0
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def task_batch_prompt(self, tasks: List[Dict[str, Any]], context: Dict[str, Any]) -> str:
+        """複数の独立したタスクをまとめて実行するプロンプト（コンテキストと制約事項は1回だけ含める）"""
+        numbered = [{"task_id": i, **task} for i, task in enumerate(tasks)]
+        prompt = f"""
+以下の{len(tasks)}件のタスクをそれぞれ実行してください。各タスクは互いに独立しています。
+
+タスク一覧:
+{json.dumps(numbered, indent=2, ensure_ascii=False)}
+
+コンテキスト:
+{json.dumps(context, indent=2, ensure_ascii=False)}
+
+{TASK_RULES}
+
+タスクごとの実行結果を、task_id の順に以下の形式でJSONを返してください：
+{{
+    "results": [
+        {{
+            "task_id": 0,
+            "status": "success" | "failure",
+            "output": "実行結果",
+            "error": "エラーメッセージ（失敗の場合）",
+            "next_steps": ["次のステップ"],
+            "assumptions": ["仮定のリスト"],
+            "verification_needed": ["要確認の項目"],
+            "sources": ["情報源のリスト"]
+        }}
+    ]
+}}
+"""
+        return prompt
+
+    async def _execute_tasks(self, tasks: List[Dict[str, Any]], context: Dict[str, Any], cancel_token: Optional[CancellationToken] = None) -> List[Dict[str, Any]]:
+        """
+        タスクをまとめて1回の呼び出しで実行し、タスクと同じ順の結果を返します。
 
-    def _adjust_plan(self, plan: Dict[str, Any], result: Dict[str, Any], 
+        応答に含まれない・形式が不正なタスクがある場合は、それらのタスクだけを再実行します
+        （すべて不正な場合は半分に分けて再実行し、最後は1件ずつ実行する）。
+        """
+        if len(tasks) == 1:
+            return [await self._execute_task(tasks[0], context, cancel_token)]
+
+        response = await self.ai_service.generate_json(
+            self.task_batch_prompt(tasks, context), cancel_token=cancel_token, step="task_batch"
+        )
+        results = self._parse_task_batch(response, len(tasks))
+        failed = [i for i, result in enumerate(results) if result is None]
+        if not failed:
+            return results
+
+        logger.warning(f"まとめて実行したタスクの結果が不足しています: {len(failed)}/{len(tasks)}件を再実行します")
+        if len(failed) == len(tasks):
+            half = len(tasks) // 2
+            groups = [list(range(half)), list(range(half, len(tasks)))]
+        else:
+            groups = [failed]
+        for group in groups:
+            retried = await self._execute_tasks([tasks[i] for i in group], context, cancel_token)
+            for i, result in zip(group, retried):
+                results[i] = result
+        return results
+
+    def _parse_task_batch(self, response: Dict[str, Any], size: int) -> List[Optional[Dict[str, Any]]]:
+        """まとめて実行したタスクの応答を task_id ごとの結果に分けます（不足・不正な結果はNone）。"""
+        results: List[Optional[Dict[str, Any]]] = [None] * size
+        items = response.get("results") if isinstance(response, dict) else None
+        if not isinstance(items, list):
+            return results
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            task_id = item.get("task_id")
+            if isinstance(task_id, str) and task_id.isdigit():
+                task_id = int(task_id)
+            if (
+                isinstance(task_id, int) and 0 <= task_id < size and results[task_id] is None
+                and item.get("status") in ("success", "failure") and isinstance(item.get("output"), str)
+            ):
+                results[task_id] = {key: value for key, value in item.items() if key != "task_id"}
+        return results
+
+    async def _adjust_plan(self, plan: Dict[str, Any], result: Dict[str, Any], 
                     context: Dict[str, Any]) -> Dict[str, Any]:
         """計画の修正"""
         prompt = f"""
@@ -317,9 +588,9 @@ class AgentService:
     "fallback_plans": ["代替計画"]
 }}
 """
-        return self.ai_service.generate_json(prompt)
+        return await self.ai_service.generate_json(prompt, step="adjust_plan")
 
-    def _review_execution(self, plan: Dict[str, Any], execution_log: List[dict],
+    async def _review_execution(self, plan: Dict[str, Any], execution_log: List[dict],
                          goal: str, constraints: List[str]) -> Dict[str, Any]:
         """実行結果の評価"""
         prompt = f"""
@@ -347,7 +618,7 @@ class AgentService:
     "next_steps": ["次のステップ"]
 }}
 """
-        return self.ai_service.generate_json(prompt)
+        return await self.ai_service.generate_json(prompt, step="review")
 
     def _parse_plan(self, response: str) -> Dict[str, Any]:
         """計画の解析"""
@@ -386,20 +657,20 @@ class AgentService:
                 "success_criteria": []
             }
 
-    def _execute_node(self, node: dict) -> List[str]:
+    async def _execute_node(self, node: dict) -> List[str]:
         """特定のノードを実行"""
         try:
             # ノードの種類に応じて実行
             if node['type'] == 'AGENT':
-                return self.execute_agent(
+                return [result async for result in self.execute_agent(
                     goal=node['data']['goal'],
                     constraints=node['data']['constraints'],
                     capabilities=node['data']['capabilities'],
                     behavior=node['data']['behavior'],
                     context={}
-                )
+                )]
             elif node['type'] == 'GENERATIVE_AI':
-                return [self.ai_service.generate_text(node['data']['prompt'])]
+                return [await self.ai_service.generate_text(node['data']['prompt'])]
             elif node['type'] == 'FORMATTER':
                 return [self._format_output(node['data'])]
             else:
@@ -416,7 +687,7 @@ class AgentService:
         except Exception as e:
             return f"フォーマットエラー: {str(e)}"
 
-    def execute_workflow(self, workflow: Dict[str, Any]) -> List[str]:
+    async def execute_workflow(self, workflow: Dict[str, Any]) -> List[str]:
         """
         エージェントがワークフローを実行
         """
@@ -440,24 +711,24 @@ class AgentService:
                 return results
 
             # 1. ワークフローの分析
-            analysis = self._analyze_workflow(nodes, agent_config)
+            analysis = await self._analyze_workflow(nodes, agent_config)
             
             # 2. 実行計画の作成
-            plan = self._create_execution_plan(analysis, agent_config)
+            plan = await self._create_execution_plan(analysis, agent_config)
             
             # 3. 計画の実行
             iteration_results = []
             for step in plan['steps']:
                 if step['type'] == 'execute_node':
-                    node_results = self._execute_node(step['node'])
+                    node_results = await self._execute_node(step['node'])
                     iteration_results.extend(node_results)
                 elif step['type'] == 'web_search':
-                    search_results = self._execute_web_search(step['query'])
+                    search_results = await self._execute_web_search(step['query'])
                     iteration_results.append(f"検索結果: {search_results}")
                 elif step['type'] == 'modify_workflow':
-                    nodes = self._modify_workflow(nodes, step['modifications'])
+                    nodes = await self._modify_workflow(nodes, step['modifications'])
                 elif step['type'] == 'evaluate':
-                    evaluation = self._evaluate_execution(iteration_results, step['criteria'])
+                    evaluation = await self._evaluate_execution(iteration_results, step['criteria'])
                     current_success_rate = evaluation['success_rate']
                     best_success_rate = max(best_success_rate, current_success_rate)
 
@@ -472,7 +743,7 @@ class AgentService:
             results.extend(iteration_results)
             iteration += 1
 
-    def _analyze_workflow(self, nodes: List[dict], agent_config: Dict[str, Any]) -> Dict[str, Any]:
+    async def _analyze_workflow(self, nodes: List[dict], agent_config: Dict[str, Any]) -> Dict[str, Any]:
         """ワークフローの分析"""
         prompt = f"""
 以下のワークフローを分析し、実行計画を立てるために必要な情報を抽出してください。
@@ -503,9 +774,9 @@ class AgentService:
     "success_criteria": ["成功基準"]
 }}
 """
-        return self.ai_service.generate_json(prompt)
+        return await self.ai_service.generate_json(prompt)
 
-    def _create_execution_plan(self, analysis: Dict[str, Any], 
+    async def _create_execution_plan(self, analysis: Dict[str, Any], 
                              agent_config: Dict[str, Any]) -> Dict[str, Any]:
         """実行計画の作成"""
         prompt = f"""
@@ -533,13 +804,13 @@ class AgentService:
     "fallback_plans": ["代替計画"]
 }}
 """
-        return self.ai_service.generate_json(prompt)
+        return await self.ai_service.generate_json(prompt)
 
-    def _execute_web_search(self, query: str) -> str:
+    async def _execute_web_search(self, query: str) -> str:
         """Web検索を実行"""
-        return self.ai_service.web_search(query)
+        return await self.ai_service.web_search(query)
 
-    def _modify_workflow(self, nodes: List[dict], 
+    async def _modify_workflow(self, nodes: List[dict], 
                         modifications: Dict[str, Any]) -> List[dict]:
         """ワークフローの修正"""
         prompt = f"""
@@ -575,10 +846,10 @@ class AgentService:
     ]
 }}
 """
-        result = self.ai_service.generate_json(prompt)
+        result = await self.ai_service.generate_json(prompt)
         return result.get('nodes', nodes)
 
-    def _evaluate_execution(self, results: List[str], 
+    async def _evaluate_execution(self, results: List[str], 
                           criteria: Dict[str, Any]) -> Dict[str, Any]:
         """実行結果の評価"""
         prompt = f"""
@@ -599,10 +870,10 @@ class AgentService:
     "next_steps": ["次のステップ"]
 }}
 """
-        return self.ai_service.generate_json(prompt)
+        return await self.ai_service.generate_json(prompt)
 
-    def _get_persona_review(self, content: str, persona: dict) -> Dict[str, Any]:
-        """特定のペルソナからのレビューを取得"""
+    def review_prompt(self, content: str, persona: dict) -> str:
+        """ペルソナによるレビューのプロンプト"""
         prompt = f"""
 あなたは{persona['role']}です。
 以下の内容を評価し、改善提案をしてください。
@@ -643,10 +914,15 @@ class AgentService:
     "assumptions": ["仮定のリスト"]
 }}
 """
-        return self.ai_service.generate_json(prompt)
+        return prompt
 
-    def _aggregate_reviews(self, reviews: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """複数のレビューを集約"""
+    async def _get_persona_review(self, content: str, persona: dict, cancel_token: Optional[CancellationToken] = None) -> Dict[str, Any]:
+        """特定のペルソナからのレビューを取得"""
+        prompt = self.review_prompt(content, persona)
+        return await self.ai_service.generate_json(prompt, cancel_token=cancel_token, step="review")
+
+    def aggregate_prompt(self, reviews: List[Dict[str, Any]]) -> str:
+        """レビューを集約するプロンプト"""
         prompt = f"""
 以下の複数のレビューを集約し、総合的な評価と改善提案を作成してください。
 
@@ -680,10 +956,15 @@ class AgentService:
     }}
 }}
 """
-        return self.ai_service.generate_json(prompt)
+        return prompt
 
-    def _apply_improvements(self, content: str, improvements: List[str]) -> str:
-        """改善提案を適用"""
+    async def _aggregate_reviews(self, reviews: List[Dict[str, Any]], cancel_token: Optional[CancellationToken] = None) -> Dict[str, Any]:
+        """複数のレビューを集約"""
+        prompt = self.aggregate_prompt(reviews)
+        return await self.ai_service.generate_json(prompt, cancel_token=cancel_token, step="aggregate")
+
+    def improvement_prompt(self, content: str, improvements: List[str]) -> str:
+        """改善提案を適用するプロンプト"""
         prompt = f"""
 以下の内容に改善提案を適用してください。
 
@@ -695,4 +976,9 @@ class AgentService:
 
 改善後の内容を返してください。
 """
-        return self.ai_service.generate_text(prompt)
\ No newline at end of file
+        return prompt
+
+    async def _apply_improvements(self, content: str, improvements: List[str], cancel_token: Optional[CancellationToken] = None) -> str:
+        """改善提案を適用"""
+        prompt = self.improvement_prompt(content, improvements)
+        return await self.ai_service.generate_text(prompt, cancel_token=cancel_token, step="improve")
\ No newline at end of file
@@ -0,0 +1,172 @@
+"""
+ノードと実行の予算（所要時間・LLMの呼び出し回数・トークン数の上限）
+
+WorkflowService が実行ごと・ノードごとに Budget を作成し、上限を超えた時点でキャンセルトークンを
+BudgetExceededError でキャンセルします。所要時間はタイマーで、LLMの呼び出し回数とトークン数は
+GenerativeAIService の呼び出しごとに current_budget() を通して数えます。
+
+ノードの上限はノードタイプごとの既定値（NODE_LIMITS）に、ノードの設定の limits を重ねて決まります。
+    {"limits": {"timeout_seconds": 30, "max_llm_calls": 10, "max_tokens": 20000}}
+値が 0 または null の項目は上限なしです。
+"""
+import asyncio
+import json
+import logging
+import os
+from contextvars import ContextVar
+from typing import Any, ContextManager, Dict, Mapping, Optional
+
+from models import RunStatus
+from services.cancellation import CancellationToken, RunCancelledError
+from services.metrics import BUDGET_EXCEEDED
+from services.structured_logging import use_context_var
+
+logger = logging.getLogger('WorkflowApp')
+
+LIMIT_KEYS = ("timeout_seconds", "max_llm_calls", "max_tokens")
+
+# ノードタイプごとの既定の上限（NODE_LIMITS にJSONでノードタイプごとに上書きできる）
+NODE_LIMITS: Dict[str, Dict[str, Optional[float]]] = {
+    "extract_text": {"timeout_seconds": 60},
+    "generative_ai": {"timeout_seconds": 120},
+    "formatter": {"timeout_seconds": 120},
+    "agent": {"timeout_seconds": 600},
+}
+for _node_type, _limits in json.loads(os.getenv("NODE_LIMITS", "{}")).items():
+    NODE_LIMITS.setdefault(_node_type, {}).update(_limits)
+
+# 実行全体の上限（0 は上限なし）
+RUN_LIMITS: Dict[str, Optional[float]] = {
+    "timeout_seconds": float(os.getenv("RUN_TIMEOUT_SECONDS", "1800")),
+    "max_llm_calls": int(os.getenv("RUN_MAX_LLM_CALLS", "0")),
+    "max_tokens": int(os.getenv("RUN_MAX_TOKENS", "0")),
+}
+
+SCOPE_LABELS = {"node": "ノード", "run": "実行"}
+
+_current_budget: ContextVar[Optional["Budget"]] = ContextVar("budget", default=None)
+
+
+class BudgetExceededError(RunCancelledError):
+    """
+    ノードまたは実行の予算を超えたことを表す例外
+
+    RunCancelledError のサブクラスのため、キャンセルと同じ経路で処理を中断します。
+    """
+
+    def __init__(self, scope: str, limit: str, value: float):
+        self.scope = scope  # "node" | "run"
+        self.limit = limit  # LIMIT_KEYS のいずれか
+        self.value = value  # 上限の値
+        self.reason = f"budget_exceeded:{scope}.{limit}"
+        super().__init__(f"{SCOPE_LABELS.get(scope, scope)}の上限を超えました: {limit}={value:g}")
+
+
+def validate_limits(limits: Any) -> Optional[str]:
+    """ノードの設定の limits を検証し、不正な場合はエラーメッセージを返します。"""
+    if limits is None:
+        return None
+    if not isinstance(limits, Mapping):
+        return "limits はオブジェクトで指定してください"
+    unknown = [key for key in limits if key not in LIMIT_KEYS]
+    if unknown:
+        return f"未知の上限の項目: {', '.join(unknown)}"
+    for key, value in limits.items():
+        if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0):
+            return f"上限の値が不正です: {key}={value}"
+    return None
+
+
+def node_limits(node_type: str, config: Mapping[str, Any]) -> Dict[str, Optional[float]]:
+    """ノードタイプの既定の上限に、ノードの設定の limits を重ねた上限を返します。"""
+    return {**NODE_LIMITS.get(node_type, {}), **(config.get("limits") or {})}
+
+
+class Budget:
+    """
+    1つのスコープ（ノードまたは実行）の予算
+
+    上限を超えた場合は token を BudgetExceededError でキャンセルします（token.run() で待機中の処理は中断される）。
+    parent がある場合は、呼び出し回数とトークン数を parent にも数えます。
+
+    Args:
+        scope: "node" または "run"
+        limits: 上限（LIMIT_KEYS。0・None は上限なし）
+        token: 上限を超えた場合にキャンセルするトークン
+        parent: 実行全体の予算
+    """
+
+    def __init__(self, scope: str, limits: Mapping[str, Optional[float]], token: CancellationToken,
+                 parent: Optional["Budget"] = None):
+        self.scope = scope
+        self.limits = {key: limits.get(key) or None for key in LIMIT_KEYS}
+        self.token = token
+        self.parent = parent
+        self.llm_calls = 0
+        self.tokens = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def start(self) -> "Budget":
+        """所要時間の計測を開始します（timeout_seconds を過ぎるとキャンセルする）。"""
+        timeout = self.limits["timeout_seconds"]
+        if timeout:
+            self._timer = asyncio.get_running_loop().call_later(timeout, self._exceed, "timeout_seconds")
+        return self
+
+    def close(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def charge_llm_call(self) -> None:
+        """
+        LLMの呼び出しを1回数えます。呼び出しの前に呼び出し、上限を超える場合は呼び出さずに例外を送出します。
+
+        Raises:
+            BudgetExceededError: 呼び出し回数の上限を超える場合
+        """
+        budget = self
+        while budget is not None:
+            budget.llm_calls += 1
+            limit = budget.limits["max_llm_calls"]
+            if limit and budget.llm_calls > limit:
+                raise budget._exceed("max_llm_calls")
+            budget = budget.parent
+
+    def charge_tokens(self, tokens: int) -> None:
+        """
+        LLMの呼び出しで使用したトークン数（入力と出力の合計）を数えます。
+
+        Raises:
+            BudgetExceededError: トークン数の上限を超えた場合（以降の呼び出しを中断する）
+        """
+        budget = self
+        while budget is not None:
+            budget.tokens += tokens
+            limit = budget.limits["max_tokens"]
+            if limit and budget.tokens > limit:
+                raise budget._exceed("max_tokens")
+            budget = budget.parent
+
+    def _exceed(self, limit: str) -> BudgetExceededError:
+        error = BudgetExceededError(self.scope, limit, self.limits[limit])
+        if not self.token.cancelled:
+            logger.warning(f"Budget exceeded: {error.reason} ({error})")
+            BUDGET_EXCEEDED.labels(self.scope, limit).inc()
+            self.token.cancel(error.reason, error)
+        return error
+
+
+def cancelled_run_status(token: CancellationToken) -> RunStatus:
+    """キャンセルされた実行のステータスを返します（実行全体の予算を超えた場合は BUDGET_EXCEEDED）。"""
+    return RunStatus.BUDGET_EXCEEDED if isinstance(token.error, BudgetExceededError) else RunStatus.CANCELLED
+
+
+def current_budget() -> Optional[Budget]:
+    """実行中のノードの予算を返します（WorkflowService の外からの呼び出しではNone）。"""
+    return _current_budget.get()
+
+
+def use_budget(budget: Optional[Budget]) -> ContextManager[None]:
+    """ブロック内のLLMの呼び出しを budget に数えます。"""
+    return use_context_var(_current_budget, budget)
@@ -0,0 +1,147 @@
+import asyncio
+from contextlib import suppress
+from typing import Any, Awaitable, Dict, List, Optional
+
+
+class RunCancelledError(Exception):
+    """ワークフローの実行がキャンセルされたことを表す例外"""
+
+
+class CancellationToken:
+    """
+    ワークフロー実行の協調的キャンセルを伝搬するトークン
+
+    SSEの切断や `POST /runs/{id}/cancel` で `cancel()` が呼ばれると、
+    `run()` で待機中のLLMリクエストは即座に中断されます。
+    `child()` で作成したトークン（ノードごとの予算など）は、このトークンのキャンセル時に一緒にキャンセルされます。
+    """
+
+    def __init__(self):
+        self._event = asyncio.Event()
+        self.reason: Optional[str] = None
+        self._error: Optional[RunCancelledError] = None
+        self._children: List["CancellationToken"] = []
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    @property
+    def error(self) -> Optional[RunCancelledError]:
+        """cancel() に指定された例外（予算の超過など）"""
+        return self._error
+
+    def cancel(self, reason: str = "cancelled", error: Optional[RunCancelledError] = None) -> None:
+        """
+        キャンセルします。
+
+        Args:
+            reason: キャンセルの理由
+            error: 待機中の処理に送出する例外（省略時は RunCancelledError(reason)）
+        """
+        if not self._event.is_set():
+            self.reason = reason
+            self._error = error
+            self._event.set()
+            for child in self._children:
+                child.cancel(reason, error)
+
+    def child(self) -> "CancellationToken":
+        """このトークンのキャンセル時に一緒にキャンセルされるトークンを作成します。"""
+        token = CancellationToken()
+        if self.cancelled:
+            token.cancel(self.reason, self._error)
+        else:
+            self._children.append(token)
+        return token
+
+    def release(self, child: "CancellationToken") -> None:
+        """child() で作成したトークンを、使い終わった後に切り離します。"""
+        if child in self._children:
+            self._children.remove(child)
+
+    async def wait(self) -> None:
+        """キャンセルされるまで待機します。"""
+        await self._event.wait()
+
+    def raise_if_cancelled(self) -> None:
+        if self._event.is_set():
+            raise self._error or RunCancelledError(self.reason)
+
+    async def run(self, awaitable: Awaitable[Any]) -> Any:
+        """
+        awaitableをキャンセル可能な形で実行します。
+        実行中にキャンセルされた場合はawaitableを中断してRunCancelledErrorを送出します。
+
+        Args:
+            awaitable: 実行するコルーチン
+
+        Returns:
+            awaitableの戻り値
+        """
+        task = asyncio.ensure_future(awaitable)
+        if self.cancelled:
+            task.cancel()
+            self.raise_if_cancelled()
+
+        waiter = asyncio.ensure_future(self._event.wait())
+        try:
+            await asyncio.wait({task, waiter}, return_when=asyncio.FIRST_COMPLETED)
+        except asyncio.CancelledError:
+            # 呼び出し元（SSEのレスポンスなど）自体がキャンセルされた
+            # 中断した処理（非同期ジェネレーターの __anext__ など）が終わってから伝搬し、呼び出し元が後片付けできるようにする
+            task.cancel()
+            waiter.cancel()
+            await asyncio.wait({task})
+            raise
+
+        if task.done():
+            waiter.cancel()
+            return task.result()
+
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+        self.raise_if_cancelled()
+
+
+class RunRegistry:
+    """
+    このプロセスで実行中のワークフローとキャンセルトークンの対応表
+
+    cancel() はスレッドプールで実行されるエンドポイントからも呼び出せます
+    （トークンは登録したイベントループのスレッドでキャンセルする）。
+    """
+
+    def __init__(self):
+        self._tokens: Dict[str, CancellationToken] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def register(self, run_id: str) -> CancellationToken:
+        self._loop = asyncio.get_running_loop()
+        token = CancellationToken()
+        self._tokens[run_id] = token
+        return token
+
+    def unregister(self, run_id: str) -> None:
+        self._tokens.pop(run_id, None)
+
+    def cancel(self, run_id: str, reason: str = "cancelled") -> bool:
+        """
+        実行中のワークフローをキャンセルします。
+
+        Returns:
+            このプロセスで実行中のワークフローが見つかった場合はTrue
+        """
+        token = self._tokens.get(run_id)
+        if token is None:
+            return False
+        try:
+            in_loop = asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            in_loop = False
+        if in_loop:
+            token.cancel(reason)
+        else:
+            self._loop.call_soon_threadsafe(token.cancel, reason)
+        return True
@@ -0,0 +1,199 @@
+"""
+実行のチェックポイント
+
+ワークフローの実行中、次の時点で結果を run_checkpoints テーブルに保存します。
+
+    ノードが成功したとき   : そのノード（まとめて実行したフォーマッターは全員分）のイベント
+    LLMの呼び出しの完了時 : 応答の内容（エージェントの各イテレーションの計画・タスク・レビュー・集約・改善・まとめ）
+
+中断した実行を再開すると（POST /runs/{run_id}/resume、またはワーカーのリース切れによる引き継ぎ）、
+保存済みのノードは実行せずにイベントと出力を復元し、保存済みのLLMの呼び出しは応答を再利用します。
+LLMの呼び出しは (step, リクエストの内容のハッシュ, 同じ内容の呼び出しの何回目か) で識別します。
+再開後のエージェントは中断前と同じ応答を受け取るため同じ順序で同じプロンプトを組み立て、
+中断した時点までAPIを呼ばずに進みます（中断時に応答を待っていた呼び出しだけが再実行される）。
+ノードのチェックポイントのキーには実行計画の fingerprint を含むため、中断後にワークフローを編集した場合は使用しません。
+成功した実行のチェックポイントは削除します（RunRepository.update_status）。
+再開されないまま終了した実行（エラー・キャンセル）のチェックポイントは、終了から RUN_CHECKPOINT_TTL_SECONDS を過ぎると
+起動時と実行の登録時に削除します（prune_checkpoints）。
+
+環境変数:
+    RUN_CHECKPOINTS: "false" の場合はチェックポイントを保存・使用しない（既定true）
+    RUN_CHECKPOINT_TTL_SECONDS: 終了した実行のチェックポイントを残す秒数（既定7日）
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, ContextManager, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from repositories.run_repository import RunRepository
+from services.metrics import RUN_CHECKPOINTS
+from services.structured_logging import use_context_var
+
+logger = logging.getLogger('WorkflowApp')
+
+RUN_CHECKPOINTS_ENABLED = os.getenv("RUN_CHECKPOINTS", "true").lower() != "false"
+RUN_CHECKPOINT_TTL_SECONDS = int(os.getenv("RUN_CHECKPOINT_TTL_SECONDS", str(7 * 24 * 3600)))
+# 実行の登録時に期限切れのチェックポイントを削除する、このプロセスでの最短の間隔（秒）
+CHECKPOINT_PRUNE_INTERVAL_SECONDS = 3600
+
+_last_pruned_at: Optional[float] = None
+
+
+def prune_checkpoints(session_factory: Callable[[], Session], force: bool = False) -> int:
+    """
+    終了から RUN_CHECKPOINT_TTL_SECONDS を過ぎた実行のチェックポイントを削除します。
+
+    Args:
+        session_factory: データベースセッションの作成関数
+        force: False の場合、このプロセスで前回の削除から CHECKPOINT_PRUNE_INTERVAL_SECONDS 以内なら何もしない
+
+    Returns:
+        削除したチェックポイントの数（削除に失敗した場合は警告を記録して0）
+    """
+    global _last_pruned_at
+    now = time.monotonic()
+    if not force and _last_pruned_at is not None and now - _last_pruned_at < CHECKPOINT_PRUNE_INTERVAL_SECONDS:
+        return 0
+    _last_pruned_at = now
+    db = session_factory()
+    try:
+        deleted = RunRepository(db).prune_checkpoints(RUN_CHECKPOINT_TTL_SECONDS)
+    except Exception as e:
+        # 削除は後片付けのため、失敗しても起動や実行の登録は続ける
+        logger.warning(f"期限切れのチェックポイントを削除できませんでした: {str(e)}")
+        db.rollback()
+        return 0
+    finally:
+        db.close()
+    if deleted:
+        logger.info(f"期限切れのチェックポイントを削除しました: {deleted}件")
+    return deleted
+
+
+class RunCheckpoints:
+    """
+    実行1回分のチェックポイントの読み書き
+
+    Args:
+        run_id: 実行ID
+        session_factory: データベースセッションの作成関数
+    """
+
+    def __init__(self, run_id: str, session_factory: Callable[[], Session]):
+        self.run_id = run_id
+        self.session_factory = session_factory
+        self._llm_calls: Counter = Counter()  # リクエストのハッシュ -> この実行での呼び出し回数
+        self._resuming: Optional[bool] = None  # 保存済みのチェックポイントがあるか（初回の参照時に確認する）
+        self.restored_nodes = 0
+        self.restored_llm_calls = 0
+
+    def _get(self, key: str) -> Optional[Any]:
+        db = self.session_factory()
+        try:
+            return RunRepository(db).get_checkpoint(self.run_id, key)
+        finally:
+            db.close()
+
+    def _count(self) -> int:
+        db = self.session_factory()
+        try:
+            return RunRepository(db).count_checkpoints(self.run_id)
+        finally:
+            db.close()
+
+    async def _restore(self, key: str) -> Optional[Any]:
+        # 初めて実行する場合は、チェックポイントごとの参照を省略する
+        if self._resuming is None:
+            self._resuming = await asyncio.to_thread(self._count) > 0
+        if not self._resuming:
+            return None
+        return await asyncio.to_thread(self._get, key)
+
+    def _put(self, key: str, value: Any) -> None:
+        db = self.session_factory()
+        try:
+            RunRepository(db).put_checkpoint(self.run_id, key, value)
+        finally:
+            db.close()
+
+    @staticmethod
+    def node_key(plan_fingerprint: str, node_id: str) -> str:
+        return f"node:{plan_fingerprint}:{node_id}"
+
+    async def restore_node(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        """保存済みのノードのイベントを返します（保存されていない場合はNone）。"""
+        events = await self._restore(key)
+        if events is not None:
+            self.restored_nodes += 1
+            RUN_CHECKPOINTS.labels("node", "restored").inc()
+        return events
+
+    async def save_node(self, key: str, events: List[Dict[str, Any]]) -> None:
+        """成功したノードのイベントを保存します。"""
+        await asyncio.to_thread(self._put, key, events)
+        RUN_CHECKPOINTS.labels("node", "saved").inc()
+
+    def llm_key(self, step: str, request: Dict[str, Any]) -> str:
+        """
+        LLMの呼び出しのキーを返します。呼び出しのたびに、同じ内容の呼び出しの回数を数えます。
+
+        Args:
+            step: 呼び出し元の処理（"plan", "task" など）
+            request: リクエストの内容（モデル・メッセージ・パラメーター）
+        """
+        digest = hashlib.sha256(json.dumps(request, ensure_ascii=False, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+        occurrence = self._llm_calls[digest]
+        self._llm_calls[digest] += 1
+        return f"llm:{step}:{digest}:{occurrence}"
+
+    async def restore_llm(self, key: str) -> Optional[str]:
+        """保存済みのLLMの応答の内容を返します（保存されていない場合はNone）。"""
+        content = await self._restore(key)
+        if content is not None:
+            self.restored_llm_calls += 1
+            RUN_CHECKPOINTS.labels("llm", "restored").inc()
+        return content
+
+    async def save_llm(self, key: str, content: str) -> None:
+        """LLMの応答の内容を保存します。"""
+        await asyncio.to_thread(self._put, key, content)
+        RUN_CHECKPOINTS.labels("llm", "saved").inc()
+
+    async def llm_call(self, step: str, request: Dict[str, Any], call: Callable[[], Awaitable[str]]) -> str:
+        """
+        LLMを呼び出し、応答の内容を保存します。同じ呼び出しの応答が保存済みの場合は呼び出さずに返します。
+
+        Args:
+            step: 呼び出し元の処理（"plan", "task" など）
+            request: リクエストの内容（モデル・メッセージ・パラメーター）
+            call: LLMを呼び出して応答の内容を返す関数
+
+        Returns:
+            応答の内容
+        """
+        key = self.llm_key(step, request)
+        content = await self.restore_llm(key)
+        if content is None:
+            content = await call()
+            await self.save_llm(key, content)
+        return content
+
+
+_current: ContextVar[Optional[RunCheckpoints]] = ContextVar("run_checkpoints", default=None)
+
+
+def current_checkpoints() -> Optional[RunCheckpoints]:
+    """実行中のワークフローのチェックポイントを返します（実行中でない場合はNone）。"""
+    return _current.get()
+
+
+def use_checkpoints(checkpoints: Optional[RunCheckpoints]) -> ContextManager[None]:
+    """ブロック内のLLMの呼び出しに、実行のチェックポイントを使用します。"""
+    return use_context_var(_current, checkpoints)
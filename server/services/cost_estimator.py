@@ -0,0 +1,294 @@
+"""
+ワークフローの実行前のコスト・所要時間の見積もり
+
+実行計画（実行順・検証済みの設定）をたどり、ノードごとのLLM呼び出し回数・入力と出力のトークン数・所要時間を求めます。
+入力トークン数は実際に使用するプロンプトのテンプレートと、直前のノードの出力の見積もりから数えます。
+出力トークン数・呼び出し1回あたりの所要時間・エージェントの計画あたりのタスク数は、
+直近の実行で記録したLLM呼び出しの集計（run_llm_stats テーブル。services/llm_stats.py）のモデル・処理ごとの平均を使用し、
+記録がない場合は既定値を使用します。集計はDBに保存するため、ワーカーや他のAPIプロセスで実行した実行も含まれます。
+
+エージェントは、最初のイテレーションで品質チェックを通過する場合を expected、
+max_iterations・max_improvement_cycles の上限まで改善を繰り返す場合を max として見積もります。
+"""
+import math
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from services.execution_plan import PlanStep
+from services.generative_ai_service import DEFAULT_MODEL, JSON_SYSTEM_PROMPT
+from services.llm_stats import load_llm_stats
+from services.tokens import count_tokens
+
+# 記録がない場合の、処理ごとの出力トークン数
+DEFAULT_COMPLETION_TOKENS = {
+    "plan": 400,
+    "task": 500,
+    "review": 350,
+    "aggregate": 450,
+    "improve": 600,
+    "generative_ai": 300,
+}
+# 記録がない場合の、エージェントの計画あたりのタスクの呼び出し回数
+DEFAULT_TASKS_PER_PLAN = 3
+# 同じ処理として集計する処理（まとめて実行したタスクは、タスクの呼び出し1回として数える）
+STEP_ALIASES = {"task_batch": "task"}
+# 記録がない場合の、呼び出し1回あたりの固定の所要時間と出力1トークンあたりの所要時間（約50トークン/秒）
+DEFAULT_LATENCY_BASE_SECONDS = 0.5
+DEFAULT_SECONDS_PER_TOKEN = 0.02
+
+
+@dataclass
+class Range:
+    """見積もりの値（expected: 想定される値、max: 上限まで繰り返した場合の値）"""
+    expected: float = 0.0
+    max: float = 0.0
+
+    def __add__(self, other: "Range") -> "Range":
+        return Range(self.expected + other.expected, self.max + other.max)
+
+    def to_dict(self, seconds: bool = False) -> Dict[str, float]:
+        """秒はミリ秒単位に丸め、回数・トークン数は切り上げた整数で返します。"""
+        if seconds:
+            return {"expected": round(self.expected, 3), "max": round(self.max, 3)}
+        return {"expected": math.ceil(self.expected), "max": math.ceil(self.max)}
+
+
+def _add(current: Optional[Tuple[int, float]], count: int, total: float) -> Tuple[int, float]:
+    return (count, total) if current is None else (current[0] + count, current[1] + total)
+
+
+class LLMStats:
+    """
+    直近の実行で記録したLLM呼び出しの集計の、モデル・処理ごとの平均
+
+    作成時点の集計を保持します（見積もりごとに作成する）。
+
+    Args:
+        session_factory: データベースセッションの作成関数
+    """
+
+    def __init__(self, session_factory: Callable[[], Session]):
+        self._calls: Dict[Tuple[str, str], int] = {}  # (モデル, 処理) -> 呼び出し回数（失敗を含む）
+        self._latency: Dict[Tuple[str, str], Tuple[int, float]] = {}  # 成功した呼び出しの回数と合計時間
+        self._completion: Dict[Tuple[str, str], Tuple[int, float]] = {}  # 出力トークン数の記録の回数と合計
+        for (model, step), values in load_llm_stats(session_factory).items():
+            key = (model, STEP_ALIASES.get(step, step))
+            self._calls[key] = self._calls.get(key, 0) + int(values["calls"])
+            if values["success_calls"]:
+                self._latency[key] = _add(self._latency.get(key), int(values["success_calls"]), values["success_seconds"])
+            if values["completion_calls"]:
+                self._completion[key] = _add(self._completion.get(key), int(values["completion_calls"]), values["completion_tokens"])
+
+    @property
+    def history_calls(self) -> int:
+        """記録されているLLM呼び出しの回数"""
+        return sum(self._calls.values())
+
+    def completion_tokens(self, model: str, step: str) -> float:
+        """呼び出し1回あたりの出力トークン数"""
+        if (model, step) in self._completion:
+            count, total = self._completion[(model, step)]
+            return total / count
+        return DEFAULT_COMPLETION_TOKENS.get(step, DEFAULT_COMPLETION_TOKENS["generative_ai"])
+
+    def latency(self, model: str, step: str, completion_tokens: float) -> float:
+        """
+        呼び出し1回あたりの所要時間（秒）
+
+        モデル・処理の記録がある場合はその平均、モデルの他の処理の記録のみがある場合は
+        出力トークンあたりの所要時間から求め、記録がない場合は既定値から求めます。
+        """
+        if (model, step) in self._latency:
+            count, total = self._latency[(model, step)]
+            return total / count
+
+        seconds = sum(total for (m, _), (_, total) in self._latency.items() if m == model)
+        tokens = sum(
+            self._completion[key][1] for key in self._latency if key[0] == model and key in self._completion
+        )
+        if seconds and tokens:
+            return seconds / tokens * completion_tokens
+        return DEFAULT_LATENCY_BASE_SECONDS + DEFAULT_SECONDS_PER_TOKEN * completion_tokens
+
+    def tasks_per_plan(self, model: str) -> Optional[int]:
+        """エージェントの計画あたりのタスクの呼び出し回数（まとめて実行した呼び出しを含む。記録がない場合はNone）"""
+        plans = self._calls.get((model, "plan"), 0)
+        if not plans:
+            return None
+        return max(1, round(self._calls.get((model, "task"), 0) / plans))
+
+
+class WorkflowEstimator:
+    """
+    ワークフローの実行前の見積もり
+
+    Args:
+        workflow_service: 実行計画とプロンプトのテンプレートを取得するワークフローの実行サービス
+        session_factory: LLM呼び出しの集計を読み込むデータベースセッションの作成関数
+    """
+
+    def __init__(self, workflow_service, session_factory: Callable[[], Session] = SessionLocal):
+        self.workflow_service = workflow_service
+        self.session_factory = session_factory
+        self.agent_service = workflow_service.agent_service
+
+    def estimate(self, nodes: List[dict], workflow_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        ワークフローの実行を見積もります。
+
+        Args:
+            nodes: ノードのリスト
+            workflow_id: ワークフローID（実行計画のキャッシュに使用する）
+
+        Returns:
+            全体とノードごとのLLM呼び出し回数・入力と出力のトークン数・所要時間（秒）の見積もり
+        """
+        plan = self.workflow_service.get_plan(nodes, workflow_id)
+        stats = LLMStats(self.session_factory)
+
+        estimates = []
+        previous = Range()  # 直前のノードの出力のトークン数
+        for plan_step in plan.steps:
+            for step in plan_step.chain or (plan_step,):
+                estimate, output = self._estimate_step(step, previous, stats)
+                estimates.append(estimate)
+                if output is not None:
+                    previous = output
+
+        totals = {key: Range() for key in ("llm_calls", "input_tokens", "output_tokens", "wall_seconds")}
+        for estimate in estimates:
+            for key in totals:
+                totals[key] = totals[key] + estimate[key]
+        return {
+            "workflow_id": workflow_id,
+            **{key: value.to_dict(key == "wall_seconds") for key, value in totals.items()},
+            "history_calls": stats.history_calls,
+            "nodes": [
+                {key: value.to_dict(key == "wall_seconds") if isinstance(value, Range) else value
+                 for key, value in estimate.items()}
+                for estimate in estimates
+            ],
+        }
+
+    def _estimate_step(self, step: PlanStep, previous: Range, stats: LLMStats) -> Tuple[Dict[str, Any], Optional[Range]]:
+        """ノードの見積もりと、ノードの出力のトークン数（出力しない場合はNone）を返します。"""
+        estimate = {
+            "node_id": step.node_id,
+            "node_type": step.node_type,
+            "model": None,
+            "llm_calls": Range(),
+            "input_tokens": Range(),
+            "output_tokens": Range(),
+            "wall_seconds": Range(),
+            "error": step.error,
+        }
+        if step.error:
+            # 実行時にエラーになるノードは出力しない
+            return estimate, None
+
+        config = step.config
+        if step.node_type == "extract_text":
+            return estimate, self._document_tokens(config)
+        if step.node_type == "generative_ai":
+            return self._estimate_generative_ai(estimate, config, previous, stats)
+        if step.node_type == "agent":
+            return self._estimate_agent(estimate, config, previous, stats)
+        # フォーマッターは入力と同じ長さのテキストを出力する
+        return estimate, previous
+
+    def _document_tokens(self, config: Mapping[str, Any]) -> Range:
+        """テキスト抽出ノードの出力（文書のテキストを含むプロンプト）のトークン数"""
+        tokens = count_tokens(self.workflow_service.document_prompt(config["file_name"], ""))
+        if "text_blob_id" in config:
+            # 保存済みのテキストは読み込まず、先頭部分のトークン密度と全体のバイト数から求める
+            preview = config.get("text_preview") or ""
+            preview_bytes = len(preview.encode("utf-8"))
+            if preview_bytes:
+                tokens += math.ceil(count_tokens(preview) * (config.get("text_size") or preview_bytes) / preview_bytes)
+        else:
+            tokens += count_tokens(config["extracted_text"])
+        return Range(tokens, tokens)
+
+    def _estimate_generative_ai(self, estimate: Dict[str, Any], config: Mapping[str, Any],
+                                previous: Range, stats: LLMStats) -> Tuple[Dict[str, Any], Range]:
+        model = config["model"]
+        prompt_tokens = count_tokens(self.workflow_service.generative_ai_prompt(config["prompt"], ""))
+        output = Range(min(config["max_tokens"], stats.completion_tokens(model, "generative_ai")), config["max_tokens"])
+        estimate.update(
+            model=model,
+            llm_calls=Range(1, 1),
+            input_tokens=Range(prompt_tokens + previous.expected, prompt_tokens + previous.max),
+            output_tokens=output,
+            wall_seconds=Range(stats.latency(model, "generative_ai", output.expected),
+                               stats.latency(model, "generative_ai", output.max)),
+        )
+        return estimate, output
+
+    def _estimate_agent(self, estimate: Dict[str, Any], config: Mapping[str, Any],
+                        previous: Range, stats: LLMStats) -> Tuple[Dict[str, Any], Range]:
+        agent = self.agent_service
+        model = DEFAULT_MODEL
+        outputs = {step: stats.completion_tokens(model, step) for step in ("plan", "task", "review", "aggregate", "improve")}
+        tasks = stats.tasks_per_plan(model)
+        if tasks is None:
+            # 記録がない場合は、既定のタスク数をまとめて実行する場合の呼び出し回数
+            # （計画をストリーミングで受信する場合、最初のタスクは単独で実行する）
+            if agent.stream_plan:
+                tasks = 1 + math.ceil((DEFAULT_TASKS_PER_PLAN - 1) / max(1, agent.task_batch_max_tasks))
+            else:
+                tasks = math.ceil(DEFAULT_TASKS_PER_PLAN / max(1, agent.task_batch_max_tasks))
+            outputs["task"] = outputs["task"] * DEFAULT_TASKS_PER_PLAN / tasks
+        personas = list(agent.quality_check_personas.values())
+        system_tokens = count_tokens(JSON_SYSTEM_PROMPT)
+        empty_context = {"previous_text": ""}
+
+        # テンプレート部分のトークン数（直前のノードの出力・生成された内容を除く）
+        plan_tokens = system_tokens + count_tokens(agent.plan_prompt(
+            config["goal"], list(config.get("constraints", [])), dict(config.get("capabilities", {})), empty_context
+        ))
+        task_tokens = system_tokens + count_tokens(agent.task_prompt({}, empty_context)) + outputs["plan"] / tasks
+        review_tokens = [system_tokens + count_tokens(agent.review_prompt("", persona)) for persona in personas]
+        aggregate_tokens = system_tokens + count_tokens(agent.aggregate_prompt([])) + len(personas) * outputs["review"]
+        improve_tokens = count_tokens(agent.improvement_prompt("", [])) + outputs["aggregate"]
+        summary_tokens = system_tokens + count_tokens(agent.review_prompt("", agent.quality_check_personas["summarizer"]))
+
+        def iteration(context_tokens: float, content_tokens: float) -> List[Tuple[str, float]]:
+            # 計画 -> タスク -> ペルソナごとのレビュー -> レビューの集約（入力トークン数は呼び出しごと）
+            return (
+                [("plan", plan_tokens + context_tokens)]
+                + [("task", task_tokens + context_tokens)] * tasks
+                + [("review", tokens + content_tokens) for tokens in review_tokens]
+                + [("aggregate", aggregate_tokens)]
+            )
+
+        # expected: 最初のイテレーションで品質チェックを通過し、まとめを作成する
+        content = outputs["task"]
+        expected_calls = iteration(previous.expected, content) + [("review", summary_tokens + content)]
+        # max: 上限のイテレーションまで、改善を適用しながら繰り返す
+        content = max(outputs["task"], outputs["improve"])
+        improvements = min(agent.max_iterations, agent.max_improvement_cycles)
+        max_calls = (
+            iteration(previous.max, content) * agent.max_iterations
+            + [("improve", improve_tokens + content)] * improvements
+        )
+
+        def totals(calls: List[Tuple[str, float]]) -> Tuple[float, float, float]:
+            input_tokens = sum(tokens for _, tokens in calls)
+            output_tokens = sum(outputs[step] for step, _ in calls)
+            seconds = sum(stats.latency(model, step, outputs[step]) for step, _ in calls)
+            return input_tokens, output_tokens, seconds
+
+        expected_in, expected_out, expected_seconds = totals(expected_calls)
+        max_in, max_out, max_seconds = totals(max_calls)
+        estimate.update(
+            model=model,
+            llm_calls=Range(len(expected_calls), len(max_calls)),
+            input_tokens=Range(expected_in, max_in),
+            output_tokens=Range(expected_out, max_out),
+            wall_seconds=Range(expected_seconds, max_seconds),
+        )
+        # エージェントの出力は最後に実行したタスクの結果
+        return estimate, Range(outputs["task"], outputs["task"])
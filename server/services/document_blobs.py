@@ -0,0 +1,57 @@
+"""
+参照されていない文書のテキスト（document_blobs）の削除
+
+PDFのアップロードで保存したテキストは、クライアントがノードを保存するまでどのノードからも参照されません。
+ノードが保存されなかった場合や、ノードの文書を置き換えた・削除した場合に残ったテキストを、
+保存から DOCUMENT_BLOB_GRACE_SECONDS を過ぎた時点で起動時とアップロード時に削除します。
+
+環境変数:
+    DOCUMENT_BLOB_GRACE_SECONDS: 保存したテキストを、参照されていなくても残す秒数（既定1日）
+"""
+import logging
+import os
+import time
+from typing import Callable, Optional
+
+from sqlalchemy.orm import Session
+
+from repositories.document_blob_repository import DocumentBlobRepository
+
+logger = logging.getLogger('WorkflowApp')
+
+DOCUMENT_BLOB_GRACE_SECONDS = int(os.getenv("DOCUMENT_BLOB_GRACE_SECONDS", str(24 * 3600)))
+# アップロード時に参照されていないテキストを削除する、このプロセスでの最短の間隔（秒）
+DOCUMENT_BLOB_PRUNE_INTERVAL_SECONDS = 3600
+
+_last_pruned_at: Optional[float] = None
+
+
+def prune_document_blobs(session_factory: Callable[[], Session], force: bool = False) -> int:
+    """
+    保存から DOCUMENT_BLOB_GRACE_SECONDS を過ぎ、どのノードからも参照されていないテキストを削除します。
+
+    Args:
+        session_factory: データベースセッションの作成関数
+        force: False の場合、このプロセスで前回の削除から DOCUMENT_BLOB_PRUNE_INTERVAL_SECONDS 以内なら何もしない
+
+    Returns:
+        削除したテキストの数（削除に失敗した場合は警告を記録して0）
+    """
+    global _last_pruned_at
+    now = time.monotonic()
+    if not force and _last_pruned_at is not None and now - _last_pruned_at < DOCUMENT_BLOB_PRUNE_INTERVAL_SECONDS:
+        return 0
+    _last_pruned_at = now
+    db = session_factory()
+    try:
+        deleted = DocumentBlobRepository(db).prune_unreferenced(DOCUMENT_BLOB_GRACE_SECONDS)
+    except Exception as e:
+        # 削除は後片付けのため、失敗しても起動やアップロードは続ける
+        logger.warning(f"参照されていない文書のテキストを削除できませんでした: {str(e)}")
+        db.rollback()
+        return 0
+    finally:
+        db.close()
+    if deleted:
+        logger.info(f"参照されていない文書のテキストを削除しました: {deleted}件")
+    return deleted
@@ -0,0 +1,262 @@
+"""
+PDFからのテキスト抽出
+
+ページごとに埋め込みのテキストレイヤー（popplerの pdftotext）を確認し、
+十分なテキストがあるページはそのまま使用します。画像のみのページやテキストの品質が低いページだけを
+ラスタライズしてOCR（tesseract）します。
+
+環境変数:
+    PDF_TEXT_MIN_CHARS: テキストレイヤーを採用するページの最小文字数（空白を除く、既定20）
+    PDF_TEXT_MIN_QUALITY: テキストレイヤーを採用する品質の下限 0.0〜1.0（既定0.6）
+    OCR_LANG: tesseractの言語（既定 jpn+eng）
+    OCR_DPI: ラスタライズの解像度（既定200）
+    OCR_GRAYSCALE: グレースケールでラスタライズするか（既定true。カラーの1/3のメモリ）
+    OCR_WINDOW_PAGES: 一度にラスタライズする最大ページ数（既定8）
+    OCR_TO_DISK: ラスタライズした画像を一時フォルダに書き出し、1ページずつOCRするか（既定true）
+    OCR_MAX_MEMORY_MB: ラスタライズした画像に使うメモリの上限（既定256MB）。
+        メモリ上でラスタライズする場合はウィンドウのページ数を、1ページでも超える場合は解像度を下げる
+
+ラスタライズはページ範囲のウィンドウごとに行い、ウィンドウのOCRが終わるたびに画像を解放するため、
+ページ数が増えてもメモリの使用量は一定です。
+"""
+import logging
+import os
+import re
+import subprocess
+import tempfile
+import time
+import unicodedata
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import pytesseract
+from pdf2image import convert_from_path, pdfinfo_from_path
+
+from services.metrics import OCR_PAGE_DURATION, PDF_PAGES
+
+logger = logging.getLogger('WorkflowApp')
+
+PDF_TEXT_MIN_CHARS = int(os.getenv("PDF_TEXT_MIN_CHARS", "20"))
+PDF_TEXT_MIN_QUALITY = float(os.getenv("PDF_TEXT_MIN_QUALITY", "0.6"))
+OCR_LANG = os.getenv("OCR_LANG", "jpn+eng")
+OCR_DPI = int(os.getenv("OCR_DPI", "200"))
+OCR_GRAYSCALE = os.getenv("OCR_GRAYSCALE", "true").lower() == "true"
+OCR_WINDOW_PAGES = int(os.getenv("OCR_WINDOW_PAGES", "8"))
+OCR_TO_DISK = os.getenv("OCR_TO_DISK", "true").lower() == "true"
+OCR_MAX_MEMORY_MB = int(os.getenv("OCR_MAX_MEMORY_MB", "256"))
+
+# pdfinfoでページサイズが取得できない場合はA4とみなす（pt）
+DEFAULT_PAGE_SIZE_PT = (595.0, 842.0)
+MIN_OCR_DPI = 72
+
+
+@dataclass
+class PageText:
+    page: int  # 1始まり
+    text: str
+    method: str  # "text_layer" | "ocr"
+
+
+@dataclass
+class ExtractedDocument:
+    pages: List[PageText] = field(default_factory=list)
+
+    @property
+    def ocr_pages(self) -> List[int]:
+        return [page.page for page in self.pages if page.method == "ocr"]
+
+    @property
+    def text(self) -> str:
+        return "".join(f"\n--- Page {page.page} ---\n{page.text}" for page in self.pages).strip()
+
+
+def text_quality(text: str) -> float:
+    """
+    テキストレイヤーの品質を 0.0〜1.0 で返します。
+
+    空白以外の文字のうち、文字・数字・句読点・記号の割合です。フォントの対応表が壊れたPDFでは
+    置換文字（U+FFFD）や制御文字、私用領域の文字が多くなるため低くなります。
+    """
+    total = 0
+    valid = 0
+    for char in text:
+        if char.isspace():
+            continue
+        total += 1
+        if char == "\ufffd":
+            continue
+        if unicodedata.category(char)[0] in ("L", "N", "P", "S"):
+            valid += 1
+    return valid / total if total else 0.0
+
+
+def has_usable_text(text: str) -> bool:
+    """ページのテキストレイヤーをそのまま使えるかどうかを判定します。"""
+    stripped = "".join(text.split())
+    return len(stripped) >= PDF_TEXT_MIN_CHARS and text_quality(stripped) >= PDF_TEXT_MIN_QUALITY
+
+
+def _windows(pages: List[int], size: int) -> Iterator[Tuple[int, int]]:
+    """ページ番号のリストを、連続した最大size ページの範囲 (first, last) に分割します。"""
+    first = last = None
+    for page in pages:
+        if first is not None and page == last + 1 and page - first < size:
+            last = page
+            continue
+        if first is not None:
+            yield first, last
+        first = last = page
+    if first is not None:
+        yield first, last
+
+
+class DocumentService:
+    def __init__(
+        self,
+        dpi: int = OCR_DPI,
+        grayscale: bool = OCR_GRAYSCALE,
+        window_pages: int = OCR_WINDOW_PAGES,
+        to_disk: bool = OCR_TO_DISK,
+        max_memory_mb: int = OCR_MAX_MEMORY_MB
+    ):
+        self.dpi = dpi
+        self.grayscale = grayscale
+        self.window_pages = max(1, window_pages)
+        self.to_disk = to_disk
+        self.max_memory_bytes = max_memory_mb * 1024 * 1024
+
+    def pdf_info(self, file_path: str) -> Dict[str, object]:
+        return pdfinfo_from_path(file_path)
+
+    def page_count(self, file_path: str) -> int:
+        return int(self.pdf_info(file_path)["Pages"])
+
+    def _page_size_pt(self, info: Dict[str, object]) -> Tuple[float, float]:
+        match = re.match(r"\s*([\d.]+) x ([\d.]+) pts", str(info.get("Page size", "")))
+        return (float(match.group(1)), float(match.group(2))) if match else DEFAULT_PAGE_SIZE_PT
+
+    def page_bytes(self, info: Dict[str, object], dpi: int) -> int:
+        """1ページをラスタライズした画像のメモリ上のサイズを見積もります。"""
+        width_pt, height_pt = self._page_size_pt(info)
+        channels = 1 if self.grayscale else 3
+        return int(width_pt / 72 * dpi) * int(height_pt / 72 * dpi) * channels
+
+    def raster_settings(self, info: Dict[str, object]) -> Tuple[int, int]:
+        """
+        メモリの上限に収まる解像度とウィンドウのページ数を決めます。
+
+        Returns:
+            (解像度, 一度にラスタライズするページ数)
+        """
+        dpi = self.dpi
+        # 1ページでも上限を超える場合は、上限に収まるまで解像度を下げる
+        while dpi > MIN_OCR_DPI and self.page_bytes(info, dpi) > self.max_memory_bytes:
+            dpi = max(MIN_OCR_DPI, int(dpi * 0.8))
+        if self.to_disk:
+            # 画像はファイルに書き出し、メモリには1ページずつ読み込む
+            return dpi, self.window_pages
+        per_page = max(1, self.page_bytes(info, dpi))
+        return dpi, max(1, min(self.window_pages, self.max_memory_bytes // per_page))
+
+    def extract_text_layer(self, file_path: str) -> Optional[List[str]]:
+        """
+        pdftotext で全ページのテキストレイヤーを抽出します。
+
+        Returns:
+            ページごとのテキスト。pdftotext が使えない場合はNone
+        """
+        try:
+            completed = subprocess.run(
+                ["pdftotext", "-enc", "UTF-8", file_path, "-"],
+                capture_output=True, check=True
+            )
+        except (FileNotFoundError, subprocess.CalledProcessError) as e:
+            logger.warning(f"テキストレイヤーを抽出できませんでした。すべてのページをOCRします: {str(e)}")
+            return None
+        # ページはフォームフィード区切り（最後のページの後にも付く）
+        output = completed.stdout.decode("utf-8", errors="replace")
+        if output.endswith("\f"):
+            output = output[:-1]
+        return output.split("\f")
+
+    def _ocr_image(self, image) -> str:
+        started_at = time.perf_counter()
+        text = pytesseract.image_to_string(image, lang=OCR_LANG)
+        OCR_PAGE_DURATION.observe(time.perf_counter() - started_at)
+        return text
+
+    def ocr_pages(self, file_path: str, pages: List[int], info: Optional[Dict[str, object]] = None) -> Dict[int, str]:
+        """
+        指定したページをウィンドウごとにラスタライズしてOCRします。
+
+        Args:
+            file_path: PDFファイルのパス
+            pages: OCRするページの番号（昇順）
+            info: pdfinfoの結果（省略時は取得する）
+
+        Returns:
+            ページ番号 -> OCRしたテキスト
+        """
+        if not pages:
+            return {}
+        info = info or self.pdf_info(file_path)
+        dpi, window_pages = self.raster_settings(info)
+        results: Dict[int, str] = {}
+
+        if self.to_disk:
+            with tempfile.TemporaryDirectory(prefix="ocr_") as folder:
+                for first, last in _windows(pages, window_pages):
+                    paths = convert_from_path(
+                        file_path, dpi=dpi, first_page=first, last_page=last,
+                        output_folder=folder, paths_only=True, grayscale=self.grayscale
+                    )
+                    for page, path in zip(range(first, last + 1), paths):
+                        # tesseractにファイルのパスを渡すため、画像はこのプロセスのメモリに読み込まない
+                        results[page] = self._ocr_image(path)
+                        os.remove(path)
+            return results
+
+        for first, last in _windows(pages, window_pages):
+            images = convert_from_path(file_path, dpi=dpi, first_page=first, last_page=last, grayscale=self.grayscale)
+            for page, image in zip(range(first, last + 1), images):
+                results[page] = self._ocr_image(image)
+                image.close()
+            del images
+        return results
+
+    def extract_text(self, file_path: str) -> ExtractedDocument:
+        """
+        PDFからテキストを抽出します。テキストレイヤーが使えないページのみOCRします。
+
+        同期処理のため、APIからは asyncio.to_thread で呼び出してください。
+
+        Args:
+            file_path: PDFファイルのパス
+
+        Returns:
+            ページごとのテキストと抽出方法
+        """
+        info = self.pdf_info(file_path)
+        page_count = int(info["Pages"])
+        layer = self.extract_text_layer(file_path) or []
+
+        layer_texts: Dict[int, str] = {}
+        for page in range(1, page_count + 1):
+            layer_text = layer[page - 1] if page <= len(layer) else ""
+            if has_usable_text(layer_text):
+                layer_texts[page] = layer_text.strip()
+
+        ocr_targets = [page for page in range(1, page_count + 1) if page not in layer_texts]
+        ocr_texts = self.ocr_pages(file_path, ocr_targets, info)
+
+        document = ExtractedDocument()
+        for page in range(1, page_count + 1):
+            if page in layer_texts:
+                document.pages.append(PageText(page, layer_texts[page], "text_layer"))
+            else:
+                document.pages.append(PageText(page, ocr_texts.get(page, ""), "ocr"))
+            PDF_PAGES.labels(document.pages[-1].method).inc()
+
+        if document.ocr_pages:
+            logger.info(f"OCR pages: {document.ocr_pages} / {page_count}")
+        return document
@@ -0,0 +1,233 @@
+"""
+ワークフローの実行計画
+
+ワークフローのバージョン（ノードの構成と更新日時）ごとに、実行順序・レベル・
+ノードタイプごとのハンドラ・検証済みの設定を一度だけ求め、変更不可の実行計画として保持します。
+同じバージョンを繰り返し実行する場合はキャッシュ済みの計画を再利用します。
+"""
+import copy
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from services.budget import validate_limits
+from services.graph import build_graph, execution_levels, execution_order
+from services.metrics import PLAN_CACHE_REQUESTS
+
+logger = logging.getLogger('WorkflowApp')
+
+# 連続するフォーマッターをまとめて実行する関数のキー（handlersに含まれる場合のみ融合する）
+FORMATTER_CHAIN = "formatter_chain"
+
+# ノードタイプごとの必須の設定項目
+REQUIRED_CONFIG_KEYS: Dict[str, Tuple[str, ...]] = {
+    "extract_text": ("file_name",),
+    "generative_ai": ("prompt", "model", "temperature", "max_tokens"),
+    "formatter": (),
+    "agent": ("goal",),
+}
+
+# ノードタイプごとの、いずれか1つが必須の設定項目
+ONE_OF_CONFIG_KEYS: Dict[str, Tuple[str, ...]] = {
+    "extract_text": ("extracted_text", "text_blob_id"),
+}
+
+
+@dataclass(frozen=True)
+class PlanStep:
+    node_id: str
+    node_type: str
+    config: Mapping[str, Any]  # 検証済みの設定（読み取り専用）
+    handler: Optional[Callable] = None  # ノードタイプに対応する実行関数
+    error: Optional[str] = None  # 検証エラー（実行時にこのノードのエラーとして返す）
+    chain: Tuple["PlanStep", ...] = ()  # まとめて実行する連続したノード（フォーマッターの融合）
+
+
+@dataclass(frozen=True)
+class ExecutionPlan:
+    workflow_id: Optional[str]
+    fingerprint: str
+    steps: Tuple[PlanStep, ...]  # 実行順
+    levels: Tuple[Tuple[str, ...], ...]  # 同時に実行できるノードIDのまとまり
+
+
+def snapshot_nodes(nodes: Iterable[Any]) -> List[dict]:
+    """
+    NodeDB のリストを実行用のノードのリストに変換します。
+    updated_at は実行計画のキャッシュキー（fingerprint）に使用します。
+    """
+    return [
+        {
+            "id": node.id,
+            "node_type": node.node_type,
+            "config": node.config,
+            "updated_at": node.updated_at.isoformat() if node.updated_at else None
+        }
+        for node in nodes
+    ]
+
+
+def fingerprint(nodes: List[dict]) -> str:
+    """
+    ワークフローのバージョンを表すハッシュを返します。
+
+    すべてのノードに updated_at がある場合は ID・タイプ・更新日時のみをハッシュし、
+    ない場合（DBを経由しない実行など）は設定の内容をハッシュします。
+    """
+    digest = hashlib.sha256()
+    if all(node.get("updated_at") for node in nodes):
+        for node in nodes:
+            digest.update(f"{node['id']}\0{node['node_type']}\0{node['updated_at']}\n".encode())
+    else:
+        digest.update(json.dumps(
+            [[node["id"], node["node_type"], node["config"]] for node in nodes],
+            sort_keys=True, ensure_ascii=False, default=str
+        ).encode())
+    return digest.hexdigest()
+
+
+def _freeze(config: dict) -> Mapping[str, Any]:
+    """設定をディープコピーし、読み取り専用にします（実行中の変更がDBのノードや他の実行に影響しないように）。"""
+    return MappingProxyType(copy.deepcopy(config))
+
+
+def _validate(node_type: str, config: dict) -> Optional[str]:
+    if node_type not in REQUIRED_CONFIG_KEYS:
+        return f"未知のノードタイプ: {node_type}"
+    missing = [key for key in REQUIRED_CONFIG_KEYS[node_type] if key not in config]
+    one_of = ONE_OF_CONFIG_KEYS.get(node_type)
+    if one_of and not any(key in config for key in one_of):
+        missing.append(" または ".join(one_of))
+    if missing:
+        return f"必須の設定がありません: {', '.join(missing)}"
+    return validate_limits(config.get("limits"))
+
+
+def compile_plan(
+    nodes: List[dict],
+    handlers: Mapping[str, Callable],
+    workflow_id: Optional[str] = None,
+    node_fingerprint: Optional[str] = None,
+) -> ExecutionPlan:
+    """
+    ノードのリストから実行計画を作成します。O(V + E)
+
+    Args:
+        nodes: ノードのリスト
+        handlers: ノードタイプ -> 実行関数
+        workflow_id: ワークフローID
+        node_fingerprint: 計算済みのfingerprint（省略時は計算する）
+
+    Returns:
+        実行計画
+    """
+    graph = build_graph(nodes)
+    order = execution_order(graph)
+    node_map = {node["id"]: node for node in nodes}
+
+    steps = []
+    for node_id in order:
+        node = node_map[node_id]
+        node_type = node["node_type"]
+        steps.append(PlanStep(
+            node_id=node_id,
+            node_type=node_type,
+            config=_freeze(node["config"]),
+            handler=handlers.get(node_type),
+            error=_validate(node_type, node["config"])
+        ))
+
+    if FORMATTER_CHAIN in handlers:
+        steps = _fuse_formatters(steps, handlers[FORMATTER_CHAIN])
+
+    return ExecutionPlan(
+        workflow_id=workflow_id,
+        fingerprint=node_fingerprint or fingerprint(nodes),
+        steps=tuple(steps),
+        levels=tuple(tuple(level) for level in execution_levels(graph, order))
+    )
+
+
+def _fuse_formatters(steps: List[PlanStep], chain_handler: Callable) -> List[PlanStep]:
+    """
+    実行順で連続するフォーマッターノードを1つのステップにまとめます。
+
+    各ノードは直前に実行されたノードの出力を入力とするため、実行順で連続するフォーマッターは
+    1本のパイプラインとして、テキストを1回走査するだけで適用できます。
+    """
+    fused: List[PlanStep] = []
+    run: List[PlanStep] = []
+
+    def flush():
+        if len(run) >= 2:
+            head = run[0]
+            fused.append(PlanStep(
+                node_id=head.node_id,
+                node_type=head.node_type,
+                config=head.config,
+                handler=chain_handler,
+                chain=tuple(run)
+            ))
+        else:
+            fused.extend(run)
+        run.clear()
+
+    for step in steps:
+        if step.node_type == "formatter" and step.error is None:
+            run.append(step)
+        else:
+            flush()
+            fused.append(step)
+    flush()
+    return fused
+
+
+class PlanCache:
+    """
+    実行計画のLRUキャッシュ
+
+    キーは (ワークフローID, fingerprint) です。ノードが変更されると fingerprint が変わるため
+    古い計画は使われなくなりますが、変更時には invalidate() で明示的に削除します。
+    """
+
+    def __init__(self, max_size: int = 256):
+        self.max_size = max_size
+        self._plans: "OrderedDict[Tuple[str, str], ExecutionPlan]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, workflow_id: str, node_fingerprint: str) -> Optional[ExecutionPlan]:
+        key = (workflow_id, node_fingerprint)
+        with self._lock:
+            plan = self._plans.get(key)
+            if plan is None:
+                self.misses += 1
+                PLAN_CACHE_REQUESTS.labels("miss").inc()
+                return None
+            self._plans.move_to_end(key)
+            self.hits += 1
+            PLAN_CACHE_REQUESTS.labels("hit").inc()
+            return plan
+
+    def put(self, plan: ExecutionPlan) -> None:
+        key = (plan.workflow_id, plan.fingerprint)
+        with self._lock:
+            self._plans[key] = plan
+            self._plans.move_to_end(key)
+            while len(self._plans) > self.max_size:
+                self._plans.popitem(last=False)
+
+    def invalidate(self, workflow_id: str) -> None:
+        """ワークフローのすべてのバージョンの計画を削除します。"""
+        with self._lock:
+            for key in [key for key in self._plans if key[0] == workflow_id]:
+                del self._plans[key]
+
+    def __len__(self) -> int:
+        return len(self._plans)
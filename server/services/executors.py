@@ -0,0 +1,182 @@
+"""
+CPU負荷の高い処理の実行バックエンド
+
+処理の種類（ノードタイプ、SSEのシリアライズなど）ごとに、次のバックエンドを選択します。
+
+    inline : イベントループ上で実行する（小さな処理はコンテキストの切り替えより速い）
+    thread : 共有のスレッドプールで実行する。引数と結果はコピーせずに参照を渡す
+             （mojimojiなどCで実装された変換や、大きな文字列の結合の間はイベントループが他の処理を進められる）
+    process: 共有のプロセスプールで実行する。GILの影響を受けないが、引数と結果はpickleで1回ずつ受け渡すため、
+             関数と引数はpickle可能である必要がある（ラムダやキャンセルトークンは渡せない）
+
+プールはプロセス内で共有し、最初に使用したときにCPU数から決めた上限で作成します。
+大きさが EXECUTOR_INLINE_MAX_CHARS 以下の処理は、バックエンドによらずイベントループ上で実行します。
+バックエンドごとに待ち時間（executor_queue_seconds）と実行時間（executor_run_seconds）を記録します。
+
+環境変数:
+    EXECUTOR_BACKENDS: 処理の種類ごとのバックエンド（例: "formatter=thread,formatter_chain=process"）。
+        指定のない種類は DEFAULT_BACKENDS、それにもない種類は inline
+    EXECUTOR_THREADS: スレッドプールのスレッド数（既定 min(32, CPU数 + 4)）
+    EXECUTOR_PROCESSES: プロセスプールのプロセス数（既定 CPU数）
+    EXECUTOR_INLINE_MAX_CHARS: イベントループ上で実行する処理の大きさの上限（既定65536）
+"""
+import asyncio
+import json
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Mapping, Optional, Tuple
+
+from services.metrics import EXECUTOR_IN_FLIGHT, EXECUTOR_QUEUE_SECONDS, EXECUTOR_RUN_SECONDS
+
+INLINE = "inline"
+THREAD = "thread"
+PROCESS = "process"
+BACKENDS = (INLINE, THREAD, PROCESS)
+
+# 処理の種類ごとの既定のバックエンド
+DEFAULT_BACKENDS: Dict[str, str] = {
+    "formatter": THREAD,
+    "formatter_chain": THREAD,
+    "serialize": THREAD,
+}
+
+CPU_COUNT = os.cpu_count() or 1
+EXECUTOR_THREADS = int(os.getenv("EXECUTOR_THREADS", str(min(32, CPU_COUNT + 4))))
+EXECUTOR_PROCESSES = int(os.getenv("EXECUTOR_PROCESSES", str(CPU_COUNT)))
+EXECUTOR_INLINE_MAX_CHARS = int(os.getenv("EXECUTOR_INLINE_MAX_CHARS", str(64 * 1024)))
+
+
+def parse_backends(value: str) -> Dict[str, str]:
+    """
+    "種類=バックエンド,..." の形式の設定を辞書に変換します。
+
+    Raises:
+        ValueError: 未知のバックエンドが指定された場合
+    """
+    backends = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        kind, _, backend = item.partition("=")
+        backend = backend.strip()
+        if backend not in BACKENDS:
+            raise ValueError(f"未知の実行バックエンドです: {item}（{', '.join(BACKENDS)} のいずれか）")
+        backends[kind.strip()] = backend
+    return backends
+
+
+def _timed_call(fn: Callable, args: Tuple[Any, ...]) -> Tuple[float, float, Any]:
+    """プロセスプールで実行する関数。開始時刻（エポック秒）・実行時間・結果を返します。"""
+    started_at = time.time()
+    perf_started_at = time.perf_counter()
+    result = fn(*args)
+    return started_at, time.perf_counter() - perf_started_at, result
+
+
+def dumps_json(value: Any) -> str:
+    """JSONに変換します（"serialize" の処理。プロセスプールからも呼び出せるようトップレベルに定義）。"""
+    return json.dumps(value, ensure_ascii=False)
+
+
+class Executors:
+    """
+    処理の種類ごとの実行バックエンドと、共有のスレッドプール・プロセスプール
+
+    Args:
+        backends: 処理の種類 -> バックエンド（DEFAULT_BACKENDS より優先）
+        thread_workers: スレッドプールのスレッド数
+        process_workers: プロセスプールのプロセス数
+        inline_max_size: イベントループ上で実行する処理の大きさの上限
+    """
+
+    def __init__(
+        self,
+        backends: Optional[Mapping[str, str]] = None,
+        thread_workers: int = EXECUTOR_THREADS,
+        process_workers: int = EXECUTOR_PROCESSES,
+        inline_max_size: int = EXECUTOR_INLINE_MAX_CHARS
+    ):
+        self.backends = {**DEFAULT_BACKENDS, **(backends or {})}
+        self.thread_workers = thread_workers
+        self.process_workers = process_workers
+        self.inline_max_size = inline_max_size
+        self._pools: Dict[str, Executor] = {}
+        self._lock = threading.Lock()
+
+    def backend_for(self, kind: str, size: Optional[int] = None) -> str:
+        """処理の種類と大きさから、使用するバックエンドを返します。"""
+        if size is not None and size <= self.inline_max_size:
+            return INLINE
+        return self.backends.get(kind, INLINE)
+
+    def _pool(self, backend: str) -> Executor:
+        pool = self._pools.get(backend)
+        if pool is None:
+            with self._lock:
+                pool = self._pools.get(backend)
+                if pool is None:
+                    if backend == THREAD:
+                        pool = ThreadPoolExecutor(self.thread_workers, thread_name_prefix="executor")
+                    else:
+                        # スレッドを持つプロセスをforkしないよう、spawnで起動する
+                        pool = ProcessPoolExecutor(self.process_workers, mp_context=multiprocessing.get_context("spawn"))
+                    self._pools[backend] = pool
+        return pool
+
+    async def run(self, kind: str, fn: Callable, *args: Any, size: Optional[int] = None) -> Any:
+        """
+        処理の種類に対応するバックエンドで fn(*args) を実行します。
+
+        Args:
+            kind: 処理の種類（ノードタイプなど）
+            fn: 実行する関数（process の場合はモジュールのトップレベルの関数）
+            *args: 関数の引数（inline・thread の場合はコピーせずに渡す）
+            size: 処理の大きさ（文字数など）。inline_max_size 以下の場合はイベントループ上で実行する
+
+        Returns:
+            fn の戻り値
+        """
+        backend = self.backend_for(kind, size)
+        EXECUTOR_IN_FLIGHT.labels(backend).inc()
+        try:
+            if backend == INLINE:
+                started_at = time.perf_counter()
+                try:
+                    return fn(*args)
+                finally:
+                    EXECUTOR_QUEUE_SECONDS.labels(backend).observe(0.0)
+                    EXECUTOR_RUN_SECONDS.labels(backend, kind).observe(time.perf_counter() - started_at)
+
+            loop = asyncio.get_running_loop()
+            if backend == THREAD:
+                submitted_at = time.perf_counter()
+
+                def call():
+                    started_at = time.perf_counter()
+                    EXECUTOR_QUEUE_SECONDS.labels(backend).observe(started_at - submitted_at)
+                    try:
+                        return fn(*args)
+                    finally:
+                        EXECUTOR_RUN_SECONDS.labels(backend, kind).observe(time.perf_counter() - started_at)
+
+                return await loop.run_in_executor(self._pool(backend), call)
+
+            submitted_at = time.time()
+            started_at, elapsed, result = await loop.run_in_executor(self._pool(backend), _timed_call, fn, args)
+            EXECUTOR_QUEUE_SECONDS.labels(backend).observe(max(0.0, started_at - submitted_at))
+            EXECUTOR_RUN_SECONDS.labels(backend, kind).observe(elapsed)
+            return result
+        finally:
+            EXECUTOR_IN_FLIGHT.labels(backend).dec()
+
+    def shutdown(self) -> None:
+        """プールを終了します（実行中の処理は完了を待つ）。"""
+        with self._lock:
+            pools, self._pools = list(self._pools.values()), {}
+        for pool in pools:
+            pool.shutdown(wait=True)
+
+
+# プロセス内で共有する実行バックエンド
+executors = Executors(parse_backends(os.getenv("EXECUTOR_BACKENDS", "")))
@@ -1,12 +1,34 @@
-from typing import Dict, Any
+import os
+from typing import Dict, Any, Callable, List, Optional, Sequence, Tuple
 # https://github.com/studio-ousia/mojimoji
 import mojimoji
 
+from services.cancellation import CancellationToken
+from services.executors import PROCESS, Executors, executors as shared_executors
+
+# 一度に変換する文字数。これを超えるテキストはチャンクに分けて変換し、チャンクごとにキャンセルを確認する
+FORMATTER_CHUNK_CHARS = int(os.getenv("FORMATTER_CHUNK_CHARS", str(256 * 1024)))
+
+# 直前の文字と結合して変換される文字（半角の濁点・半濁点、全角の濁点・半濁点、結合用の濁点・半濁点）。
+# チャンクの境界がこれらの文字の直前にならないようにする（例: "ｶ" と "ﾞ" が分かれると "ガ" にならない）
+_COMBINING_MARKS = frozenset("\uff9e\uff9f\u309b\u309c\u3099\u309a")
+
+
 class FormatterService:
+    """
+    テキストの整形サービス
+
+    変換は実行バックエンド（services/executors.py）の "formatter"（単独のノード）・
+    "formatter_chain"（まとめて実行するノード）で行い、小さなテキストはイベントループ上で変換します。
+    """
+
+    def __init__(self, executors: Optional[Executors] = None):
+        self.executors = executors or shared_executors
+
     async def format_text(self, text: str, config: Dict[str, Any]) -> str:
         """
         テキストを指定されたルールに従って整形します。
-        
+
         Args:
             text: 整形対象のテキスト
             config: 整形ルールの設定
@@ -18,26 +40,121 @@ class FormatterService:
         Returns:
             整形されたテキスト
         """
-        operation = config.get("operation")
-
-        if operation == "to_upper":
-            return text.upper()
-        elif operation == "to_lower":
-            return text.lower()
-        elif operation == "to_full_width":
-            return mojimoji.han_to_zen(
-                text,
-                kana=config.get("kana", True),
-                digit=config.get("digit", True),
-                ascii=config.get("ascii", True)
-            )
-        elif operation == "to_half_width":
-            return mojimoji.zen_to_han(
-                text,
-                kana=config.get("kana", True),
-                digit=config.get("digit", True),
-                ascii=config.get("ascii", True)
-            )
-        else:
-            return text
-        
\ No newline at end of file
+        return await self.executors.run("formatter", convert_text, text, dict(config), size=len(text))
+
+    async def format_chain(
+        self,
+        text: str,
+        configs: Sequence[Dict[str, Any]],
+        record: Sequence[bool] = (),
+        cancel_token: Optional[CancellationToken] = None,
+        chunk_chars: int = FORMATTER_CHUNK_CHARS
+    ) -> Tuple[str, List[Optional[str]]]:
+        """
+        連続するフォーマッターを1回の走査でまとめて適用します。
+
+        テキストをチャンクに分け、チャンクごとにすべての変換を順に適用するため、
+        変換ごとにテキスト全体をコピーしません。
+
+        Args:
+            text: 整形対象のテキスト
+            configs: 適用する整形ルールの設定（適用順）
+            record: 変換ごとに途中の結果を返すかどうか（configs と同じ順、省略時は返さない）
+            cancel_token: 実行のキャンセルトークン（チャンクごとに確認。プロセスで変換する場合は変換の前後のみ）
+            chunk_chars: 1チャンクの文字数
+
+        Returns:
+            (最後の変換の結果, 変換ごとの途中の結果。recordがFalseの変換はNone)
+        """
+        configs = [dict(config) for config in configs]
+        record = list(record) + [False] * (len(configs) - len(record))
+        in_process = self.executors.backend_for("formatter_chain", len(text)) == PROCESS
+        if cancel_token and in_process:
+            cancel_token.raise_if_cancelled()
+        result = await self.executors.run(
+            "formatter_chain", apply_chain, text, configs, record, chunk_chars,
+            None if in_process else cancel_token, size=len(text)
+        )
+        if cancel_token and in_process:
+            cancel_token.raise_if_cancelled()
+        return result
+
+
+def _converter(config: Dict[str, Any]) -> Callable[[str], str]:
+    """整形ルールの設定から変換関数を作成します。"""
+    operation = config.get("operation")
+
+    if operation == "to_upper":
+        return str.upper
+    elif operation == "to_lower":
+        return str.lower
+    elif operation in ("to_full_width", "to_half_width"):
+        convert = mojimoji.han_to_zen if operation == "to_full_width" else mojimoji.zen_to_han
+        kana = config.get("kana", True)
+        digit = config.get("digit", True)
+        ascii = config.get("ascii", True)
+        return lambda text: convert(text, kana=kana, digit=digit, ascii=ascii)
+    else:
+        return lambda text: text
+
+
+def convert_text(text: str, config: Dict[str, Any]) -> str:
+    """1つの整形ルールを適用します（プロセスプールからも呼び出せるようトップレベルに定義）。"""
+    return _converter(config)(text)
+
+
+def apply_chain(
+    text: str,
+    configs: List[Dict[str, Any]],
+    record: List[bool],
+    chunk_chars: int = FORMATTER_CHUNK_CHARS,
+    cancel_token: Optional[CancellationToken] = None
+) -> Tuple[str, List[Optional[str]]]:
+    """
+    整形ルールをチャンクごとに順に適用します（プロセスプールからも呼び出せるようトップレベルに定義）。
+
+    Returns:
+        (最後の変換の結果, 変換ごとの途中の結果。recordがFalseの変換はNone)
+    """
+    converters = [_converter(config) for config in configs]
+    final_parts: List[str] = []
+    recorded_parts: List[Optional[List[str]]] = [[] if keep else None for keep in record]
+
+    for chunk in _split_chunks(text, chunk_chars):
+        if cancel_token:
+            cancel_token.raise_if_cancelled()
+        for i, convert in enumerate(converters):
+            chunk = convert(chunk)
+            if recorded_parts[i] is not None:
+                recorded_parts[i].append(chunk)
+        final_parts.append(chunk)
+
+    intermediates = [None if parts is None else "".join(parts) for parts in recorded_parts]
+    return "".join(final_parts), intermediates
+
+
+def _split_chunks(text: str, chunk_chars: int):
+    """
+    テキストを約chunk_chars文字ごとに分割します。
+    できるだけ改行・空白の直後で分割し（単語の途中で分割すると、語末のΣなど
+    大文字・小文字変換の結果が変わる場合があるため）、その場合も濁点・半濁点の直前では分割しません。
+    """
+    start = 0
+    length = len(text)
+    while start < length:
+        end = min(start + chunk_chars, length)
+        if end < length:
+            separator = text.rfind("\n", start + chunk_chars // 2, end)
+            if separator == -1:
+                separator = text.rfind(" ", start + chunk_chars // 2, end)
+            if separator != -1:
+                end = separator + 1
+        while start < end < length and text[end] in _COMBINING_MARKS:
+            end -= 1
+        if end == start:
+            # チャンク全体が1文字と濁点・半濁点の並びの場合は、その並びの後ろで区切る
+            end = min(start + chunk_chars, length)
+            while end < length and text[end] in _COMBINING_MARKS:
+                end += 1
+        yield text[start:end]
+        start = end
@@ -1,11 +1,25 @@
+import asyncio
 import os
-from typing import Optional, Dict, Any
-from openai import OpenAI
+from typing import Optional, Dict, Any, AsyncIterator, Awaitable
+from openai import AsyncOpenAI
 from dotenv import load_dotenv
 import json
+import time
+from contextlib import suppress
+from services.budget import current_budget
+from services.cancellation import CancellationToken, RunCancelledError
+from services.checkpoints import current_checkpoints
+from services.llm_stats import current_llm_stats
+from services.metrics import LLM_DURATION, LLM_TOKENS
+from services.tokens import count_tokens
 
 load_dotenv()
 
+# モデルを指定しない呼び出し（エージェントなど）で使用するモデル
+DEFAULT_MODEL = "gpt-4o-mini"
+# generate_json のシステムメッセージ
+JSON_SYSTEM_PROMPT = "あなたは優秀なアシスタントです。JSON形式で日本語で返答してください。"
+
 class GenerativeAIService:
     """
     Generative AIサービス
@@ -22,14 +36,83 @@ class GenerativeAIService:
     """
 
     def __init__(self):
-        self.client = OpenAI(api_key=os.getenv("OPENAI_SECRET"))
+        self.client = AsyncOpenAI(api_key=os.getenv("OPENAI_SECRET"))
+
+    async def _request(
+        self,
+        request: Awaitable[Any],
+        cancel_token: Optional[CancellationToken],
+        model: str,
+        step: str
+    ) -> Any:
+        """
+        APIリクエストを実行し、所要時間とトークン数をメトリクスに記録します。
+        キャンセルトークンが指定されている場合は、キャンセル時にリクエストを中断します。
+        実行中のノードの予算（services/budget.py）がある場合は、呼び出し回数とトークン数を数えます。
+        """
+        budget = current_budget()
+        if budget is not None:
+            try:
+                budget.charge_llm_call()
+            except RunCancelledError:
+                # 送信しないリクエストのコルーチンを閉じる
+                request.close()
+                raise
+        started_at = time.perf_counter()
+        status = "error"
+        try:
+            if cancel_token is None:
+                response = await request
+            else:
+                response = await cancel_token.run(request)
+            status = "success"
+        except RunCancelledError:
+            status = "cancelled"
+            raise
+        finally:
+            self._observe_duration(model, step, status, time.perf_counter() - started_at)
+
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            # Chat Completions は prompt/completion_tokens、Responses API は input/output_tokens
+            prompt_tokens = getattr(usage, "prompt_tokens", None) or getattr(usage, "input_tokens", 0)
+            completion_tokens = getattr(usage, "completion_tokens", None) or getattr(usage, "output_tokens", 0)
+            LLM_TOKENS.labels(model, step, "prompt").observe(prompt_tokens or 0)
+            LLM_TOKENS.labels(model, step, "completion").observe(completion_tokens or 0)
+            llm_stats = current_llm_stats()
+            if llm_stats is not None:
+                llm_stats.record_completion_tokens(model, step, completion_tokens or 0)
+            if budget is not None:
+                budget.charge_tokens((prompt_tokens or 0) + (completion_tokens or 0))
+        return response
+
+    async def _complete(self, params: Dict[str, Any], cancel_token: Optional[CancellationToken], step: str) -> str:
+        """
+        Chat Completions を呼び出し、応答の内容を返します。
+        実行のチェックポイントがある場合は、保存済みの応答を再利用し、新しい応答を保存します（services/checkpoints.py）。
+        """
+        async def call() -> str:
+            response = await self._request(
+                self.client.chat.completions.create(**params),
+                cancel_token,
+                params["model"],
+                step
+            )
+            return response.choices[0].message.content
+
+        checkpoints = current_checkpoints()
+        if checkpoints is None:
+            return await call()
+        return await checkpoints.llm_call(step, params, call)
 
     async def generate_text(
         self,
         prompt: str,
-        model: str = "gpt-4o-mini",
+        model: str = DEFAULT_MODEL,
         temperature: float = 0.7,
         max_tokens: int = 1000,
+        cancel_token: Optional[CancellationToken] = None,
+        step: str = "generate_text",
         **kwargs
     ) -> str:
         """
@@ -40,29 +123,38 @@ class GenerativeAIService:
             model: 使用するモデル
             temperature: 生成のランダム性
             max_tokens: 生成するテキストの最大トークン数
+            cancel_token: 実行のキャンセルトークン
+            step: 呼び出し元の処理（メトリクスのラベル。例: "plan", "task", "review"）
             **kwargs: 追加のパラメータ
 
         Returns:
             生成されたテキスト
         """
         try:
-            response = self.client.chat.completions.create(
-                model=model,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=temperature,
-                max_tokens=max_tokens,
-                **kwargs
+            return await self._complete(
+                dict(
+                    model=model,
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    **kwargs
+                ),
+                cancel_token,
+                step
             )
-            return response.choices[0].message.content
+        except RunCancelledError:
+            raise
         except Exception as e:
             raise Exception(f"テキスト生成中にエラーが発生しました: {str(e)}")
 
-    def generate_json(
+    async def generate_json(
         self,
         prompt: str,
-        model: str = "gpt-4o-mini",
+        model: str = DEFAULT_MODEL,
         temperature: float = 0.7,
         max_tokens: Optional[int] = None,
+        cancel_token: Optional[CancellationToken] = None,
+        step: str = "generate_json",
         **kwargs
     ) -> Dict[str, Any]:
         """
@@ -73,33 +165,42 @@ class GenerativeAIService:
             model: 使用するモデル
             temperature: 生成のランダム性
             max_tokens: 生成するテキストの最大トークン数
+            cancel_token: 実行のキャンセルトークン
+            step: 呼び出し元の処理（メトリクスのラベル。例: "plan", "task", "review"）
             **kwargs: 追加のパラメータ
 
         Returns:
             生成されたJSONオブジェクト
         """
+        content = None
         try:
-            response = self.client.chat.completions.create(
-                model=model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "あなたは優秀なアシスタントです。JSON形式で日本語で返答してください。"
-                    },
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=temperature,
-                max_tokens=max_tokens,
-                response_format={"type": "json_object"},
-                **kwargs
+            content = await self._complete(
+                dict(
+                    model=model,
+                    messages=[
+                        {
+                            "role": "system",
+                            "content": JSON_SYSTEM_PROMPT
+                        },
+                        {"role": "user", "content": prompt}
+                    ],
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    response_format={"type": "json_object"},
+                    **kwargs
+                ),
+                cancel_token,
+                step
             )
 
-            return json.loads(response.choices[0].message.content)
+            return json.loads(content)
+        except RunCancelledError:
+            raise
         except json.JSONDecodeError as e:
             return {
                 "error": "JSONの解析に失敗しました",
                 "details": str(e),
-                "raw_response": response.choices[0].message.content
+                "raw_response": content
             }
         except Exception as e:
             return {
@@ -107,22 +208,148 @@ class GenerativeAIService:
                 "details": str(e)
             }
 
-    def web_search(self, query: str) -> str:
+    async def stream_json(
+        self,
+        prompt: str,
+        model: str = DEFAULT_MODEL,
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        cancel_token: Optional[CancellationToken] = None,
+        step: str = "generate_json",
+        **kwargs
+    ) -> AsyncIterator[str]:
+        """
+        JSON形式のレスポンスをストリーミングで生成し、受信した内容の断片を順に返します。
+        リクエストは generate_json と同じです（実行のチェックポイントも同じキーで共有する）。
+        保存済みの応答がある場合は、内容全体を1つの断片として返します。
+        ストリーミングの応答には使用量が含まれないため、トークン数はメトリクスに記録せず、
+        予算にはプロンプトと応答のトークン数の目安（services/tokens.py）を数えます。
+
+        Args:
+            prompt: 生成するテキストのプロンプト
+            model: 使用するモデル
+            temperature: 生成のランダム性
+            max_tokens: 生成するテキストの最大トークン数
+            cancel_token: 実行のキャンセルトークン
+            step: 呼び出し元の処理（メトリクスのラベル）
+            **kwargs: 追加のパラメータ
+
+        Yields:
+            応答の内容の断片
+
+        Raises:
+            RunCancelledError: キャンセルされた場合
+            Exception: 接続が途中で切れた場合など（呼び出し元で全体の解析や再要求に切り替える）
+        """
+        params = dict(
+            model=model,
+            messages=[
+                {"role": "system", "content": JSON_SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=temperature,
+            max_tokens=max_tokens,
+            response_format={"type": "json_object"},
+            **kwargs
+        )
+        checkpoints = current_checkpoints()
+        key = checkpoints.llm_key(step, params) if checkpoints else None
+        if checkpoints:
+            content = await checkpoints.restore_llm(key)
+            if content is not None:
+                yield content
+                return
+
+        def wait(awaitable: Awaitable[Any]) -> Awaitable[Any]:
+            return awaitable if cancel_token is None else cancel_token.run(awaitable)
+
+        budget = current_budget()
+        if budget is not None:
+            budget.charge_llm_call()
+        started_at = time.perf_counter()
+        status = "error"
+        parts = []
+        stream = None
+        watcher = None
+        try:
+            stream = await wait(self.client.chat.completions.create(stream=True, **params))
+            if cancel_token is not None:
+                # 断片ごとに cancel_token.run() で待たず、キャンセルされたらストリームを閉じて読み込み中の待機を終わらせる
+                watcher = asyncio.create_task(self._close_on_cancel(stream, cancel_token))
+            async for chunk in stream:
+                if cancel_token is not None:
+                    cancel_token.raise_if_cancelled()
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    parts.append(delta)
+                    yield delta
+            if cancel_token is not None:
+                # 断片の間で閉じられた場合は、ストリームが途中で終わる
+                cancel_token.raise_if_cancelled()
+            status = "success"
+        except RunCancelledError:
+            status = "cancelled"
+            raise
+        except Exception as e:
+            if cancel_token is not None and cancel_token.cancelled:
+                # キャンセルでストリームを閉じたため読み込みが失敗した
+                status = "cancelled"
+                cancel_token.raise_if_cancelled()
+            raise Exception(f"ストリーミング中にエラーが発生しました: {str(e)}")
+        finally:
+            if watcher is not None:
+                watcher.cancel()
+            self._observe_duration(model, step, status, time.perf_counter() - started_at)
+            if stream is not None:
+                with suppress(Exception):
+                    await stream.close()
+
+        if budget is not None:
+            budget.charge_tokens(
+                sum(count_tokens(message["content"]) for message in params["messages"]) + count_tokens("".join(parts))
+            )
+        if checkpoints:
+            await checkpoints.save_llm(key, "".join(parts))
+
+    @staticmethod
+    def _observe_duration(model: str, step: str, status: str, seconds: float) -> None:
+        """LLMの呼び出しの所要時間をメトリクスと実行の集計（services/llm_stats.py）に記録します。"""
+        LLM_DURATION.labels(model, step, status).observe(seconds)
+        llm_stats = current_llm_stats()
+        if llm_stats is not None:
+            llm_stats.record_call(model, step, status, seconds)
+
+    @staticmethod
+    async def _close_on_cancel(stream: Any, cancel_token: CancellationToken) -> None:
+        """キャンセルされたらストリームを閉じます（読み込み中の断片の待機は例外で終わる）。"""
+        await cancel_token.wait()
+        with suppress(Exception):
+            await stream.close()
+
+    async def web_search(self, query: str, cancel_token: Optional[CancellationToken] = None) -> str:
         """
         Web検索を実行します。
 
         Args:
             query: 検索クエリ
+            cancel_token: 実行のキャンセルトークン
 
         Returns:
             検索結果のテキスト
         """
         try:
-            response = self.client.responses.create(
-                model="gpt-4.1",
-                tools=[{"type": "web_search_preview"}],
-                input=query
+            response = await self._request(
+                self.client.responses.create(
+                    model="gpt-4.1",
+                    tools=[{"type": "web_search_preview"}],
+                    input=query
+                ),
+                cancel_token,
+                "gpt-4.1",
+                "web_search"
             )
             return response.output_text
+        except RunCancelledError:
+            raise
         except Exception as e:
             return f"Web検索エラー: {str(e)}"
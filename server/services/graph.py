@@ -0,0 +1,190 @@
+"""
+ワークフローのグラフ処理
+
+ノードの依存関係の構築、実行順序の決定（Kahn法）、循環参照の検出（Tarjan法）を
+いずれも O(V + E) で行います。
+"""
+import logging
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger('WorkflowApp')
+
+
+@dataclass
+class WorkflowGraph:
+    node_ids: List[str]  # ノードID（入力順）
+    successors: Dict[str, List[str]]  # ノードID -> 依存先のノードID
+    in_degree: Dict[str, int]  # ノードID -> 依存元の数
+
+    @property
+    def edge_count(self) -> int:
+        return sum(len(targets) for targets in self.successors.values())
+
+
+def _iter_edges(config: dict):
+    """ノード設定からエッジを取り出します（`edge` と `edges` の両方の形式に対応）。"""
+    edge = config.get('edge')
+    if edge:
+        yield edge
+    for edge in config.get('edges') or []:
+        yield edge
+
+
+def build_graph(nodes: List[dict]) -> WorkflowGraph:
+    """
+    ノード間の依存関係グラフを構築します。
+
+    エッジの source / target はキャンバス上のID（config.node.id）とノードID のどちらでも指定できます。
+    重複したエッジと、存在しないノードを参照するエッジは無視します。
+
+    Args:
+        nodes: ノードのリスト
+
+    Returns:
+        依存関係グラフ
+    """
+    node_ids = [node['id'] for node in nodes]
+    resolve: Dict[str, str] = {node_id: node_id for node_id in node_ids}
+    for node in nodes:
+        canvas_id = (node['config'].get('node') or {}).get('id')
+        if canvas_id is not None:
+            resolve.setdefault(str(canvas_id), node['id'])
+
+    successors: Dict[str, List[str]] = {node_id: [] for node_id in node_ids}
+    in_degree: Dict[str, int] = {node_id: 0 for node_id in node_ids}
+    seen = set()
+
+    for node in nodes:
+        for edge in _iter_edges(node['config']):
+            source_id = resolve.get(str(edge.get('source')))
+            target_id = resolve.get(str(edge.get('target')))
+            if source_id is None or target_id is None:
+                logger.warning(f"存在しないノードを参照するエッジを無視します: {edge.get('source')} -> {edge.get('target')}")
+                continue
+            if (source_id, target_id) in seen:
+                continue
+            seen.add((source_id, target_id))
+            successors[source_id].append(target_id)
+            in_degree[target_id] += 1
+
+    return WorkflowGraph(node_ids=node_ids, successors=successors, in_degree=in_degree)
+
+
+def strongly_connected_components(graph: WorkflowGraph) -> List[List[str]]:
+    """
+    循環参照を構成するノードの集合（強連結成分）を返します。
+    サイズ1の成分は自己ループがある場合のみ含めます。
+
+    再帰を使わないTarjan法で、大きなグラフでも再帰の上限に達しません。
+    """
+    index_of: Dict[str, int] = {}
+    lowlink: Dict[str, int] = {}
+    on_stack = set()
+    stack: List[str] = []
+    components: List[List[str]] = []
+    next_index = 0
+
+    for root in graph.node_ids:
+        if root in index_of:
+            continue
+        # (ノード, 次に調べる後続ノードの位置)
+        work: List[Tuple[str, int]] = [(root, 0)]
+        while work:
+            node_id, position = work[-1]
+            if position == 0:
+                index_of[node_id] = lowlink[node_id] = next_index
+                next_index += 1
+                stack.append(node_id)
+                on_stack.add(node_id)
+
+            successors = graph.successors[node_id]
+            if position < len(successors):
+                work[-1] = (node_id, position + 1)
+                next_id = successors[position]
+                if next_id not in index_of:
+                    work.append((next_id, 0))
+                elif next_id in on_stack:
+                    lowlink[node_id] = min(lowlink[node_id], index_of[next_id])
+                continue
+
+            work.pop()
+            if work:
+                parent_id = work[-1][0]
+                lowlink[parent_id] = min(lowlink[parent_id], lowlink[node_id])
+
+            if lowlink[node_id] == index_of[node_id]:
+                component = []
+                while True:
+                    member = stack.pop()
+                    on_stack.discard(member)
+                    component.append(member)
+                    if member == node_id:
+                        break
+                if len(component) > 1 or node_id in successors:
+                    components.append(component[::-1])
+
+    return components
+
+
+def execution_order(graph: WorkflowGraph) -> List[str]:
+    """
+    トポロジカルソート（Kahn法）で実行順序を決定します。
+
+    依存元のないノードから入力順に実行し、循環参照に含まれるノード
+    （およびその下流のノード）は最後に入力順で追加します。
+
+    Returns:
+        実行順のノードIDのリスト
+    """
+    in_degree = dict(graph.in_degree)
+    queue = deque(node_id for node_id in graph.node_ids if in_degree[node_id] == 0)
+    order: List[str] = []
+
+    while queue:
+        node_id = queue.popleft()
+        order.append(node_id)
+        for next_id in graph.successors[node_id]:
+            in_degree[next_id] -= 1
+            if in_degree[next_id] == 0:
+                queue.append(next_id)
+
+    if len(order) < len(graph.node_ids):
+        processed = set(order)
+        remaining = [node_id for node_id in graph.node_ids if node_id not in processed]
+        cycles = strongly_connected_components(graph)
+        logger.warning(f"循環参照が検出されました: {cycles}（未処理のノード: {remaining}）")
+        order.extend(remaining)
+
+    return order
+
+
+def execution_levels(graph: WorkflowGraph, order: List[str]) -> List[List[str]]:
+    """
+    実行順序をレベル（依存関係上、同時に実行できるノードのまとまり）に分割します。
+
+    各ノードのレベルは、実行順で手前にある依存元のレベルの最大値 + 1 です。
+    循環参照に含まれるエッジ（実行順で後ろから前へのエッジ）は無視します。
+
+    Args:
+        graph: 依存関係グラフ
+        order: execution_order() で求めた実行順序
+
+    Returns:
+        レベルごとのノードIDのリスト（各レベル内は実行順）
+    """
+    position = {node_id: i for i, node_id in enumerate(order)}
+    level = dict.fromkeys(order, 0)
+    levels: List[List[str]] = []
+
+    for node_id in order:
+        current = level[node_id]
+        if current == len(levels):
+            levels.append([])
+        levels[current].append(node_id)
+        for next_id in graph.successors[node_id]:
+            if position[next_id] > position[node_id] and level[next_id] <= current:
+                level[next_id] = current + 1
+
+    return levels
@@ -0,0 +1,94 @@
+"""
+ストリーミングで受信するJSONの逐次解析
+
+JSONモードの応答を断片ごとに受け取り、トップレベルのオブジェクトの指定したキーの配列
+（エージェントの計画の "tasks" など）の要素を、要素のオブジェクトが閉じた時点で取り出します。
+応答全体の受信を待たずに、先頭の要素から処理を始めるために使用します。
+配列の外の値や、要素以外の部分の検証は行いません（受信の完了後に全体を json.loads で解析してください）。
+"""
+import json
+from typing import Any, Dict, List, Optional
+
+
+class JSONArrayStreamParser:
+    """
+    トップレベルのオブジェクトの key の配列から、閉じたオブジェクトの要素を順に取り出します。
+
+    Args:
+        key: 要素を取り出す配列のキー
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self.items: List[Dict[str, Any]] = []  # 取り出した要素（受信順）
+        self.closed = False  # 配列が閉じた（以降の要素はない）
+        self._depth = 0  # 開いているオブジェクト・配列の数
+        self._in_string = False
+        self._escape = False
+        self._string: List[str] = []  # トップレベルのオブジェクトの直下の文字列（キーの候補）
+        self._last_string: Optional[str] = None
+        self._current_key: Optional[str] = None
+        self._in_array = False
+        self._item: Optional[List[str]] = None  # 受信中の要素の文字
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """
+        受信した断片を解析します。
+
+        Args:
+            chunk: 応答の断片
+
+        Returns:
+            この断片で閉じた要素のリスト
+        """
+        completed = []
+        for char in chunk:
+            if self._item is not None:
+                self._item.append(char)
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._last_string = "".join(self._string)
+                if self._depth == 1 and self._in_string:
+                    self._string.append(char)
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._string = []
+            elif char == ":" and self._depth == 1:
+                self._current_key = self._last_string
+            elif char == "," and self._depth == 1:
+                self._current_key = None
+            elif char in "{[":
+                if char == "[" and self._depth == 1 and self._current_key == self.key:
+                    self._in_array = True
+                elif char == "{" and self._depth == 2 and self._in_array:
+                    self._item = [char]
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 2 and self._item is not None:
+                    item = self._parse_item("".join(self._item))
+                    self._item = None
+                    if item is not None:
+                        self.items.append(item)
+                        completed.append(item)
+                elif self._depth == 1 and self._in_array:
+                    self._in_array = False
+                    self.closed = True
+        return completed
+
+    @staticmethod
+    def _parse_item(text: str) -> Optional[Dict[str, Any]]:
+        try:
+            item = json.loads(text)
+        except json.JSONDecodeError:
+            return None
+        return item if isinstance(item, dict) else None
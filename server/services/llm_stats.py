@@ -0,0 +1,147 @@
+"""
+実行ごとのLLM呼び出しの集計
+
+ワークフローの実行中のLLM呼び出しの回数・所要時間・出力トークン数をモデル・処理ごとに集計し、
+実行の終了時に run_llm_stats テーブルに保存します。実行前の見積もり（services/cost_estimator.py）はこの集計を使用するため、
+ワーカー（worker.py）や他のAPIプロセスで実行した実行も見積もりに反映されます。
+
+環境変数:
+    LLM_STATS_WINDOW_SECONDS: 見積もりに使用する集計の期間（既定7日）。これより古い集計は一定間隔で削除する
+"""
+import asyncio
+import logging
+import os
+import time
+from contextvars import ContextVar
+from typing import Callable, ContextManager, Dict, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from repositories.run_repository import RunRepository
+from services.structured_logging import use_context_var
+
+logger = logging.getLogger('WorkflowApp')
+
+LLM_STATS_WINDOW_SECONDS = int(os.getenv("LLM_STATS_WINDOW_SECONDS", str(7 * 24 * 3600)))
+# 集計の保存時に期間を過ぎた集計を削除する、このプロセスでの最短の間隔（秒）
+LLM_STATS_PRUNE_INTERVAL_SECONDS = 3600
+
+_last_pruned_at: Optional[float] = None
+
+
+def prune_llm_stats(session_factory: Callable[[], Session], force: bool = False) -> int:
+    """
+    保存から LLM_STATS_WINDOW_SECONDS を過ぎたLLM呼び出しの集計を削除します。
+
+    Args:
+        session_factory: データベースセッションの作成関数
+        force: False の場合、このプロセスで前回の削除から LLM_STATS_PRUNE_INTERVAL_SECONDS 以内なら何もしない
+
+    Returns:
+        削除した集計の数
+    """
+    global _last_pruned_at
+    now = time.monotonic()
+    if not force and _last_pruned_at is not None and now - _last_pruned_at < LLM_STATS_PRUNE_INTERVAL_SECONDS:
+        return 0
+    _last_pruned_at = now
+    db = session_factory()
+    try:
+        deleted = RunRepository(db).prune_llm_stats(LLM_STATS_WINDOW_SECONDS)
+    except Exception as e:
+        # 削除は後片付けのため、失敗しても実行は続ける
+        logger.warning(f"期間を過ぎたLLM呼び出しの集計を削除できませんでした: {str(e)}")
+        db.rollback()
+        return 0
+    finally:
+        db.close()
+    if deleted:
+        logger.info(f"期間を過ぎたLLM呼び出しの集計を削除しました: {deleted}件")
+    return deleted
+
+
+def load_llm_stats(session_factory: Callable[[], Session]) -> Dict[Tuple[str, str], Dict[str, float]]:
+    """
+    直近 LLM_STATS_WINDOW_SECONDS に保存したLLM呼び出しの集計を、モデル・処理ごとに合計して返します。
+
+    Returns:
+        (モデル, 処理) -> 集計（calls, success_calls, success_seconds, completion_calls, completion_tokens）
+    """
+    db = session_factory()
+    try:
+        return RunRepository(db).llm_stats(LLM_STATS_WINDOW_SECONDS)
+    finally:
+        db.close()
+
+
+class RunLLMStats:
+    """
+    実行1回分のLLM呼び出しの集計
+
+    Args:
+        run_id: 実行ID
+        session_factory: データベースセッションの作成関数
+    """
+
+    def __init__(self, run_id: str, session_factory: Callable[[], Session]):
+        self.run_id = run_id
+        self.session_factory = session_factory
+        self._stats: Dict[Tuple[str, str], Dict[str, float]] = {}
+
+    def _entry(self, model: str, step: str) -> Dict[str, float]:
+        key = (model, step)
+        if key not in self._stats:
+            self._stats[key] = {
+                "calls": 0, "success_calls": 0, "success_seconds": 0.0, "completion_calls": 0, "completion_tokens": 0
+            }
+        return self._stats[key]
+
+    def record_call(self, model: str, step: str, status: str, seconds: float) -> None:
+        """LLMの呼び出しを記録します（所要時間は成功した呼び出しのみ数える）。"""
+        entry = self._entry(model, step)
+        entry["calls"] += 1
+        if status == "success":
+            entry["success_calls"] += 1
+            entry["success_seconds"] += seconds
+
+    def record_completion_tokens(self, model: str, step: str, tokens: int) -> None:
+        """LLMの呼び出しの出力トークン数を記録します。"""
+        entry = self._entry(model, step)
+        entry["completion_calls"] += 1
+        entry["completion_tokens"] += tokens
+
+    def save(self) -> None:
+        """集計を保存します。保存に失敗しても実行には影響させません。"""
+        if not self._stats:
+            return
+        stats, self._stats = self._stats, {}
+        db = self.session_factory()
+        try:
+            RunRepository(db).add_llm_stats(self.run_id, stats)
+        except Exception as e:
+            logger.warning(f"LLM呼び出しの集計を保存できませんでした: run_id={self.run_id}: {str(e)}")
+            db.rollback()
+        finally:
+            db.close()
+        prune_llm_stats(self.session_factory)
+
+    def save_in_background(self) -> None:
+        """
+        集計をスレッドプールで保存します（完了を待たない）。
+        実行の終了時（クライアントの切断でキャンセルされたタスクの後片付けを含む）に、イベントループを止めずに保存するために使用します。
+        """
+        if self._stats:
+            asyncio.get_running_loop().run_in_executor(None, self.save)
+
+
+_current: ContextVar[Optional[RunLLMStats]] = ContextVar("run_llm_stats", default=None)
+
+
+def current_llm_stats() -> Optional[RunLLMStats]:
+    """実行中のワークフローのLLM呼び出しの集計を返します（実行中でない場合はNone）。"""
+    return _current.get()
+
+
+def use_llm_stats(stats: Optional[RunLLMStats]) -> ContextManager[None]:
+    """ブロック内のLLMの呼び出しを stats に集計します。"""
+    return use_context_var(_current, stats)
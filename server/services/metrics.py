@@ -0,0 +1,281 @@
+"""
+プロセス内のメトリクス
+
+Counter / Gauge / Histogram を保持し、GET /metrics でPrometheusのテキスト形式として出力します。
+外部のライブラリやコレクターは不要です。
+
+記録時（ホットパス）はラベルの子メトリクスを辞書で引き、値を加算するだけです。
+累積バケットの計算や文字列化は出力時にのみ行います。
+DBプールの使用数など、出力時に求めればよい値はコールバック付きのGaugeで取得します。
+"""
+import bisect
+import math
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isnan(value):
+        return "NaN"
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        """ラベルの値に対応する子メトリクスを返します（値はlabelnamesの順で指定）。"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name}: ラベルの数が一致しません: {values}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+            *self._samples(),
+        ]
+
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._children[()].inc(amount)
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"
+                for values, child in list(self._children.items())]
+
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ()
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.inc(-amount)
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class Gauge(_Metric):
+    """
+    現在値を表すメトリクス
+
+    function を指定した場合は、出力時に function() の値を使用します（ラベルなしのみ）。
+    """
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 function: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._children[()].inc(amount)
+
+    def dec(self, amount: float = 1.0) -> None:
+        self._children[()].dec(amount)
+
+    def set(self, value: float) -> None:
+        self._children[()].set(value)
+
+    def _samples(self) -> List[str]:
+        if self.function is not None:
+            try:
+                value = float(self.function())
+            except Exception:
+                value = math.nan
+            return [f"{self.name} {_format_value(value)}"]
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"
+                for values, child in list(self._children.items())]
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "_lock")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # 最後は +Inf
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self._children[()].observe(value)
+
+    def stats(self) -> Dict[Tuple[str, ...], Tuple[int, float]]:
+        """ラベルの値ごとの観測回数と合計を返します。"""
+        result = {}
+        for values, child in list(self._children.items()):
+            with child._lock:
+                result[values] = (sum(child.counts), child.sum)
+        return result
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for values, child in list(self._children.items()):
+            with child._lock:
+                counts, total = list(child.counts), child.sum
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        """メトリクスを登録します。同じ名前のメトリクスが登録済みの場合は置き換えます。"""
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+              function: Optional[Callable[[], float]] = None) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, function))
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """すべてのメトリクスをPrometheusのテキスト形式で返します。"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+NODE_DURATION = registry.histogram(
+    "workflow_node_duration_seconds", "ノードの実行時間", ("node_type", "status"))
+ACTIVE_RUNS = registry.gauge(
+    "workflow_active_runs", "実行中のワークフローの数")
+LLM_DURATION = registry.histogram(
+    "llm_request_duration_seconds", "LLM APIの呼び出し時間", ("model", "step", "status"))
+LLM_TOKENS = registry.histogram(
+    "llm_tokens", "LLM APIの呼び出し1回あたりのトークン数", ("model", "step", "kind"), TOKEN_BUCKETS)
+OCR_PAGE_DURATION = registry.histogram(
+    "ocr_page_duration_seconds", "OCRの1ページあたりの処理時間",
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0))
+SSE_EVENTS = registry.counter(
+    "sse_events_sent_total", "送信したSSEイベントの数", ("endpoint", "event"))
+PLAN_CACHE_REQUESTS = registry.counter(
+    "plan_cache_requests_total", "実行計画キャッシュの参照回数", ("result",))
+RUN_OUTPUT_PEAK_BYTES = registry.histogram(
+    "run_output_peak_resident_bytes", "実行ごとの、メモリに保持したノード出力の最大量（一時ファイルから文字列に復元した出力を含む）",
+    buckets=(1024, 16 * 1024, 64 * 1024, 256 * 1024, 1024 ** 2, 4 * 1024 ** 2, 16 * 1024 ** 2, 64 * 1024 ** 2))
+OUTPUT_SPILLED_BYTES = registry.counter(
+    "node_output_spilled_bytes_total", "一時ファイルに書き出したノード出力の合計")
+PDF_PAGES = registry.counter(
+    "pdf_pages_total", "テキストを抽出したPDFのページ数", ("method",))
+RUN_ADMISSIONS = registry.counter(
+    "run_admissions_total", "実行の受け付けの結果（admitted: すぐに開始、queued: 待機後に開始、rejected: 429）", ("result",))
+RUN_QUEUE_WAIT = registry.histogram(
+    "run_queue_wait_seconds", "実行の開始までに待機した時間（拒否された場合を含む）",
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0))
+EXECUTOR_QUEUE_SECONDS = registry.histogram(
+    "executor_queue_seconds", "実行バックエンドで処理が開始されるまでの待ち時間", ("backend",),
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0))
+EXECUTOR_RUN_SECONDS = registry.histogram(
+    "executor_run_seconds", "実行バックエンドでの処理の実行時間", ("backend", "kind"),
+    buckets=(0.0001, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0))
+EXECUTOR_IN_FLIGHT = registry.gauge(
+    "executor_in_flight", "実行バックエンドで待機中・実行中の処理の数", ("backend",))
+RUN_CHECKPOINTS = registry.counter(
+    "run_checkpoints_total", "実行のチェックポイント（kind: node・llm、result: saved・restored）", ("kind", "result"))
+AGENT_TIME_TO_FIRST_TASK = registry.histogram(
+    "agent_time_to_first_task_seconds", "エージェントの計画の開始から最初のタスクの実行開始までの時間（mode: stream・full）", ("mode",),
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0))
+BUDGET_EXCEEDED = registry.counter(
+    "budget_exceeded_total", "予算の上限を超えて中断した回数（scope: node・run、limit: timeout_seconds・max_llm_calls・max_tokens）",
+    ("scope", "limit"))
@@ -0,0 +1,161 @@
+"""
+実行ごとのノード出力の保存先
+
+小さな出力はメモリに保持し、大きな出力（OCRした文書など）は一時ファイルに書き出して
+メモリマップで参照します。利用側は OutputHandle を受け取り、必要なときにだけ text() で文字列にします。
+実行中にメモリに保持した出力の最大量（peak_resident_bytes）を記録します。
+
+制限: LLMのプロンプトやフォーマッターは出力全体を文字列として必要とするため、後続のノードが参照すると
+一時ファイルの出力もそのノードの実行中は文字列としてメモリに載ります（成功イベントの result にも同じ文字列が入る）。
+peak_resident_bytes には、ノードの実行中に text() で復元した出力と、書き出す前の文字列も含めて数えます
+（ノードの終了時に end_step() で数え直す）。
+
+環境変数:
+    OUTPUT_INLINE_MAX_BYTES: メモリに保持する出力の最大サイズ（既定64KB）。これを超える出力は一時ファイルに書き出す
+    OUTPUT_SPILL_DIR: 一時ファイルの作成先（既定はシステムの一時ディレクトリ）
+"""
+import mmap
+import os
+import tempfile
+from typing import Callable, Dict, Optional
+
+OUTPUT_INLINE_MAX_BYTES = int(os.getenv("OUTPUT_INLINE_MAX_BYTES", str(64 * 1024)))
+OUTPUT_SPILL_DIR = os.getenv("OUTPUT_SPILL_DIR") or None
+
+
+class OutputHandle:
+    """
+    ノードの出力への参照
+
+    一時ファイルに書き出された出力は、text() を呼ぶまで文字列に復元しません。
+    """
+    __slots__ = ("node_id", "size", "_inline", "_file", "_mmap", "_on_read")
+
+    def __init__(self, node_id: str, size: int, inline: Optional[str] = None, file=None, mapped: Optional[mmap.mmap] = None,
+                 on_read: Optional[Callable[[int], None]] = None):
+        self.node_id = node_id
+        self.size = size  # UTF-8でのバイト数
+        self._inline = inline
+        self._file = file
+        self._mmap = mapped
+        self._on_read = on_read  # 一時ファイルの出力を文字列に復元したときに、そのサイズを受け取る関数
+
+    @property
+    def spilled(self) -> bool:
+        return self._mmap is not None
+
+    def text(self) -> str:
+        """出力の文字列を返します。一時ファイルに書き出された出力は、呼び出しごとに復元します。"""
+        if self._mmap is None:
+            return self._inline or ""
+        if self._on_read is not None:
+            self._on_read(self.size)
+        return self._mmap[:].decode("utf-8")
+
+    def preview(self, max_chars: int = 200) -> str:
+        """出力の先頭を返します（一時ファイルの場合も先頭だけを読み込む）。"""
+        if self._mmap is None:
+            return (self._inline or "")[:max_chars]
+        return self._mmap[:max_chars * 4].decode("utf-8", errors="ignore")[:max_chars]
+
+    def close(self) -> None:
+        if self._mmap is not None:
+            self._mmap.close()
+            self._file.close()
+            self._mmap = None
+            self._file = None
+        self._inline = None
+
+    def __str__(self) -> str:
+        return self.text()
+
+
+class OutputStore:
+    """
+    実行ごとのノード出力の保存先
+
+    Args:
+        inline_max_bytes: メモリに保持する出力の最大サイズ
+        spill_dir: 一時ファイルの作成先
+    """
+
+    def __init__(self, inline_max_bytes: int = OUTPUT_INLINE_MAX_BYTES, spill_dir: Optional[str] = OUTPUT_SPILL_DIR):
+        self.inline_max_bytes = inline_max_bytes
+        self.spill_dir = spill_dir
+        self._outputs: Dict[str, OutputHandle] = {}  # ノードID -> 出力（実行順）
+        self.resident_bytes = 0
+        self.materialized_bytes = 0  # 実行中のノードで文字列としてメモリに載った、一時ファイルの出力のサイズ
+        self.peak_resident_bytes = 0
+        self.spilled_bytes = 0
+
+    def put(self, node_id: str, text: str) -> OutputHandle:
+        """
+        ノードの出力を保存します。同じノードの出力が保存済みの場合は置き換えます。
+
+        Args:
+            node_id: ノードID
+            text: 出力
+
+        Returns:
+            出力への参照
+        """
+        self.discard(node_id)
+
+        data = text.encode("utf-8")
+        if len(data) <= self.inline_max_bytes:
+            handle = OutputHandle(node_id, len(data), inline=text)
+            self.resident_bytes += len(data)
+            self._update_peak()
+        else:
+            # 名前のない一時ファイル（閉じると削除される）に書き出し、読み取り専用でマップする
+            file = tempfile.TemporaryFile(prefix="node_output_", dir=self.spill_dir)
+            file.write(data)
+            file.flush()
+            handle = OutputHandle(node_id, len(data), file=file,
+                                  mapped=mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ),
+                                  on_read=self._materialize)
+            self.spilled_bytes += len(data)
+            # 書き出した文字列も、ノードの終了まではメモリに残る
+            self._materialize(len(data))
+
+        self._outputs[node_id] = handle
+        return handle
+
+    def _materialize(self, size: int) -> None:
+        self.materialized_bytes += size
+        self._update_peak()
+
+    def _update_peak(self) -> None:
+        self.peak_resident_bytes = max(self.peak_resident_bytes, self.resident_bytes + self.materialized_bytes)
+
+    def end_step(self) -> None:
+        """ノードの終了時に呼び出し、そのノードで文字列に復元した一時ファイルの出力を数えなくします。"""
+        self.materialized_bytes = 0
+
+    def get(self, node_id: str) -> Optional[OutputHandle]:
+        return self._outputs.get(node_id)
+
+    def last(self) -> Optional[OutputHandle]:
+        """最後に保存された出力を返します。"""
+        if not self._outputs:
+            return None
+        return self._outputs[next(reversed(self._outputs))]
+
+    def discard(self, node_id: str) -> None:
+        handle = self._outputs.pop(node_id, None)
+        if handle is None:
+            return
+        if not handle.spilled:
+            self.resident_bytes -= handle.size
+        handle.close()
+
+    def close(self) -> None:
+        """すべての出力を破棄し、一時ファイルを削除します。"""
+        for node_id in list(self._outputs):
+            self.discard(node_id)
+
+    def __contains__(self, node_id: str) -> bool:
+        return node_id in self._outputs
+
+    def __len__(self) -> int:
+        return len(self._outputs)
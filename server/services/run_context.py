@@ -0,0 +1,36 @@
+from dataclasses import dataclass, field
+from typing import Optional
+
+from services.cancellation import CancellationToken
+from services.checkpoints import RunCheckpoints
+from services.output_store import OutputHandle, OutputStore
+
+
+@dataclass
+class RunContext:
+    """
+    ワークフロー1回分の実行状態
+
+    WorkflowService / AgentService は複数の実行で共有されるため、
+    実行ごとに変化する値（ノードの出力やキャンセルトークン）はすべてここに保持します。
+    """
+    run_id: Optional[str] = None
+    workflow_id: Optional[str] = None  # 指定されている場合は実行計画をキャッシュする
+    record_intermediate: bool = False  # まとめて実行したフォーマッターの途中の結果も返す
+    cancel_token: Optional[CancellationToken] = None
+    node_token: Optional[CancellationToken] = None  # 実行中のノードのトークン（cancel_token の子。ノードの予算でキャンセルされる）
+    outputs: OutputStore = field(default_factory=OutputStore)  # ノードID -> 出力（大きな出力は一時ファイル）
+    checkpoints: Optional[RunCheckpoints] = None  # 未指定で run_id がある場合は実行時に作成する
+
+    def previous_output(self) -> Optional[OutputHandle]:
+        """直前に実行されたノードの出力を返します。"""
+        return self.outputs.last()
+
+    def previous_text(self) -> str:
+        """直前に実行されたノードの出力テキストを返します。"""
+        handle = self.outputs.last()
+        return handle.text() if handle else ""
+
+    def close(self) -> None:
+        """実行の終了時に、一時ファイルに書き出した出力を削除します。"""
+        self.outputs.close()
@@ -0,0 +1,207 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+from contextlib import suppress
+from datetime import datetime
+from typing import Any, Dict, Optional
+from uuid import uuid4
+
+from database import SessionLocal
+from models import RunStatus
+from repositories.run_repository import RunRepository
+from repositories.workflow_repository import WorkflowRepository
+from services.admission import RUN_MAX_CONCURRENT, RUN_MAX_PER_WORKFLOW, RUN_STALE_SECONDS
+from services.budget import cancelled_run_status
+from services.cancellation import CancellationToken
+from services.execution_plan import snapshot_nodes
+from services.run_context import RunContext
+from services.workflow_service import FAILED_NODE_STATUSES, WorkflowService
+
+logger = logging.getLogger('WorkflowApp')
+
+class RunWorker:
+    """
+    DBのキューから実行を取得してワークフローを実行するワーカー
+
+    実行中はハートビートでリースを延長し、停止したワーカーの実行は
+    リース切れ後に他のワーカーが引き継ぎます。
+    実行イベントは run_events テーブルに記録され、どのAPIプロセスからでも中継できます。
+    APIの受け付けと同じ同時実行数の上限（RUN_MAX_CONCURRENT / RUN_MAX_PER_WORKFLOW）を超える実行は取得しません。
+    """
+
+    def __init__(
+        self,
+        workflow_service: WorkflowService,
+        worker_id: Optional[str] = None,
+        lease_seconds: int = int(os.getenv("WORKER_LEASE_SECONDS", "60")),
+        heartbeat_seconds: float = float(os.getenv("WORKER_HEARTBEAT_SECONDS", "10")),
+        poll_seconds: float = float(os.getenv("WORKER_POLL_SECONDS", "1")),
+        max_concurrent: int = RUN_MAX_CONCURRENT,
+        max_per_workflow: int = RUN_MAX_PER_WORKFLOW,
+        stale_seconds: int = RUN_STALE_SECONDS,
+    ):
+        self.workflow_service = workflow_service  # 同時に実行する実行間で共有
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid4().hex[:8]}"
+        self.lease_seconds = lease_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self.poll_seconds = poll_seconds
+        self.max_concurrent = max_concurrent
+        self.max_per_workflow = max_per_workflow
+        self.stale_seconds = stale_seconds
+        self._stopping = False
+
+    def stop(self) -> None:
+        """実行中の実行が終わったらワーカーを停止します。"""
+        self._stopping = True
+
+    async def run_forever(self, concurrency: int = 1) -> None:
+        """
+        キューの監視を開始します。
+
+        Args:
+            concurrency: このプロセスで同時に実行する実行数
+        """
+        logger.info(f"Run worker started: worker_id={self.worker_id}, concurrency={concurrency}")
+        await asyncio.gather(*(self._poll_loop() for _ in range(concurrency)))
+
+    async def _poll_loop(self) -> None:
+        while not self._stopping:
+            try:
+                claimed = await self.run_once()
+            except Exception as e:
+                logger.error(f"Run worker error: {str(e)}", exc_info=True)
+                claimed = False
+            if not claimed:
+                await asyncio.sleep(self.poll_seconds)
+
+    async def run_once(self) -> bool:
+        """
+        キューから実行を1件取得して実行します。
+
+        Returns:
+            実行を取得できた場合はTrue
+        """
+        claimed = await asyncio.to_thread(self._claim)
+        if claimed is None:
+            return False
+        run_id, workflow_id, cancel_requested, nodes = claimed
+
+        logger.info(f"Run claimed: run_id={run_id}, worker_id={self.worker_id}")
+        cancel_token = CancellationToken()
+        if cancel_requested:
+            cancel_token.cancel("cancelled_by_user")
+        heartbeat = asyncio.create_task(self._heartbeat_loop(run_id, cancel_token))
+        try:
+            await self._execute(run_id, workflow_id, nodes, cancel_token)
+        finally:
+            heartbeat.cancel()
+            with suppress(asyncio.CancelledError):
+                await heartbeat
+        return True
+
+    def _claim(self) -> Optional[tuple]:
+        """キューから実行を1件取得し、(実行ID, ワークフローID, キャンセル要求の有無, ノード) を返します。"""
+        db = SessionLocal()
+        try:
+            run = RunRepository(db).claim_next_run(
+                self.worker_id, self.lease_seconds, self.max_concurrent, self.max_per_workflow, self.stale_seconds
+            )
+            if not run:
+                return None
+            workflow = WorkflowRepository(db).get_workflow(run.workflow_id)
+            nodes = snapshot_nodes(workflow.nodes) if workflow else []
+            return run.id, run.workflow_id, run.status == RunStatus.CANCEL_REQUESTED.value, nodes
+        finally:
+            db.close()
+
+    def _heartbeat(self, run_id: str) -> Optional[tuple]:
+        """リースを延長し、(ステータス, 理由) を返します（リースを失った場合はNone）。"""
+        db = SessionLocal()
+        try:
+            run = RunRepository(db).heartbeat(run_id, self.worker_id, self.lease_seconds)
+            return (run.status, run.status_detail) if run else None
+        finally:
+            db.close()
+
+    async def _heartbeat_loop(self, run_id: str, cancel_token: CancellationToken) -> None:
+        """リースを延長し、キャンセル要求やリースの喪失を検知します。"""
+        while True:
+            await asyncio.sleep(self.heartbeat_seconds)
+            run = await asyncio.to_thread(self._heartbeat, run_id)
+
+            if run is None:
+                logger.warning(f"Lease lost: run_id={run_id}, worker_id={self.worker_id}")
+                cancel_token.cancel("lease_lost")
+                return
+            status, detail = run
+            if status == RunStatus.CANCEL_REQUESTED.value:
+                cancel_token.cancel(detail or "cancelled_by_user")
+                return
+
+    async def _execute(self, run_id: str, workflow_id: str, nodes: list, cancel_token: CancellationToken) -> None:
+        # DBへの書き込みはスレッドで行い、同時に実行中の実行やハートビートを止めない
+        # （セッションは1つの実行の中で順に使うだけで、同時には使わない）
+        db = SessionLocal()
+        run_repo = RunRepository(db)
+        seq = await asyncio.to_thread(run_repo.next_event_seq, run_id)
+
+        async def emit(event: str, data: Dict[str, Any]) -> None:
+            nonlocal seq
+            await asyncio.to_thread(run_repo.append_event, run_id, seq, event, json.dumps(data, ensure_ascii=False))
+            seq += 1
+
+        try:
+            await emit("run_start", {"runId": run_id, "workerId": self.worker_id})
+            if not nodes:
+                raise ValueError("ワークフローが見つかりません")
+
+            context = RunContext(run_id=run_id, workflow_id=workflow_id, cancel_token=cancel_token)
+            failure = None  # 最初に失敗したノードの結果
+            async for result in self.workflow_service.execute(nodes, context):
+                if failure is None and result["status"] in FAILED_NODE_STATUSES:
+                    failure = result["result"]
+                await emit("node_update", result)
+
+            if cancel_token.cancelled:
+                if cancel_token.reason == "lease_lost":
+                    # 他のワーカーが引き継いでいるため、ステータスは更新しない
+                    return
+                status = cancelled_run_status(cancel_token)
+                await emit("run_budget_exceeded" if status == RunStatus.BUDGET_EXCEEDED else "run_cancelled", {
+                    "runId": run_id,
+                    "status": status.value,
+                    "timestamp": datetime.now().isoformat(),
+                    "result": cancel_token.reason
+                })
+                await asyncio.to_thread(run_repo.update_status, run_id, status, cancel_token.reason)
+            elif failure is not None:
+                # 失敗したノードがある実行はエラーとして記録する（チェックポイントを残し、再開できる）
+                await emit("run_complete", {
+                    "runId": run_id,
+                    "status": RunStatus.ERROR.value,
+                    "timestamp": datetime.now().isoformat(),
+                    "result": failure
+                })
+                await asyncio.to_thread(run_repo.update_status, run_id, RunStatus.ERROR, failure)
+            else:
+                await emit("run_complete", {
+                    "runId": run_id,
+                    "status": RunStatus.SUCCESS.value,
+                    "timestamp": datetime.now().isoformat()
+                })
+                await asyncio.to_thread(run_repo.update_status, run_id, RunStatus.SUCCESS)
+
+        except Exception as e:
+            logger.error(f"Error in workflow execution: run_id={run_id}, {str(e)}")
+            await asyncio.to_thread(db.rollback)
+            await emit("workflow_error", {
+                "status": "error",
+                "timestamp": datetime.now().isoformat(),
+                "result": f"エラー: {str(e)}"
+            })
+            await asyncio.to_thread(run_repo.update_status, run_id, RunStatus.ERROR, str(e))
+
+        finally:
+            await asyncio.to_thread(db.close)
@@ -0,0 +1,171 @@
+"""
+構造化ログ
+
+- ログの設定は configure_logging() で1回だけ行います（各モジュールで basicConfig を呼ばない）。
+- LazyJSON は、ログが実際に出力されるときにだけJSONに変換し、サイズの上限で切り詰めます。
+  `logger.debug("計画: %s", LazyJSON(plan))` のように、f-stringではなく引数として渡してください。
+- 実行IDとノードIDは contextvars で保持し、すべてのログに付与します。
+- DEBUGログは実行ごとにサンプリングします（LOG_SAMPLE_RATE）。INFO以上は常に出力します。
+
+環境変数:
+    LOG_LEVEL: ログレベル（既定はDEBUG_MODEがtrueならDEBUG、それ以外はINFO）
+    LOG_FORMAT: "text" または "json"（既定はtext）
+    LOG_SAMPLE_RATE: DEBUGログを出力する実行の割合 0.0〜1.0（既定1.0）
+    LOG_PAYLOAD_MAX_CHARS: LazyJSONの最大文字数（既定2000）
+"""
+import json
+import logging
+import os
+import zlib
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Iterator, Optional
+
+LOG_PAYLOAD_MAX_CHARS = int(os.getenv("LOG_PAYLOAD_MAX_CHARS", "2000"))
+
+run_id_var: ContextVar[Optional[str]] = ContextVar("run_id", default=None)
+node_id_var: ContextVar[Optional[str]] = ContextVar("node_id", default=None)
+sampled_var: ContextVar[bool] = ContextVar("log_sampled", default=True)
+
+_configured = False
+
+
+def _truncate(text: str, max_chars: int) -> str:
+    if len(text) <= max_chars:
+        return text
+    return f"{text[:max_chars]}...(truncated, {len(text)} chars)"
+
+
+def _shrink(value: Any, max_chars: int) -> Any:
+    """シリアライズの前に長い文字列を切り詰め、大きな文書をまるごとJSONにしないようにします。"""
+    if isinstance(value, str):
+        return _truncate(value, max_chars)
+    if isinstance(value, dict):
+        return {key: _shrink(item, max_chars) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_shrink(item, max_chars) for item in value]
+    return value
+
+
+class LazyJSON:
+    """
+    ログの出力時にだけJSONに変換される値
+
+    ログが出力されない場合（レベルやサンプリングで除外された場合）はシリアライズしません。
+    """
+    __slots__ = ("value", "max_chars")
+
+    def __init__(self, value: Any, max_chars: int = LOG_PAYLOAD_MAX_CHARS):
+        self.value = value
+        self.max_chars = max_chars
+
+    def __str__(self) -> str:
+        try:
+            text = json.dumps(_shrink(self.value, self.max_chars), ensure_ascii=False, default=str)
+        except (TypeError, ValueError):
+            text = str(self.value)
+        return _truncate(text, self.max_chars)
+
+    __repr__ = __str__
+
+
+def is_sampled(run_id: str, rate: Optional[float] = None) -> bool:
+    """実行IDから、その実行のDEBUGログを出力するかを決めます（同じ実行IDでは常に同じ結果）。"""
+    rate = float(os.getenv("LOG_SAMPLE_RATE", "1.0")) if rate is None else rate
+    if rate >= 1.0:
+        return True
+    if rate <= 0.0:
+        return False
+    return zlib.crc32(run_id.encode()) / 0xFFFFFFFF < rate
+
+
+@contextmanager
+def use_context_var(var: ContextVar, value: Any) -> Iterator[None]:
+    """
+    ブロック内でコンテキスト変数に value を設定し、抜けるときに元に戻します。
+
+    非同期ジェネレーターの中で使うと、別のコンテキストで閉じられる場合があるため、
+    その場合は元に戻さずに終了します（タスクごとにコンテキストは分かれている）。
+    """
+    token = var.set(value)
+    try:
+        yield
+    finally:
+        try:
+            var.reset(token)
+        except ValueError:
+            pass
+
+
+@contextmanager
+def log_context(run_id: Optional[str] = None) -> Iterator[None]:
+    """ブロック内のログに実行IDを付与し、その実行のサンプリングを決定します。"""
+    with use_context_var(run_id_var, run_id), use_context_var(node_id_var, None), \
+            use_context_var(sampled_var, is_sampled(run_id) if run_id else True):
+        yield
+
+
+def set_node_id(node_id: Optional[str]) -> None:
+    """以降のログに付与するノードIDを設定します。"""
+    node_id_var.set(node_id)
+
+
+class ContextFilter(logging.Filter):
+    """実行ID・ノードIDを付与し、サンプリング対象外の実行のDEBUGログを除外します。"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.run_id = run_id_var.get()
+        record.node_id = node_id_var.get()
+        if record.levelno <= logging.DEBUG and not sampled_var.get():
+            return False
+        return True
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        ids = [f"{key}={getattr(record, key)}" for key in ("run_id", "node_id") if getattr(record, key, None)]
+        return f"{text} [{' '.join(ids)}]" if ids else text
+
+
+class JSONFormatter(logging.Formatter):
+    """1行1レコードのJSON形式で出力します。"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key in ("run_id", "node_id"):
+            if getattr(record, key, None):
+                entry[key] = getattr(record, key)
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def configure_logging(debug: bool = False) -> None:
+    """
+    ルートロガーを設定します。2回目以降の呼び出しは何もしません。
+
+    Args:
+        debug: Trueの場合、LOG_LEVELが未指定ならDEBUGレベルにする
+    """
+    global _configured
+    if _configured:
+        return
+    _configured = True
+
+    handler = logging.StreamHandler()
+    handler.addFilter(ContextFilter())
+    handler.setFormatter(JSONFormatter() if os.getenv("LOG_FORMAT", "text").lower() == "json" else TextFormatter())
+
+    root = logging.getLogger()
+    root.addHandler(handler)
+    root.setLevel(os.getenv("LOG_LEVEL", "DEBUG" if debug else "INFO").upper())
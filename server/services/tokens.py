@@ -0,0 +1,17 @@
+"""
+トークン数の目安
+
+見積もり（services/cost_estimator.py）や、使用量が返されないストリーミングの応答の予算の計算に使用します。
+"""
+import math
+
+
+def count_tokens(text: str) -> int:
+    """
+    テキストのトークン数の目安を返します。
+    ASCIIは約4文字、それ以外（日本語など）は約1文字を1トークンとして数えます。
+    """
+    if not text:
+        return 0
+    ascii_chars = len(text.encode("ascii", "ignore"))
+    return math.ceil(ascii_chars / 4 + (len(text) - ascii_chars))
@@ -0,0 +1,212 @@
+"""
+アップロードされたファイルの一時保存
+
+multipart/form-data のリクエストボディを受信しながら解析し（python-multipart のストリーミングパーサー）、
+指定したフィールドのファイルだけを、サイズの上限を確認しながら一意な名前の一時ファイルに
+非同期I/O（aiofiles）で書き込みます。同時にSHA-256を計算します。
+FastAPI の UploadFile と異なり、ボディ全体を先に一時ファイルに書き出さないため1回の走査で済み、
+Content-Length が上限を超えるリクエストはボディを読む前に、超えていなくても上限に達した時点で拒否します。
+同じファイル名の同時アップロードでも互いに上書きしません。
+
+環境変数:
+    UPLOAD_MAX_BYTES: アップロードできる最大サイズ（既定10MB）
+"""
+import hashlib
+import logging
+import os
+import uuid
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, List, Optional
+
+import aiofiles
+from fastapi import Request
+from multipart.exceptions import MultipartParseError
+from multipart.multipart import MultipartParser, parse_options_header
+
+logger = logging.getLogger('WorkflowApp')
+
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(10 * 1024 * 1024)))
+# multipart の境界やヘッダーなど、ファイル以外に許容するリクエストボディのサイズ
+UPLOAD_FORM_OVERHEAD_BYTES = 64 * 1024
+
+
+class UploadTooLargeError(Exception):
+    """アップロードが最大サイズを超えたことを表す例外"""
+
+    def __init__(self, max_bytes: int):
+        super().__init__(f"upload exceeds {max_bytes} bytes")
+        self.max_bytes = max_bytes
+
+
+class UploadFormatError(Exception):
+    """リクエストボディが multipart/form-data として不正、またはファイルがないことを表す例外"""
+
+
+@dataclass
+class StoredUpload:
+    path: str
+    size: int
+    sha256: str
+    filename: Optional[str] = None  # クライアントが指定したファイル名
+
+
+class _FilePartCollector:
+    """
+    MultipartParser のコールバック。field_name のファイルのデータだけを集めます。
+    コールバックは同期関数のため、データは pending に溜め、書き込みは呼び出し元で行います。
+    """
+
+    def __init__(self, field_name: str):
+        self.field_name = field_name.encode("utf-8")
+        self.pending: List[bytes] = []
+        self.filename: Optional[str] = None
+        self.found = False  # 対象のファイルのパートが始まったか
+        self.finished = False  # 対象のファイルのパートが終わったか
+        self._in_target = False
+        self._headers: Dict[bytes, bytes] = {}
+        self._header_field = b""
+        self._header_value = b""
+
+    def callbacks(self) -> Dict[str, object]:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+        }
+
+    def on_part_begin(self) -> None:
+        self._headers = {}
+
+    def on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_field += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def on_header_end(self) -> None:
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def on_headers_finished(self) -> None:
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        # 同じフィールドのファイルが複数ある場合は最初のファイルのみを使う
+        self._in_target = not self.found and options.get(b"name") == self.field_name and b"filename" in options
+        if self._in_target:
+            self.found = True
+            self.filename = options[b"filename"].decode("utf-8", errors="replace")
+
+    def on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._in_target:
+            self.pending.append(data[start:end])
+
+    def on_part_end(self) -> None:
+        if self._in_target:
+            self._in_target = False
+            self.finished = True
+
+
+class UploadStorage:
+    """
+    アップロードされたファイルの一時保存先
+
+    Args:
+        directory: 一時ファイルの作成先
+        max_bytes: アップロードできる最大サイズ
+    """
+
+    def __init__(self, directory: str, max_bytes: int = UPLOAD_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    async def save(self, request: Request, field_name: str = "file", suffix: str = "") -> StoredUpload:
+        """
+        multipart/form-data のリクエストボディを受信しながら、field_name のファイルを一時ファイルに書き込みます。
+        失敗した場合は書きかけのファイルを削除します。
+
+        Args:
+            request: multipart/form-data のリクエスト
+            field_name: ファイルのフィールド名
+            suffix: 一時ファイルの拡張子（".pdf" など）
+
+        Returns:
+            一時ファイルのパス、サイズ、SHA-256、ファイル名
+
+        Raises:
+            UploadTooLargeError: 最大サイズを超えた場合（Content-Length が超えている場合はボディを読まずに送出する）
+            UploadFormatError: multipart/form-data でない場合、またはファイルがない場合
+        """
+        content_type, params = parse_options_header(request.headers.get("content-type", ""))
+        if content_type != b"multipart/form-data" or b"boundary" not in params:
+            raise UploadFormatError("multipart/form-data で送信してください")
+        body_limit = self.max_bytes + UPLOAD_FORM_OVERHEAD_BYTES
+        content_length = request.headers.get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > body_limit:
+            raise UploadTooLargeError(self.max_bytes)
+
+        collector = _FilePartCollector(field_name)
+        parser = MultipartParser(params[b"boundary"], collector.callbacks())
+        path = os.path.join(self.directory, f"{uuid.uuid4().hex}{suffix}")
+        digest = hashlib.sha256()
+        size = 0
+        received = 0
+        try:
+            async with aiofiles.open(path, "wb") as out:
+                async for chunk in request.stream():
+                    received += len(chunk)
+                    if received > body_limit:
+                        # Content-Length のないリクエスト（chunked）も、上限を超えた時点で受信をやめる
+                        raise UploadTooLargeError(self.max_bytes)
+                    try:
+                        parser.write(chunk)
+                    except MultipartParseError as e:
+                        raise UploadFormatError(f"multipart/form-data の形式が不正です: {e}")
+                    for data in collector.pending:
+                        size += len(data)
+                        if size > self.max_bytes:
+                            raise UploadTooLargeError(self.max_bytes)
+                        digest.update(data)
+                        await out.write(data)
+                    collector.pending.clear()
+                    if collector.finished:
+                        # 残りのパートは使わないため読まない
+                        break
+            if not collector.finished:
+                raise UploadFormatError(f"ファイル（{field_name}）がありません")
+        except BaseException:
+            self.remove(path)
+            raise
+        return StoredUpload(path=path, size=size, sha256=digest.hexdigest(), filename=collector.filename)
+
+    @asynccontextmanager
+    async def receive(self, request: Request, field_name: str = "file", suffix: str = "") -> AsyncIterator[StoredUpload]:
+        """
+        アップロードを一時ファイルに書き込み、ブロックを抜けると（例外やキャンセルの場合も）削除します。
+
+        Args:
+            request: multipart/form-data のリクエスト
+            field_name: ファイルのフィールド名
+            suffix: 一時ファイルの拡張子
+
+        Yields:
+            一時ファイルのパス、サイズ、SHA-256、ファイル名
+        """
+        stored = await self.save(request, field_name, suffix)
+        try:
+            yield stored
+        finally:
+            self.remove(stored.path)
+
+    def remove(self, path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"一時ファイルを削除できませんでした: {path}: {str(e)}")
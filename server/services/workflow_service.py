@@ -1,143 +1,52 @@
-from typing import Dict, List, Any, Tuple, AsyncGenerator
-from collections import defaultdict, deque
+from typing import Dict, List, Any, AsyncGenerator, Optional
 from models import NodeType
+from database import SessionLocal
+from repositories.document_blob_repository import DocumentBlobRepository
 from services.agent_service import AgentService
 from services.generative_ai_service import GenerativeAIService
 from services.formatter_service import FormatterService
+from services.budget import RUN_LIMITS, Budget, BudgetExceededError, node_limits, use_budget
+from services.cancellation import CancellationToken, RunCancelledError
+from services.checkpoints import RUN_CHECKPOINTS_ENABLED, RunCheckpoints, use_checkpoints
+from services.llm_stats import RunLLMStats, use_llm_stats
+from services.run_context import RunContext
+from services.metrics import ACTIVE_RUNS, NODE_DURATION, OUTPUT_SPILLED_BYTES, RUN_OUTPUT_PEAK_BYTES
+from services.structured_logging import log_context, set_node_id
+from services.execution_plan import FORMATTER_CHAIN, ExecutionPlan, PlanCache, PlanStep, compile_plan, fingerprint
+import asyncio
 import logging
 from datetime import datetime
 import json
+import os
+import time
 
 logger = logging.getLogger('WorkflowApp')
 
-class WorkflowService:
-    def __init__(self, debug: bool = False):
-        self.ai_service = GenerativeAIService()
-        self.formatter_service = FormatterService()
-        self.agent_service = AgentService(debug=debug)
-        self.node_results: Dict[str, Dict[str, Any]] = {}  # ノードID -> 出力データ
-        self._cycle_cache: Dict[str, bool] = {}  # 循環チェックの結果をキャッシュ
-        self.debug = debug
+# 実行をエラーとして記録するノードのステータス（最初のノードの結果を理由にする）
+FAILED_NODE_STATUSES = ("error", "budget_exceeded")
 
-    def _check_cycle(self, current_node: str, graph: Dict[str, List[str]], visited_in_path: set) -> bool:
-        """
-        指定されたノードから到達可能なノードをチェックし、循環参照の有無を判定
-
-        Args:
-            current_node: チェック対象のノードID
-            graph: 依存関係グラフ
-            visited_in_path: 現在のパスで訪問済みのノード集合
+class WorkflowService:
+    """
+    ワークフローの実行サービス
 
-        Returns:
-            bool: 循環参照が存在する場合はTrue
-        """
-        # キャッシュをチェック
-        cache_key = f"{current_node}_{','.join(sorted(visited_in_path))}"
-        if cache_key in self._cycle_cache:
-            return self._cycle_cache[cache_key]
-
-        if current_node in visited_in_path:
-            self._cycle_cache[cache_key] = True
-            return True
-
-        visited_in_path.add(current_node)
-        for next_node in graph[current_node]:
-            if self._check_cycle(next_node, graph, visited_in_path):
-                self._cycle_cache[cache_key] = True
-                return True
-        visited_in_path.remove(current_node)
-        
-        self._cycle_cache[cache_key] = False
-        return False
-
-    def _build_dependency_graph(self, nodes: List[dict]) -> Tuple[Dict[str, List[str]], Dict[str, int]]:
-        """
-        ノード間の依存関係を構築
+    インスタンスは複数の実行で共有されます（OpenAIクライアントも共有）。
+    実行ごとの状態は RunContext に保持するため、同時に複数の実行を行っても結果が混ざりません。
+    """
 
-        Returns:
-            Tuple[Dict[str, List[str]], Dict[str, int]]: (グラフ, 入次数)
-        """
-        graph = defaultdict(list)
-        in_degree = defaultdict(int)
-        edge_cache = set()  # エッジの重複を防ぐためのキャッシュ
-
-        # ノードIDからノードへのマッピングを作成
-        node_map = {node['id']: node for node in nodes}
-
-        for node in nodes:
-            node_id = node['id']
-            if 'edges' in node['config']:
-                for edge in node['config']['edges']:
-                    if edge['target'] == node_id:
-                        source_id = edge['source']
-                        # エッジの重複をチェック
-                        edge_key = f"{source_id}->{node_id}"
-                        if source_id in node_map and edge_key not in edge_cache:
-                            edge_cache.add(edge_key)
-                            graph[source_id].append(node_id)
-                            in_degree[node_id] += 1
-
-        return graph, in_degree
-
-    def _get_execution_order(self, nodes: List[dict]) -> List[str]:
-        """
-         - トポロジカルソートで実行順序を決定
-         - 循環参照をチェック
-         - 循環参照がある場合、残りのノードを追加（※ただし、２回目までは許容してみた）
-        """
-        self._cycle_cache.clear()  # キャッシュをクリア
-        graph = defaultdict(list)
-        in_degree = defaultdict(int)
-
-        # ノードのIDとconfig.node.idのマッピングを作成
-        node_id_map = {node['config']['node']['id']: node['id'] for node in nodes}
-
-        # エッジ情報から依存関係グラフを構築
-        for node in nodes:
-            if node['config'].get('edge'):
-                edge = node['config']['edge']
-                source_id = node_id_map[edge['source']]
-                target_id = node_id_map[edge['target']]
-                graph[source_id].append(target_id)
-                in_degree[target_id] += 1
-
-        # 初期ノードを効率的に取得
-        initial_nodes = [node['id'] for node in nodes if in_degree[node['id']] == 0]
-        queue = deque(initial_nodes)
-        execution_order = []
-        visit_count = defaultdict(int)
-        processed_nodes = set()  # 処理済みノードを記録
-
-        while queue:
-            node_id = queue.popleft()
-            if node_id in processed_nodes:
-                continue
-
-            visit_count[node_id] += 1
-            processed_nodes.add(node_id)
-
-            # 循環参照をチェック
-            if visit_count[node_id] > 1:
-                visited_in_path = set()
-                if self._check_cycle(node_id, graph, visited_in_path):
-                    print(f"警告: ノード {node_id} の2回目の処理は循環参照を引き起こすためスキップします")
-                    continue
-
-            execution_order.append(node_id)
-
-            # 次のノードを効率的に追加
-            for next_node in graph[node_id]:
-                in_degree[next_node] -= 1
-                if in_degree[next_node] == 0 and next_node not in processed_nodes:
-                    queue.append(next_node)
-
-        # 未処理のノードを効率的に追加
-        remaining_nodes = [node['id'] for node in nodes if node['id'] not in processed_nodes]
-        if remaining_nodes:
-            print(f"警告: 以下のノードで循環参照が検出されました: {remaining_nodes}")
-            execution_order.extend(remaining_nodes)
-
-        return execution_order
+    def __init__(self, debug: bool = False, ai_service: Optional[GenerativeAIService] = None):
+        self.ai_service = ai_service or GenerativeAIService()
+        self.formatter_service = FormatterService()
+        self.agent_service = AgentService(debug=debug, ai_service=self.ai_service)
+        self.debug = debug
+        self.plan_cache = PlanCache(max_size=int(os.getenv("PLAN_CACHE_SIZE", "256")))
+        # ノードタイプ -> 実行関数（実行計画の作成時に解決される）
+        self._handlers = {
+            NodeType.EXTRACT_TEXT.value: self._run_extract_text,
+            NodeType.GENERATIVE_AI.value: self._run_generative_ai,
+            NodeType.FORMATTER.value: self._run_formatter,
+            NodeType.AGENT.value: self._run_agent,
+            FORMATTER_CHAIN: self._run_formatter_chain,
+        }
 
     def _ensure_string_result(self, result: Any) -> str:
         """
@@ -185,7 +94,31 @@ class WorkflowService:
             "timestamp": str(log_entry.get("timestamp", datetime.now().isoformat()))
         }
 
-    async def execute(self, nodes: List[dict]) -> AsyncGenerator[Dict[str, Any], None]:
+    def get_plan(self, nodes: List[dict], workflow_id: Optional[str] = None) -> ExecutionPlan:
+        """
+        ワークフローの実行計画を返します。
+
+        workflow_id が指定されている場合は (workflow_id, fingerprint) でキャッシュし、
+        同じバージョンの2回目以降の実行ではグラフの構築や設定の検証を省略します。
+
+        Args:
+            nodes: ノードのリスト
+            workflow_id: ワークフローID
+
+        Returns:
+            実行計画
+        """
+        node_fingerprint = fingerprint(nodes)
+        if workflow_id is None:
+            return compile_plan(nodes, self._handlers, node_fingerprint=node_fingerprint)
+
+        plan = self.plan_cache.get(workflow_id, node_fingerprint)
+        if plan is None:
+            plan = compile_plan(nodes, self._handlers, workflow_id, node_fingerprint)
+            self.plan_cache.put(plan)
+        return plan
+
+    async def execute(self, nodes: List[dict], context: Optional[RunContext] = None, progress: bool = True) -> AsyncGenerator[Dict[str, Any], None]:
         """
         ワークフローを実行します。
 
@@ -193,195 +126,341 @@ class WorkflowService:
         V: ワークフロー内のノード数
         E: ノード間のエッジ（依存関係）の数
 
-        ### 時間計算量: O(V + E)
-        1. ノードマップの作成: O(V)
-        2. 実行順序の取得: O(V + E)
-        3. 各ノードの実行: O(V)（各ノードは1回だけ実行）
-        => 全体の時間計算量は O(V + E) 
+        ### 時間計算量
+        1. 実行計画の取得: キャッシュ済みの場合は O(V)（fingerprintの計算のみ）、
+           未キャッシュの場合は O(V + E)（services/execution_plan.py）
+        2. 各ノードの実行: O(V)（各ノードは1回だけ実行）
 
-        ### 空間計算量は：
-        1. グラフの保存: O(V + E)
-        2. キャッシュ: O(V + E)
-        3. その他の補助データ構造: O(V)
-        => 全体の空間計算量も O(V + E) 
+        ### 空間計算量: O(V + E)（実行計画はワークフローのバージョンごとに1つ）
+
+        ノードごとの上限（ノードタイプの既定値と設定の limits）と実行全体の上限（RUN_LIMITS）の
+        所要時間・LLMの呼び出し回数・トークン数を超えた場合は、実行中の処理を中断して status="budget_exceeded" のイベントを返します
+        （services/budget.py）。ノードの上限の場合は次のノードに進み、実行全体の上限の場合は終了します。
+
+        context.run_id がある場合は、成功したノードとLLMの応答をチェックポイントに保存します。
+        中断した実行を同じ run_id で再開すると、保存済みのノードは実行せずにイベント（restored=True）と出力を復元します
+        （services/checkpoints.py）。
 
         Args:
             nodes: 実行するノードのリスト
+            context: 実行ごとの状態。context.workflow_id が指定されている場合は実行計画をキャッシュします。
+                context.cancel_token がキャンセルされると、実行中のノードに status="cancelled" のイベントを返して終了します。
+            progress: Falseの場合はエージェントの途中経過（status="running"）や
+                execution_logを生成せず、各ノードにつき最終結果のみを返します。
 
         Yields:
             実行結果とステータス
         """
-        self.node_results.clear()
-        execution_order = self._get_execution_order(nodes)
-        node_map = {node['id']: node for node in nodes}
+        context = context or RunContext()
+        if context.cancel_token is None:
+            context.cancel_token = CancellationToken()
+        cancel_token = context.cancel_token
+        plan = self.get_plan(nodes, context.workflow_id)
+        if context.checkpoints is None and context.run_id and RUN_CHECKPOINTS_ENABLED:
+            context.checkpoints = RunCheckpoints(context.run_id, SessionLocal)
+        checkpoints = context.checkpoints
+        # 実行前の見積もり（services/cost_estimator.py）に使用するLLM呼び出しの集計
+        llm_stats = RunLLMStats(context.run_id, SessionLocal) if context.run_id else None
+
+        run_budget = Budget("run", RUN_LIMITS, cancel_token).start()
+        ACTIVE_RUNS.inc()
+        try:
+            with log_context(context.run_id), use_checkpoints(checkpoints), use_llm_stats(llm_stats):
+                for step in plan.steps:
+                    set_node_id(step.node_id)
+                    checkpoint_key = checkpoints.node_key(plan.fingerprint, step.node_id) if checkpoints else None
+                    restored = await checkpoints.restore_node(checkpoint_key) if checkpoints else None
+                    if restored is not None:
+                        for event in restored:
+                            self._restore_output(context, event)
+                            yield {**event, "restored": True}
+                        context.outputs.end_step()
+                        continue
+
+                    started_at = time.perf_counter()
+                    status = "error"
+                    node_token = context.node_token = cancel_token.child()
+                    budget = Budget("node", node_limits(step.node_type, step.config), node_token, parent=run_budget)
+                    try:
+                        cancel_token.raise_if_cancelled()
+                        if step.error:
+                            raise ValueError(step.error)
+
+                        final_events = []
+                        budget.start()
+                        with use_budget(budget):
+                            # イベントごとの待機をノードのトークンで中断できるようにする
+                            # （LLM以外の処理で止まっている場合も、上限の時点で中断する）
+                            events = step.handler(step, context, progress)
+                            try:
+                                while True:
+                                    try:
+                                        event = await node_token.run(events.__anext__())
+                                    except StopAsyncIteration:
+                                        break
+                                    status = event["status"]
+                                    if status != "running":
+                                        final_events.append(event)
+                                    yield event
+                            finally:
+                                await events.aclose()
+
+                        if checkpoints and final_events and all(event["status"] == "success" for event in final_events):
+                            await checkpoints.save_node(checkpoint_key, final_events)
+
+                    except BudgetExceededError as e:
+                        status = "budget_exceeded"
+                        logger.warning(f"Budget exceeded at node {step.node_id}: {str(e)}")
+                        yield {
+                            "nodeId": step.node_id,
+                            "nodeType": step.node_type,
+                            "status": "budget_exceeded",
+                            "result": f"予算の上限を超えたため中断しました: {str(e)}",
+                            "budget": {
+                                "scope": e.scope,
+                                "limit": e.limit,
+                                "value": e.value,
+                                "llm_calls": budget.llm_calls,
+                                "tokens": budget.tokens
+                            },
+                            "execution_log": [{
+                                "step": "budget_exceeded",
+                                "result": str(e),
+                                "timestamp": datetime.now().isoformat()
+                            }]
+                        }
+                        if e.scope == "run":
+                            return
+
+                    except RunCancelledError as e:
+                        status = "cancelled"
+                        logger.info(f"Workflow execution cancelled at node {step.node_id}: {str(e)}")
+                        yield {
+                            "nodeId": step.node_id,
+                            "nodeType": step.node_type,
+                            "status": "cancelled",
+                            "result": "実行がキャンセルされました",
+                            "execution_log": [{
+                                "step": "cancelled",
+                                "result": str(e),
+                                "timestamp": datetime.now().isoformat()
+                            }]
+                        }
+                        return
+
+                    except Exception as e:
+                        status = "error"
+                        logger.error(f"Error executing node {step.node_id}: {str(e)}")
+                        yield {
+                            "nodeId": step.node_id,
+                            "nodeType": step.node_type,
+                            "status": "error",
+                            "result": f"エラー: {str(e)}",
+                            "execution_log": [{
+                                "step": "エラー",
+                                "result": str(e),
+                                "timestamp": datetime.now().isoformat()
+                            }]
+                        }
+
+                    finally:
+                        budget.close()
+                        cancel_token.release(node_token)
+                        context.node_token = None
+                        context.outputs.end_step()
+                        NODE_DURATION.labels(step.node_type, status).observe(time.perf_counter() - started_at)
+        finally:
+            run_budget.close()
+            ACTIVE_RUNS.dec()
+            if llm_stats is not None:
+                llm_stats.save_in_background()
+            if checkpoints and (checkpoints.restored_nodes or checkpoints.restored_llm_calls):
+                logger.info(
+                    "Run resumed from checkpoints: run_id=%s, restored_nodes=%s, restored_llm_calls=%s",
+                    context.run_id, checkpoints.restored_nodes, checkpoints.restored_llm_calls
+                )
+            RUN_OUTPUT_PEAK_BYTES.observe(context.outputs.peak_resident_bytes)
+            OUTPUT_SPILLED_BYTES.inc(context.outputs.spilled_bytes)
+            logger.debug(
+                "Run outputs: run_id=%s, peak_resident_bytes=%s, spilled_bytes=%s",
+                context.run_id, context.outputs.peak_resident_bytes, context.outputs.spilled_bytes
+            )
+            context.close()
+
+    def _restore_output(self, context: RunContext, event: Dict[str, Any]) -> None:
+        """チェックポイントから復元したイベントの結果を、後続のノードの入力として保存します（_success と同じ条件）。"""
+        if event["status"] == "success" and "fusedInto" not in event:
+            context.outputs.put(event["nodeId"], event["result"])
+
+    def _success(self, step: PlanStep, context: RunContext, result: Any) -> Dict[str, Any]:
+        """ノードの結果を保存し、成功イベントを返します。"""
+        result_str = self._ensure_string_result(result)
+        context.outputs.put(step.node_id, result_str)
+        return {
+            "nodeId": step.node_id,
+            "nodeType": step.node_type,
+            "status": "success",
+            "result": result_str
+        }
 
-        for node_id in execution_order:
-            node = node_map[node_id]
-            try:
-                if node['node_type'] == NodeType.EXTRACT_TEXT:
-                    result = await self._execute_extract_text(node['config'])
-                    self.node_results[node_id] = {"text": result}
-                    yield {
-                        "nodeId": node_id,
-                        "nodeType": node['node_type'],
-                        "status": "success",
-                        "result": self._ensure_string_result(result)
-                    }
-
-                elif node['node_type'] == NodeType.GENERATIVE_AI:
-                    result = await self._execute_generative_ai(node['config'])
-                    self.node_results[node_id] = {"text": result}
-                    yield {
-                        "nodeId": node_id,
-                        "nodeType": node['node_type'],
-                        "status": "success",
-                        "result": self._ensure_string_result(result)
-                    }
-
-                elif node['node_type'] == NodeType.FORMATTER:
-                    result = await self._execute_formatter(node['config'])
-                    self.node_results[node_id] = {"text": result}
-                    yield {
-                        "nodeId": node_id,
-                        "nodeType": node['node_type'],
-                        "status": "success",
-                        "result": self._ensure_string_result(result)
-                    }
-
-                elif node['node_type'] == NodeType.AGENT:
-                    async for result in self.agent_service.execute_agent(
-                        goal=node['config']["goal"],
-                        constraints=node['config'].get("constraints", []),
-                        capabilities=node['config'].get("capabilities", {}),
-                        behavior=node['config'].get("behavior", {}),
-                        context={"previous_text": self.node_results.get(list(self.node_results.keys())[-1], {}).get("text", "")}
-                    ):
-                        if result["status"] == "success":
-                            final_result = result["execution_log"][-1]["result"]
-                            final_result_str = self._ensure_string_result(final_result)
-                            self.node_results[node_id] = {"text": final_result_str}
-                            yield {
-                                "nodeId": node_id,
-                                "nodeType": node['node_type'],
-                                "status": "success",
-                                "result": final_result_str,
-                                "execution_log": [self._ensure_log_entry_string(log) for log in result["execution_log"]]
-                            }
-                        elif result["status"] in ["timeout", "max_iterations", "max_improvement_cycles"]:
-                            error_msg = f"エージェントの実行が終了しました: {result['error']}"
-                            yield {
-                                "nodeId": node_id,
-                                "nodeType": node['node_type'],
-                                "status": "error",
-                                "result": error_msg,
-                                "execution_log": [{
-                                    "step": "agent_error",
-                                    "result": error_msg,
-                                    "timestamp": datetime.now().isoformat()
-                                }]
-                            }
-                        else:
-                            current_result = result["execution_log"][-1]["result"] if result["execution_log"] else "処理中"
-                            current_result_str = self._ensure_string_result(current_result)
-                            yield {
-                                "nodeId": node_id,
-                                "nodeType": node['node_type'],
-                                "status": result["status"],
-                                "result": current_result_str,
-                                "execution_log": [self._ensure_log_entry_string(log) for log in result["execution_log"]]
-                            }
-
-                else:
-                    raise ValueError(f"未知のノードタイプ: {node['node_type']}")
-
-            except Exception as e:
-                logger.error(f"Error executing node {node_id}: {str(e)}")
+    async def _run_extract_text(self, step: PlanStep, context: RunContext, progress: bool) -> AsyncGenerator[Dict[str, Any], None]:
+        yield self._success(step, context, await self._execute_extract_text(step.config))
+
+    async def _run_generative_ai(self, step: PlanStep, context: RunContext, progress: bool) -> AsyncGenerator[Dict[str, Any], None]:
+        yield self._success(step, context, await self._execute_generative_ai(step.config, context))
+
+    async def _run_formatter(self, step: PlanStep, context: RunContext, progress: bool) -> AsyncGenerator[Dict[str, Any], None]:
+        yield self._success(step, context, await self._execute_formatter(step.config, context))
+
+    async def _run_formatter_chain(self, step: PlanStep, context: RunContext, progress: bool) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        連続するフォーマッターをまとめて実行します。
+
+        途中のノードの結果は、context.record_intermediate または ノードの設定の record_result が
+        Trueの場合のみ返します。それ以外は空の結果と、まとめて実行した最後のノードID（fusedInto）を返します。
+        """
+        members = step.chain
+        record = [context.record_intermediate or bool(member.config.get("record_result")) for member in members[:-1]]
+        final_text, intermediates = await self.formatter_service.format_chain(
+            context.previous_text(),
+            [member.config for member in members],
+            record,
+            context.node_token
+        )
+
+        for member, intermediate in zip(members[:-1], intermediates):
+            if intermediate is not None:
+                yield self._success(member, context, intermediate)
+            else:
                 yield {
-                    "nodeId": node_id,
-                    "nodeType": node['node_type'],
+                    "nodeId": member.node_id,
+                    "nodeType": member.node_type,
+                    "status": "success",
+                    "result": "",
+                    "fusedInto": members[-1].node_id
+                }
+        yield self._success(members[-1], context, final_text)
+
+    async def _run_agent(self, step: PlanStep, context: RunContext, progress: bool) -> AsyncGenerator[Dict[str, Any], None]:
+        config = step.config
+        async for result in self.agent_service.execute_agent(
+            goal=config["goal"],
+            constraints=config.get("constraints", []),
+            capabilities=config.get("capabilities", {}),
+            behavior=config.get("behavior", {}),
+            context={"previous_text": context.previous_text()},
+            cancel_token=context.node_token,
+            emit_progress=progress
+        ):
+            if result["status"] == "success":
+                final_result = result["execution_log"][-1]["result"]
+                final_result_str = self._ensure_string_result(final_result)
+                context.outputs.put(step.node_id, final_result_str)
+                event = {
+                    "nodeId": step.node_id,
+                    "nodeType": step.node_type,
+                    "status": "success",
+                    "result": final_result_str
+                }
+                if progress:
+                    event["execution_log"] = [self._ensure_log_entry_string(log) for log in result["execution_log"]]
+                yield event
+            elif result["status"] in ["timeout", "max_iterations", "max_improvement_cycles"]:
+                error_msg = f"エージェントの実行が終了しました: {result['error']}"
+                yield {
+                    "nodeId": step.node_id,
+                    "nodeType": step.node_type,
                     "status": "error",
-                    "result": f"エラー: {str(e)}",
+                    "result": error_msg,
                     "execution_log": [{
-                        "step": "エラー",
-                        "result": str(e),
+                        "step": "agent_error",
+                        "result": error_msg,
                         "timestamp": datetime.now().isoformat()
                     }]
                 }
+            else:
+                current_result = result["execution_log"][-1]["result"] if result["execution_log"] else "処理中"
+                current_result_str = self._ensure_string_result(current_result)
+                yield {
+                    "nodeId": step.node_id,
+                    "nodeType": step.node_type,
+                    "status": result["status"],
+                    "result": current_result_str,
+                    "execution_log": [self._ensure_log_entry_string(log) for log in result["execution_log"]]
+                }
+
+    async def collect(self, nodes: List[dict], context: Optional[RunContext] = None) -> List[Dict[str, Any]]:
+        """
+        ワークフローを実行し、ノードごとの最終結果をまとめて返します。
+        途中経過が不要なAPI・バッチ向けの実行モードです。
+
+        Args:
+            nodes: 実行するノードのリスト
+            context: 実行ごとの状態
+
+        Returns:
+            実行順のノードごとの結果（nodeId, nodeType, status, result, elapsedMs）
+        """
+        results = []
+        started_at = time.perf_counter()
+        async for result in self.execute(nodes, context, progress=False):
+            finished_at = time.perf_counter()
+            result["elapsedMs"] = round((finished_at - started_at) * 1000, 3)
+            results.append(result)
+            started_at = finished_at
+        return results
 
     async def _execute_extract_text(self, config: Dict[str, Any]) -> str:
         """テキスト抽出ノードの実行"""
-        prompt = f"""
+        if "text_blob_id" in config:
+            # 文書のテキストはノードの設定とは別に保存されているため、実行時に読み込む
+            extracted_text = await asyncio.to_thread(self._load_document_text, config["text_blob_id"])
+        else:
+            extracted_text = config["extracted_text"]
+
+        return self.document_prompt(config["file_name"], extracted_text)
+
+    def document_prompt(self, file_name: str, extracted_text: str) -> str:
+        """テキスト抽出ノードの出力（後続のノードに渡すプロンプト）"""
+        return f"""
 こちらはユーザーがアップロードしたドキュメントです。
 回答の参考にしてください。
 
 ファイル名：
-{config["file_name"]}
+{file_name}
 ファイルの内容：
-{config["extracted_text"]}
+{extracted_text}
 """
-        return prompt
 
-    async def _execute_generative_ai(self, config: Dict[str, Any]) -> str:
+    def _load_document_text(self, blob_id: str) -> str:
+        db = SessionLocal()
+        try:
+            text = DocumentBlobRepository(db).get_text(blob_id)
+        finally:
+            db.close()
+        if text is None:
+            raise ValueError(f"文書のテキストが見つかりません: {blob_id}")
+        return text
+
+    async def _execute_generative_ai(self, config: Dict[str, Any], context: RunContext) -> str:
         """生成AIノードの実行"""
         # 過去のノードの結果を取得
-        previous_text = ""
-        if self.node_results:
-            last_node_id = list(self.node_results.keys())[-1]
-            previous_text = self.node_results[last_node_id].get("text", "")
+        previous_text = context.previous_text()
 
-        prompt = f"""
-こちらはユーザー入力した質問です。
-できるだけ簡潔に回答してください。
-
-過去のやり取り：
-{previous_text}
-
-質問：
-{config["prompt"]}
-"""
+        prompt = self.generative_ai_prompt(config["prompt"], previous_text)
         generated_text = await self.ai_service.generate_text(
             prompt=prompt,
             model=config["model"],
             temperature=config["temperature"],
-            max_tokens=config["max_tokens"]
+            max_tokens=config["max_tokens"],
+            cancel_token=context.node_token,
+            step="generative_ai"
         )
         return generated_text
 
-    async def _execute_formatter(self, config: Dict[str, Any]) -> str:
-        """フォーマッターノードの実行"""
-        previous_text = ""
-        if self.node_results:
-            last_node_id = list(self.node_results.keys())[-1]
-            previous_text = self.node_results[last_node_id].get("text", "")
-
-        formatted_text = await self.formatter_service.format_text(
-            previous_text,
-            config
-        )
-        return formatted_text
-
-    async def _execute_extract_text(self, config: Dict[str, Any]) -> str:
-        """テキスト抽出ノードの実行"""
-        prompt = f"""
-こちらはユーザーがアップロードしたドキュメントです。
-回答の参考にしてください。
-
-ファイル名：
-{config["file_name"]}
-ファイルの内容：
-{config["extracted_text"]}
-"""
-        return prompt
-
-    async def _execute_generative_ai(self, config: Dict[str, Any]) -> str:
-        """生成AIノードの実行"""
-        # 過去のノードの結果を取得
-        previous_text = ""
-        if self.node_results:
-            last_node_id = list(self.node_results.keys())[-1]
-            previous_text = self.node_results[last_node_id].get("text", "")
-
-        prompt = f"""
+    def generative_ai_prompt(self, question: str, previous_text: str) -> str:
+        """生成AIノードのプロンプト"""
+        return f"""
 こちらはユーザー入力した質問です。
 できるだけ簡潔に回答してください。
 
@@ -389,25 +468,15 @@ class WorkflowService:
 {previous_text}
 
 質問：
-{config["prompt"]}
+{question}
 """
-        generated_text = await self.ai_service.generate_text(
-            prompt=prompt,
-            model=config["model"],
-            temperature=config["temperature"],
-            max_tokens=config["max_tokens"]
-        )
-        return generated_text
 
-    async def _execute_formatter(self, config: Dict[str, Any]) -> str:
+    async def _execute_formatter(self, config: Dict[str, Any], context: RunContext) -> str:
         """フォーマッターノードの実行"""
-        previous_text = ""
-        if self.node_results:
-            last_node_id = list(self.node_results.keys())[-1]
-            previous_text = self.node_results[last_node_id].get("text", "")
+        previous_text = context.previous_text()
 
         formatted_text = await self.formatter_service.format_text(
             previous_text,
             config
         )
-        return formatted_text 
\ No newline at end of file
+        return formatted_text
@@ -0,0 +1,342 @@
+"""
+ワークフローのエクスポート・インポート（NDJSON）
+
+1行に1レコードのJSONを書き出します。ノードは直前のワークフローに属し、
+ノードが参照する文書のテキスト（document_blobs）はそのノードより前に書き出します。
+
+    {"type": "export", "version": 1, "exported_at": "..."}
+    {"type": "workflow", "id": "...", "name": "...", "created_at": "..."}
+    {"type": "document_blob", "id": "...", "size": 123, "data": "<zlibで圧縮したテキストのbase64>"}
+    {"type": "node", "id": "...", "workflow_id": "...", "node_type": "...", "config": {...}, "x": 0, "y": 0, ...}
+
+エッジはノードの設定（config.edge / config.edges）に含まれます。
+エクスポート・インポートともにページ・バッチ単位で処理するため、ファイルの大きさによらずメモリの使用量は一定です。
+
+環境変数:
+    TRANSFER_BATCH_ROWS: インポートで一度に挿入する行数・エクスポートで一度に読み込むワークフロー数（既定1000）
+"""
+import base64
+import codecs
+import hashlib
+import json
+import os
+import uuid
+import zlib
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from models import DocumentBlobDB, NodeDB, WorkflowDB
+from repositories.workflow_repository import WorkflowRepository
+
+TRANSFER_BATCH_ROWS = int(os.getenv("TRANSFER_BATCH_ROWS", "1000"))
+# インポートする1行の最大サイズ（文書のテキストの行を含む）
+TRANSFER_MAX_LINE_BYTES = 64 * 1024 * 1024
+# インポートで書き込みを待つ文書のテキストの最大サイズ
+TRANSFER_BATCH_BYTES = 16 * 1024 * 1024
+EXPORT_FORMAT_VERSION = 1
+# インポートした文書のテキストを検証するときに一度に展開するサイズ
+_DECOMPRESS_CHUNK_BYTES = 1024 * 1024
+
+_NODE_COLUMNS = (NodeDB.id, NodeDB.workflow_id, NodeDB.node_type, NodeDB.config, NodeDB.x, NodeDB.y,
+                 NodeDB.created_at, NodeDB.updated_at)
+
+
+class WorkflowImportError(Exception):
+    """インポートするファイルの内容が不正であることを表す例外"""
+
+    def __init__(self, line_no: int, message: str):
+        super().__init__(f"{line_no}行目: {message}")
+        self.line_no = line_no
+
+
+def _isoformat(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+def _parse_datetime(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+
+def _content_address(data: bytes) -> Tuple[str, int]:
+    """
+    zlibで圧縮したテキストを少しずつ展開し、テキストのSHA-256とサイズを返します（DocumentBlobRepository.put と同じID）。
+
+    Raises:
+        ValueError: zlibの形式またはUTF-8として不正な場合
+    """
+    decompressor = zlib.decompressobj()
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    digest = hashlib.sha256()
+    size = 0
+    chunk = data
+    try:
+        while chunk:
+            text = decompressor.decompress(chunk, _DECOMPRESS_CHUNK_BYTES)
+            digest.update(text)
+            decoder.decode(text)
+            size += len(text)
+            chunk = decompressor.unconsumed_tail
+        rest = decompressor.flush()
+        digest.update(rest)
+        decoder.decode(rest, final=True)
+        size += len(rest)
+    except zlib.error as e:
+        raise ValueError(f"文書のテキストを展開できません: {e}")
+    except UnicodeDecodeError:
+        raise ValueError("文書のテキストがUTF-8ではありません")
+    if not decompressor.eof:
+        raise ValueError("文書のテキストのデータが途中で終わっています")
+    return digest.hexdigest(), size
+
+
+def _line(record: Dict[str, Any]) -> str:
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+
+async def iter_lines(chunks: AsyncIterator[bytes], max_line_bytes: int = TRANSFER_MAX_LINE_BYTES) -> AsyncIterator[bytes]:
+    """
+    バイト列のストリームを行に分割します。保持するのは未完成の1行のみです。
+
+    Raises:
+        WorkflowImportError: 1行が max_line_bytes を超えた場合
+    """
+    buffer = bytearray()
+    line_no = 0
+    async for chunk in chunks:
+        search_from = len(buffer)
+        buffer += chunk
+        start = 0
+        while (end := buffer.find(b"\n", search_from)) != -1:
+            line_no += 1
+            yield bytes(buffer[start:end])
+            start = search_from = end + 1
+        del buffer[:start]
+        if len(buffer) > max_line_bytes:
+            raise WorkflowImportError(line_no + 1, "行が長すぎます")
+    if buffer:
+        yield bytes(buffer)
+
+
+class WorkflowExporter:
+    """
+    ワークフローをNDJSONとして書き出します。
+
+    Args:
+        db: データベースセッション（書き出しが終わるまで使用する）
+        batch_rows: 一度に読み込むワークフロー数
+    """
+
+    def __init__(self, db: Session, batch_rows: int = TRANSFER_BATCH_ROWS):
+        self.db = db
+        self.batch_rows = batch_rows
+
+    def iter_ndjson(self, workflow_ids: Optional[Sequence[str]] = None) -> Iterator[str]:
+        """
+        ワークフローを作成日時順に書き出します。ワークフロー batch_rows 件ごとに1つの文字列を返します。
+
+        Args:
+            workflow_ids: 書き出すワークフローのID（省略時はすべて）
+
+        Yields:
+            NDJSONの行のまとまり
+        """
+        yield _line({"type": "export", "version": EXPORT_FORMAT_VERSION, "exported_at": datetime.utcnow().isoformat()})
+
+        exported_blobs = set()
+        repo = WorkflowRepository(self.db)
+        after = None
+        while True:
+            if workflow_ids is not None:
+                ids = list(workflow_ids)
+                workflows = [
+                    tuple(row) for row in self.db.execute(
+                        select(WorkflowDB.id, WorkflowDB.name, WorkflowDB.created_at)
+                        .where(WorkflowDB.id.in_(ids))
+                        .order_by(WorkflowDB.created_at, WorkflowDB.id)
+                    )
+                ] if after is None else []
+            else:
+                workflows = repo.list_workflows(self.batch_rows, after=after, descending=False)
+            if not workflows:
+                return
+
+            nodes_by_workflow: Dict[str, List[Any]] = {}
+            for node in self.db.execute(
+                select(*_NODE_COLUMNS)
+                .where(NodeDB.workflow_id.in_([wf_id for wf_id, _, _ in workflows]))
+                .order_by(NodeDB.workflow_id, NodeDB.created_at, NodeDB.id)
+            ):
+                nodes_by_workflow.setdefault(node.workflow_id, []).append(node)
+
+            lines = []
+            for wf_id, name, created_at in workflows:
+                lines.append(_line({"type": "workflow", "id": wf_id, "name": name, "created_at": _isoformat(created_at)}))
+                for node in nodes_by_workflow.get(wf_id, []):
+                    blob_id = node.config.get("text_blob_id") if isinstance(node.config, dict) else None
+                    if blob_id and blob_id not in exported_blobs:
+                        blob = self.db.get(DocumentBlobDB, blob_id)
+                        if blob:
+                            lines.append(_line({
+                                "type": "document_blob", "id": blob.id, "size": blob.size,
+                                "data": base64.b64encode(blob.data).decode("ascii"),
+                            }))
+                            self.db.expunge(blob)
+                        exported_blobs.add(blob_id)
+                    lines.append(_line({
+                        "type": "node", "id": node.id, "workflow_id": node.workflow_id, "node_type": node.node_type,
+                        "config": node.config, "x": node.x, "y": node.y,
+                        "created_at": _isoformat(node.created_at), "updated_at": _isoformat(node.updated_at),
+                    }))
+            yield "".join(lines)
+
+            last_id, _, last_created_at = workflows[-1]
+            after = (last_created_at, last_id)
+
+
+class WorkflowImporter:
+    """
+    NDJSONのワークフローを1つのトランザクションでインポートします。
+
+    行は add_line で渡し、pending_rows が batch_rows に達したら flush で複数行のINSERTとして書き込みます。
+    commit するまでは他のセッションから見えず、エラーの場合はすべて取り消されます。
+
+    Args:
+        engine: データベースエンジン
+        keep_ids: エクスポート元のIDを使うかどうか（既定は新しいIDを割り当てる）
+        batch_rows: 一度に挿入する行数
+    """
+
+    def __init__(self, engine: Engine, keep_ids: bool = False, batch_rows: int = TRANSFER_BATCH_ROWS):
+        self.keep_ids = keep_ids
+        self.batch_rows = batch_rows
+        self.conn = engine.connect()
+        self.transaction = self.conn.begin()
+        self.line_no = 0
+        self.counts = {"workflows": 0, "nodes": 0, "document_blobs": 0}
+        self._workflows: List[Dict[str, Any]] = []
+        self._nodes: List[Dict[str, Any]] = []
+        self._blobs: Dict[str, Dict[str, Any]] = {}
+        self._blob_bytes = 0
+        # 直前のワークフローのエクスポート元のIDとインポート先のID（ノードはこのワークフローに属する）
+        self._current_source_id: Optional[str] = None
+        self._current_id: Optional[str] = None
+
+    @property
+    def pending_rows(self) -> int:
+        return len(self._workflows) + len(self._nodes) + len(self._blobs)
+
+    @property
+    def should_flush(self) -> bool:
+        """書き込みを待っている行が batch_rows に達したか（文書のテキストは TRANSFER_BATCH_BYTES に達したか）"""
+        return self.pending_rows >= self.batch_rows or self._blob_bytes >= TRANSFER_BATCH_BYTES
+
+    def add_line(self, line: bytes) -> None:
+        """
+        NDJSONの1行を追加します。
+
+        Raises:
+            WorkflowImportError: 行の内容が不正な場合
+        """
+        self.line_no += 1
+        if not line.strip():
+            return
+        try:
+            record = json.loads(line)
+            record_type = record["type"]
+            if record_type == "workflow":
+                self._add_workflow(record)
+            elif record_type == "node":
+                self._add_node(record)
+            elif record_type == "document_blob":
+                self._add_document_blob(record)
+            elif record_type == "export":
+                if record.get("version", EXPORT_FORMAT_VERSION) > EXPORT_FORMAT_VERSION:
+                    raise ValueError(f"未対応のバージョンです: {record['version']}")
+            else:
+                raise ValueError(f"未知のレコードです: {record_type}")
+        except KeyError as e:
+            raise WorkflowImportError(self.line_no, f"必須の項目がありません: {e}")
+        except (ValueError, TypeError) as e:
+            raise WorkflowImportError(self.line_no, str(e))
+
+    def _add_workflow(self, record: Dict[str, Any]) -> None:
+        self._current_source_id = record["id"]
+        self._current_id = record["id"] if self.keep_ids else str(uuid.uuid4())
+        self._workflows.append({
+            "id": self._current_id,
+            "name": record["name"],
+            "created_at": _parse_datetime(record.get("created_at")) or datetime.utcnow(),
+        })
+
+    def _add_node(self, record: Dict[str, Any]) -> None:
+        if self._current_id is None or record.get("workflow_id", self._current_source_id) != self._current_source_id:
+            raise ValueError("ノードの前に、ノードが属するワークフローの行が必要です")
+        now = datetime.utcnow()
+        self._nodes.append({
+            "id": record["id"] if self.keep_ids else str(uuid.uuid4()),
+            "workflow_id": self._current_id,
+            "node_type": record["node_type"],
+            "config": record["config"],
+            "x": record.get("x", 0),
+            "y": record.get("y", 0),
+            "created_at": _parse_datetime(record.get("created_at")) or now,
+            "updated_at": _parse_datetime(record.get("updated_at")) or now,
+        })
+
+    def _add_document_blob(self, record: Dict[str, Any]) -> None:
+        data = base64.b64decode(record["data"])
+        # IDは内容のアドレスのため、ファイルの id・size は信用せずに展開して検証する
+        # （異なる内容が保存されると、以降に同じ内容をアップロードした文書がそれを参照してしまう）
+        blob_id, size = _content_address(data)
+        if blob_id != record["id"] or size != record["size"]:
+            raise ValueError(f"文書のテキストの内容がIDと一致しません: {record['id']}")
+        self._blobs[record["id"]] = {
+            "id": record["id"],
+            "size": record["size"],
+            "data": data,
+            "created_at": datetime.utcnow(),
+        }
+        self._blob_bytes += len(data)
+
+    def flush(self) -> None:
+        """追加済みの行を複数行のINSERTで書き込みます（文書のテキスト、ワークフロー、ノードの順）。"""
+        if self._blobs:
+            # 内容のハッシュがIDのため（追加時に検証済み）、同じIDが保存済みの場合は同じ内容
+            existing = set(self.conn.scalars(
+                select(DocumentBlobDB.id).where(DocumentBlobDB.id.in_(list(self._blobs)))
+            ))
+            blobs = [blob for blob_id, blob in self._blobs.items() if blob_id not in existing]
+            if blobs:
+                self.conn.execute(DocumentBlobDB.__table__.insert(), blobs)
+                self.counts["document_blobs"] += len(blobs)
+            self._blobs = {}
+            self._blob_bytes = 0
+        if self._workflows:
+            self.conn.execute(WorkflowDB.__table__.insert(), self._workflows)
+            self.counts["workflows"] += len(self._workflows)
+            self._workflows = []
+        if self._nodes:
+            self.conn.execute(NodeDB.__table__.insert(), self._nodes)
+            self.counts["nodes"] += len(self._nodes)
+            self._nodes = []
+
+    def commit(self) -> Dict[str, int]:
+        """
+        残りの行を書き込んでコミットします。
+
+        Returns:
+            インポートしたワークフロー・ノード・文書のテキストの数
+        """
+        self.flush()
+        self.transaction.commit()
+        return dict(self.counts)
+
+    def close(self) -> None:
+        """接続を閉じます。コミットしていない場合はロールバックします。"""
+        if self.transaction.is_active:
+            self.transaction.rollback()
+        self.conn.close()
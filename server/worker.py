@@ -0,0 +1,51 @@
+"""
+ワークフロー実行ワーカー
+
+APIプロセスとは別に起動し、DBのキューに登録された実行を処理します。
+複数プロセスを起動すると、実行は `FOR UPDATE SKIP LOCKED` で重複なく分配されます。
+
+    python worker.py --concurrency 4
+"""
+import argparse
+import asyncio
+import logging
+import os
+import signal
+
+from database import engine, Base, SessionLocal, upgrade_schema
+from services.checkpoints import prune_checkpoints
+from services.executors import executors
+from services.run_worker import RunWorker
+from services.structured_logging import configure_logging
+from services.workflow_service import WorkflowService
+
+DEBUG_MODE = os.getenv("DEBUG_MODE", "false").lower() == "true"
+
+configure_logging(debug=DEBUG_MODE)
+
+def main():
+    parser = argparse.ArgumentParser(description="Workflow run worker")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("WORKER_CONCURRENCY", "4")),
+                        help="このプロセスで同時に実行する実行数")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    upgrade_schema()
+    prune_checkpoints(SessionLocal, force=True)
+
+    worker = RunWorker(WorkflowService(debug=DEBUG_MODE))
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, worker.stop)
+        await worker.run_forever(concurrency=args.concurrency)
+
+    try:
+        asyncio.run(run())
+    finally:
+        # 実行バックエンドのプロセスプールが残らないように終了する
+        executors.shutdown()
+
+if __name__ == "__main__":
+    main()